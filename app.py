@@ -2,20 +2,24 @@
 """
 System
 """
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, render_template, request, jsonify, make_response, Response, stream_with_context
 import sqlite3
 import logging
+import json
+import os
+import select
+import socket
 
 """
 Token budget
 """
-from services.llm_config import GlobalVars
+from services.llm_config import GlobalVars, Config
 from services.llm_config_helper import get_n_ctx, get_recent, get_mid, get_long
 from services.DB_token_budget import write_budget, check_sanity
 """
 Prompt Assembly (Initial DB and UserInput)
 """
-from services.DB_access_pipeline import write_connection, connect
+from services.DB_access_pipeline import write_connection, connect, ensure_columns
 from services.prompts_story_parameters import update_writing_style, update_world_setting, update_rules, update_player, update_characters
 from services.prompts_system import write_system_prompts
 from services.prompts_story_parameters import write_story_prompts
@@ -28,18 +32,30 @@ from services.DB_difficulty import write_difficulty, update_difficulty, get_diff
 Buttons (Continue = continue_story & player_action, ...)
 """
 from services.DB_persist_user_edit import persist_user_edit
-from services.DB_get_helpers import get_last_outcome, clean_outcome
-from services.story_new import generate_story_new
-from services.story_continue import generate_story_continue
-from services.DB_player_action_to_paragraph import player_action_to_paragraph
-from services.story_player_action import generate_player_action
+from services.DB_get_helpers import get_last_outcome, format_outcome
+from services.story_new import generate_story_new, generate_story_new_stream
+from services.story_continue import generate_story_continue, generate_story_continue_stream
+from services.story_continue_prefetch import start_prefetch_worker
+from services.DB_player_action_to_paragraph import player_action_to_paragraph, remove_player_action
+from services.story_player_action import generate_player_action, generate_player_action_stream
 from services.story_player_action_eval import evaluate_player_action
+from services.story_regenerate import regenerate_last
 #from services.story_force import handle_forced_prompted_action
 """
 Memories&Summaries
 """
-from services.summarize_pipeline import summarize
+from services.summarize_jobs import enqueue_summarize, start_summarize_worker, summarize_status
 from services.DB_summarize_publish import publish_long_memory, publish_mid_memory
+"""
+Inference
+"""
+from services.llm_inference import load_models
+from services.llm_cancel import Cancelled, cancellable, cancel_job, start_job, finish_job
+from services.llm_supervisor import InferenceError, BREAKER
+from services.DB_token_cost import verify_tokenizer
+from services.DB_token_cache import token_cache_stats
+from services.DB_response_cache import response_cache_stats
+from services.DB_llm_calls import llm_call_stats
 
 # app.py
 app = Flask(__name__)
@@ -49,6 +65,13 @@ def init_db():
     with write_connection() as conn:
         with open(SCHEMA_SQL, 'r') as f:
             conn.executescript(f.read())
+        # columns added after the first release
+        ensure_columns(conn, "story_paragraphs", {
+            "outcome_judgement": "TEXT",
+            "outcome_effect": "TEXT",
+            "outcome_stat_update": "TEXT",
+            "outcome_reasoning": "TEXT",
+        })
 
 # This sends all INFO+ logs (from all modules) to stdout
 logging.basicConfig(
@@ -126,7 +149,8 @@ def initial_state():
       },
       "difficulty": {
           "diff_setting": get_difficulty(),
-      }
+      },
+      "streaming": Config.STREAMING
     })
 
 """
@@ -140,7 +164,8 @@ def story_history():
         cur  = conn.cursor()
 
         cur.execute("""
-          SELECT id, content, story_id, outcome
+          SELECT id, content, story_id, outcome,
+                 outcome_judgement, outcome_effect, outcome_stat_update, outcome_reasoning
             FROM story_paragraphs
         ORDER BY id
         """)
@@ -152,12 +177,66 @@ def story_history():
       { "id":    row["id"],
         "content": row["content"],
         "story_id": row["story_id"],
-        "outcome": clean_outcome(row["outcome"])
+        "outcome": format_outcome(row)
         }
       for row in rows
     ]
     return jsonify({ "paragraphs": paragraphs })
 
+"""
+Cancellation:
+Story requests run as llm_cancel job "story" (a newer one supersedes it), the summarize worker as "summarize".
+A request whose client went away is cancelled too (_disconnect_probe).
+"""
+def _disconnect_probe():
+    """
+    Probe for CancelToken: True once the client closed the connection (readable socket, nothing to read).
+    """
+    sock = request.environ.get("werkzeug.socket")
+    if sock is None:
+        return None
+    def gone() -> bool:
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError):
+            return True
+    return gone
+
+@app.errorhandler(Cancelled)
+def handle_cancelled(e):
+    return jsonify(message='cancelled', reason=str(e)), 409
+
+# Generation failed for good (llm_supervisor): timeouts, backend errors, open circuit breaker (503)
+@app.errorhandler(InferenceError)
+def handle_inference_error(e):
+    response = jsonify(e.to_dict())
+    response.status_code = e.status
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(int(e.retry_after + 0.5))
+    return response
+
+@app.route('/api/health')
+def api_health():
+    breaker = BREAKER.status()
+    cache = response_cache_stats() if Config.RESPONSE_CACHE else None
+    return jsonify(backend=Config.BACKEND, circuit_breaker=breaker, response_cache=cache,
+                   token_cache=token_cache_stats()), (503 if breaker['open'] else 200)
+
+# Inference telemetry per persona (DB_llm_calls): ?since=<unix time> and ?persona=<name> narrow it down
+@app.route('/api/metrics')
+def api_metrics():
+    since = request.args.get('since')
+    try:
+        since = float(since) if since else None
+    except ValueError:
+        return jsonify(message='insane_request'), 400
+    return jsonify(llm_call_stats(since, request.args.get('persona')))
+
+@app.route('/api/cancel/<job>', methods=['POST'])
+def api_cancel(job):
+    return jsonify(cancelled=cancel_job(job))
+
 """
 Evaluation pipeline:
 """
@@ -169,10 +248,14 @@ def api_eval():
     player_action = data.get('action', '')
     action = {}
     if player_action: action = player_action_to_paragraph(player_action)  # returns {'id': row[0], 'content': row[1], 'story_id': row[2]}
-    evaluate_player_action()  # evaluation/outcome of that action, writes directly into db
-    outcome = get_last_outcome() # returns {"outcome": row[0]}
-    # clean the outcome string
-    outcome["outcome"] = clean_outcome(outcome.get("outcome"))
+    with cancellable("story", _disconnect_probe()) as cancel:
+        try:
+            evaluate_player_action(cancel)  # evaluation/outcome of that action, writes directly into db
+        except (Cancelled, InferenceError):
+            # the action row without its outcome would confuse the writers
+            if action: remove_player_action(action['id'])
+            raise
+    outcome = get_last_outcome() # returns {"outcome": display text}
     action_with_outcome = {**action, **outcome}
     return jsonify({
         'action': action_with_outcome
@@ -184,7 +267,8 @@ Generation pipelines:
 # New is, when the Continue button is pressed and there is no story.
 @app.route('/api/new', methods=['POST'])
 def api_new():
-    new_paragraph = generate_story_new()
+    with cancellable("story", _disconnect_probe()) as cancel:
+        new_paragraph = generate_story_new(cancel)
     return jsonify({
         'story': new_paragraph,
         'mid_memory': publish_mid_memory(),
@@ -197,7 +281,8 @@ def api_continue():
     data = request.get_json() or {}
     update_db = data.get('candidate')
     if update_db: persist_user_edit(update_db)
-    new_paragraph = generate_story_continue()
+    with cancellable("story", _disconnect_probe()) as cancel:
+        new_paragraph = generate_story_continue(cancel)
     return jsonify({
         'story': new_paragraph,
         'mid_memory': publish_mid_memory(),
@@ -209,7 +294,8 @@ def api_continue():
 # we call the eval pipeline first, take a turn through the front-end and come here.
 @app.route('/api/player_action', methods=['POST'])
 def api_player_action():
-    new_paragraph = generate_player_action() # returns {"id": paragraph_id, "content": generated, "story_id": "continue_without_UserAction"}
+    with cancellable("story", _disconnect_probe()) as cancel:
+        new_paragraph = generate_player_action(cancel) # returns {"id": paragraph_id, "content": generated, "story_id": "continue_without_UserAction"}
     mid_html = publish_mid_memory()
     long_html = publish_long_memory()
     return jsonify({
@@ -218,14 +304,106 @@ def api_player_action():
         'long_memory': long_html
     })
 
+# Regenerate is, when Re-Do is pressed on the paragraph that was just generated.
+# Resamples it from the prompts it was generated from; "alternatives" holds all n versions, the first one is persisted.
+@app.route('/api/regenerate', methods=['POST'])
+def api_regenerate():
+    data = request.get_json() or {}
+    paragraph_id = data.get('paragraph_id')
+    n = data.get('n', 1)
+    try:
+        paragraph_id = int(paragraph_id) if paragraph_id is not None else None
+        n = int(n)
+    except (TypeError, ValueError):
+        return jsonify(message='insane_request'), 400
+    with cancellable("story", _disconnect_probe()) as cancel:
+        regenerated = regenerate_last(paragraph_id, n, cancel)
+    if regenerated is None:
+        # not the paragraph the last generation wrote: the client replays the turn instead
+        return jsonify(message='nothing_to_regenerate'), 409
+    return jsonify({
+        **regenerated,
+        'mid_memory': publish_mid_memory(),
+        'long_memory': publish_long_memory()
+    })
+
+"""
+Streaming generation pipelines (Server-Sent Events):
+Same as above, but the paragraph is pushed sentence by sentence while it decodes.
+    event: token  data: {"text": "..."}                                       (0..n times)
+    event: done   data: {"story": {id, content, story_id}, "mid_memory", "long_memory"}
+    event: error  data: {"message": "..."}
+"done" carries the persisted paragraph, its content replaces what was streamed.
+A client that disconnects closes the stream, which stops the decode (nothing is persisted before "done").
+"""
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_paragraph(events, cancel):
+    def run():
+        try:
+            for kind, payload in events:
+                if kind == "token":
+                    yield _sse_event("token", {"text": payload})
+                elif kind == "done":
+                    yield _sse_event("done", {
+                        "story": payload,
+                        "mid_memory": publish_mid_memory(),
+                        "long_memory": publish_long_memory()
+                    })
+        except Cancelled as e:
+            yield _sse_event("error", {"message": f"cancelled: {e}"})
+        except InferenceError as e:
+            logging.error("streaming generation failed: %s", e)
+            yield _sse_event("error", {"message": str(e), **e.to_dict()})
+        except GeneratorExit:
+            cancel.cancel("client disconnected")
+            raise
+        except Exception as e:
+            logging.exception("streaming generation failed")
+            yield _sse_event("error", {"message": str(e)})
+        finally:
+            events.close()
+            finish_job(cancel)
+
+    return Response(
+        stream_with_context(run()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/new/stream', methods=['POST'])
+def api_new_stream():
+    cancel = start_job("story", _disconnect_probe())
+    return _stream_paragraph(generate_story_new_stream(cancel), cancel)
+
+@app.route('/api/continue/stream', methods=['POST'])
+def api_continue_stream():
+    data = request.get_json() or {}
+    update_db = data.get('candidate')
+    if update_db: persist_user_edit(update_db)
+    cancel = start_job("story", _disconnect_probe())
+    return _stream_paragraph(generate_story_continue_stream(cancel), cancel)
+
+@app.route('/api/player_action/stream', methods=['POST'])
+def api_player_action_stream():
+    cancel = start_job("story", _disconnect_probe())
+    return _stream_paragraph(generate_player_action_stream(cancel), cancel)
+
 """
 Memory pipeline:
 """
 # Summarize is run after the newest generation has been published.
+# It only queues the due steps (summarize_jobs), the worker thread does the work.
 @app.route('/api/summarize', methods=['POST'])
 def api_summarize():
-    summarize()
-    return "backend_done"
+    start_summarize_worker()
+    added = enqueue_summarize()
+    return f"queued {added}"
+
+@app.route('/api/summarize/status')
+def api_summarize_status():
+    return jsonify(summarize_status())
 
 """
 Budget:
@@ -269,9 +447,20 @@ if __name__ == '__main__':
     write_initial_budget()
     write_difficulty()
     write_action_eval_bucket()
-    # You can remove debug=True or set it to False. True will restart the app when the code changes (but not write to DB).
-    # app.run(debug=True, port=5000, host='0.0.0.0', threaded=True) makes the app accessible from the local network: remove to limit to local machine only.
-    # app.run(debug=True, port=5000, threaded=True) removes local network access.
+    logging.info("token count cache after startup: %s", token_cache_stats())
+    # You can set debug to False. True will restart the app when the code changes (but not write to DB).
+    debug = True
+    # Load the models once and keep them resident. With debug=True the reloader runs this block twice,
+    # only the serving child (WERKZEUG_RUN_MAIN) should hold the weights; without the reloader there is one process.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        load_models()
+        verify_tokenizer()
+        # picks up summarize jobs an earlier run left unfinished
+        start_summarize_worker()
+        # opt-in, Config.PREFETCH_CONTINUE
+        start_prefetch_worker()
+    # app.run(debug=debug, port=5000, host='0.0.0.0', threaded=True) makes the app accessible from the local network: remove to limit to local machine only.
+    # app.run(debug=debug, port=5000, threaded=True) removes local network access.
     # Change port if you need to.
     # Don't think we actually need threaded=True
-    app.run(debug=True, port=5000, threaded=True)
\ No newline at end of file
+    app.run(debug=debug, port=5000, threaded=True)
\ No newline at end of file
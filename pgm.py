@@ -0,0 +1,44 @@
+# pgm.py
+
+"""
+Command line tools. The game itself runs with python app.py.
+    python pgm.py bench-model            measure n_threads / n_gpu_layers / batch size for the configured models
+                                         and write this host's profile (host_profiles/<hostname>.json)
+    python pgm.py bench-model --full     the whole matrix instead of one parameter at a time (slow)
+Candidates can be given, e.g. --threads 8,12,16 --gpu-layers 0,20,41 --batch-sizes 256,512
+"""
+
+import argparse
+import logging
+import sys
+
+def _int_list(value: str):
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma separated numbers, got {value!r}")
+
+def bench_model(args) -> int:
+    from services.llm_bench import bench_models
+    profile = bench_models(full=args.full, threads=args.threads, gpu_layers=args.gpu_layers,
+                           batch_sizes=args.batch_sizes, write=not args.dry_run)
+    return 0 if profile["models"] else 1
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="pgm", description="Pocket GameMaster tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench = commands.add_parser("bench-model", help="autotune model loading for this host")
+    bench.add_argument("--full", action="store_true", help="measure every combination")
+    bench.add_argument("--threads", type=_int_list, help="n_threads candidates, e.g. 8,12,16")
+    bench.add_argument("--gpu-layers", type=_int_list, help="n_gpu_layers candidates, e.g. 0,20,41")
+    bench.add_argument("--batch-sizes", type=_int_list, help="n_batch candidates, e.g. 256,512,1024")
+    bench.add_argument("--dry-run", action="store_true", help="measure and print, don't write the profile")
+    bench.set_defaults(run=bench_model)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    return args.run(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -91,5 +91,25 @@ CREATE TABLE IF NOT EXISTS story_paragraphs (
   tags_recent         TEXT,                                -- json - tags from last n paragraphs for tag comparison
   outcome             TEXT,                                -- Outcome of a player action
   outcome_token_cost  TEXT,                                -- Outcome token cost
+  outcome_judgement   TEXT,                                -- parsed Outcome fields (see prompts_eval_action.parse_outcome)
+  outcome_effect      TEXT,
+  outcome_stat_update TEXT,
+  outcome_reasoning   TEXT,
   created_at          TEXT    DEFAULT (strftime('%Y-%m-%dT%H:%M:%f','now','localtime')) -- timestamp of insertion
-);
\ No newline at end of file
+);
+
+-- Durable queue for the summarize pipeline (services/summarize_jobs.py)
+CREATE TABLE IF NOT EXISTS summarize_jobs (
+  id          INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind        TEXT    NOT NULL,                            -- summarize_from_action, summarize_mid, tag_long, tag_recent
+  args        TEXT    NOT NULL DEFAULT '{}',               -- json
+  dedupe_key  TEXT    NOT NULL,                            -- e.g. 'tag_long:42' - enqueued once, again a while after it failed for good
+  status      TEXT    NOT NULL DEFAULT 'pending',          -- pending, running, done, failed, cancelled
+  attempts    INTEGER NOT NULL DEFAULT 0,
+  not_before  REAL    NOT NULL DEFAULT 0,                  -- unix time, retry backoff
+  last_error  TEXT,
+  created_at  TEXT    DEFAULT (strftime('%Y-%m-%dT%H:%M:%f','now','localtime')),
+  updated_at  TEXT    DEFAULT (strftime('%Y-%m-%dT%H:%M:%f','now','localtime'))
+);
+CREATE INDEX IF NOT EXISTS idx_summarize_jobs_status ON summarize_jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_summarize_jobs_dedupe ON summarize_jobs (dedupe_key);
@@ -0,0 +1,39 @@
+-- schema_cache.sql
+-- Cache DB (pgm_cache.db): everything in here can be recomputed, delete the file any time.
+
+-- Token counts keyed by tokenizer and text
+CREATE TABLE IF NOT EXISTS token_counts (
+  tokenizer_hash      TEXT    NOT NULL,                    -- model fingerprint of the tokenizer (llm_registry)
+  text_hash           TEXT    NOT NULL,                    -- sha256 of the utf-8 text
+  token_count         INTEGER NOT NULL,                    -- number of tokens (add_bos=False)
+  PRIMARY KEY (tokenizer_hash, text_hash)
+) WITHOUT ROWID;
+
+-- Raw outputs of the cacheable personas (services/DB_response_cache.py), evicted least recently used first
+CREATE TABLE IF NOT EXISTS llm_responses (
+  key                 TEXT    PRIMARY KEY,                 -- sha256 over model, persona, sampling, seed and both prompts
+  persona             TEXT    NOT NULL,
+  response            TEXT    NOT NULL,                    -- what the backend returned, before generation_cleaner
+  bytes               INTEGER NOT NULL,                    -- utf-8 size of response, counted against RESPONSE_CACHE_MAX_BYTES
+  created_at          REAL    NOT NULL,                    -- unix time
+  last_used           REAL    NOT NULL                     -- unix time, LRU order
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses (last_used);
+
+-- One row per finished generation (services/DB_llm_calls.py): capacity planning, /api/metrics.
+-- Times in ms as the backend reports them (llama.cpp perf counters, llama-cli timing lines, llama-server timings).
+CREATE TABLE IF NOT EXISTS llm_calls (
+  id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+  created_at          REAL    NOT NULL,                    -- unix time the call finished
+  persona             TEXT    NOT NULL,
+  backend             TEXT    NOT NULL,                    -- Config.BACKEND
+  prompt_tokens       INTEGER,                             -- prompt incl. chat template
+  cached_tokens       INTEGER,                             -- prompt tokens not evaluated: KV reuse, session, prefix, server cache
+  generated_tokens    INTEGER,
+  load_ms             REAL,                                -- model load this call waited for
+  prompt_ms           REAL,                                -- prompt evaluation
+  decode_ms           REAL,                                -- token generation
+  total_ms            REAL,                                -- the backend call end to end
+  cache               TEXT                                 -- what served it: response, session, prefix; NULL = none
+);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at);
@@ -11,6 +11,15 @@ DB_PATH = "pgm_memory.db"
 SCHEMA = BASE / "schema.sql"
 #DB_PATH = GlobalVars.DB
 _write_lock = threading.Lock()
+# bumped by every write_connection() that committed changes, see write_version()
+_write_version = 0
+
+# Derived/rebuildable data (token counts, ...) lives in its own file:
+# it is written from inside write_connection() blocks and must never wait on _write_lock.
+CACHE_DB_PATH = "pgm_cache.db"
+CACHE_SCHEMA = BASE / "schema_cache.sql"
+_cache_init_lock = threading.Lock()
+_cache_ready = False
 
 def connect(readonly=False):
     uri = f"file:{DB_PATH}?mode=rw"
@@ -21,7 +30,12 @@ def connect(readonly=False):
     return conn
 
 @contextmanager
-def write_connection(timeout=15):
+def write_connection(timeout=15, versioned=True):
+    """
+    versioned=False for bookkeeping that doesn't change what the story prompts are built from
+    (job queue status): it leaves write_version() alone.
+    """
+    global _write_version
     acquired = _write_lock.acquire(timeout=timeout)
     if not acquired:
         raise TimeoutError("Could not acquire DB write lock within timeout")
@@ -30,11 +44,37 @@ def write_connection(timeout=15):
         try:
             yield conn
             conn.commit()
+            if versioned and conn.total_changes:
+                _write_version += 1
         finally:
             conn.close()
     finally:
         _write_lock.release()
 
+def write_version() -> int:
+    """
+    Counter of committed story writes in this process. Anything generated against version N
+    (story_continue_prefetch) is stale as soon as it moved on.
+    """
+    return _write_version
+
+def connect_cache():
+    """
+    Connection to the cache DB, creating its tables on first use.
+    Losing this file only costs recomputation, so we trade durability for speed.
+    """
+    global _cache_ready
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    if not _cache_ready:
+        with _cache_init_lock:
+            if not _cache_ready:
+                with open(CACHE_SCHEMA, 'r') as f:
+                    conn.executescript(f.read())
+                _cache_ready = True
+    return conn
+
 """
 Examples
 with write_connection() as conn:
@@ -54,3 +94,13 @@ conn = connect(readonly=True)
         conn.close()
 
 """
+
+def ensure_columns(conn, table: str, columns: dict):
+    """
+    Add columns that schema.sql gained after `table` was created (CREATE TABLE IF NOT EXISTS
+    leaves existing tables alone). columns: name -> type/constraint as in schema.sql.
+    """
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
@@ -1,6 +1,7 @@
 # services.DB_get_helpers.py
 
 import re
+import sqlite3
 
 from services.DB_access_pipeline import connect
 
@@ -32,14 +33,15 @@ def get_last_action():
 
 def get_last_outcome():
     """
-    Returns the most recent outcome row as a dict with keys: outcome.
+    Returns the most recent outcome as a dict with keys: outcome (display text, see format_outcome).
     If no rows exist, returns None.
     """
     conn = connect(readonly=True)
     try:
+        conn.row_factory = sqlite3.Row
         cur = conn.cursor()
         cur.execute("""
-            SELECT outcome
+            SELECT outcome, outcome_judgement, outcome_effect, outcome_stat_update, outcome_reasoning
               FROM story_paragraphs
              ORDER BY id DESC
              LIMIT 1
@@ -47,11 +49,25 @@ def get_last_outcome():
         row = cur.fetchone()
         if row is None:
             return None
-        # row is a tuple (outcome)
-        return {"outcome": row[0]}
+        return {"outcome": format_outcome(row)}
     finally:
         conn.close()
 
+def format_outcome(row) -> str | None:
+    """
+    Display text for a story_paragraphs row's outcome, from the structured columns.
+    Rows written before those existed (or unparseable outcomes) fall back to clean_outcome.
+    """
+    if row["outcome_judgement"]:
+        fields = [
+            ("Judgement", row["outcome_judgement"]),
+            ("Effect", row["outcome_effect"]),
+            ("Stat Update", row["outcome_stat_update"]),
+            ("Reasoning", row["outcome_reasoning"]),
+        ]
+        return "\n".join(f"{label}: {value}" for label, value in fields if value)
+    return clean_outcome(row["outcome"])
+
 def clean_outcome(val: str | None) -> str | None:
     if not val:
         return None
@@ -0,0 +1,124 @@
+# services.DB_llm_calls.py
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from services.llm_config import Config
+from services.DB_access_pipeline import connect_cache
+
+"""
+Inference telemetry: one row per finished generation in the llm_calls table of the cache DB.
+The backends report what llama.cpp measured for the call (llm_backends) - in-process perf counters,
+the timing lines llama-cli prints to stderr, the timings llama-server sends with its last chunk -
+and llm_inference reports the calls the response cache answered.
+/api/metrics shows per-persona percentiles (llm_call_stats). Opt-out: Config.LLM_CALLS_LOG.
+The table keeps the newest Config.LLM_CALLS_MAX_ROWS rows.
+A failed write is logged and dropped: telemetry never fails a generation.
+"""
+
+COLUMNS = ("prompt_tokens", "cached_tokens", "generated_tokens", "load_ms", "prompt_ms", "decode_ms", "total_ms", "cache")
+
+# percentiles reported by llm_call_stats
+PERCENTILES = (50, 90, 99)
+# prune the table every this many inserts
+_PRUNE_EVERY = 200
+
+_lock = threading.Lock()
+_inserts = 0
+
+def record_call(persona: str, **metrics: Any) -> None:
+    """
+    Store one finished generation. metrics: any of COLUMNS, None = not reported by this backend.
+    """
+    global _inserts
+    if not Config.LLM_CALLS_LOG:
+        return
+    values = [metrics.get(col) for col in COLUMNS]
+    with _lock:
+        _inserts += 1
+        prune = _inserts % _PRUNE_EVERY == 0
+    try:
+        conn = connect_cache()
+        try:
+            conn.execute(
+                f"INSERT INTO llm_calls (created_at, persona, backend, {', '.join(COLUMNS)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(COLUMNS))})",
+                [time.time(), persona, Config.BACKEND] + values
+            )
+            if prune:
+                conn.execute(
+                    "DELETE FROM llm_calls WHERE id <= (SELECT MAX(id) FROM llm_calls) - ?",
+                    (Config.LLM_CALLS_MAX_ROWS,)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        logging.exception("llm call telemetry store failed")
+
+def _percentile(values: List[float], p: int) -> float:
+    """
+    Nearest-rank percentile of sorted values.
+    """
+    rank = max(1, -(-p * len(values) // 100))
+    return values[rank - 1]
+
+def _summary(values: List[Optional[float]]) -> Optional[Dict[str, float]]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    summary = {f"p{p}": round(_percentile(values, p), 1) for p in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 1)
+    return summary
+
+def _rate(tokens: Optional[int], ms: Optional[float]) -> Optional[float]:
+    if not tokens or not ms:
+        return None
+    return tokens * 1000.0 / ms
+
+def llm_call_stats(since: Optional[float] = None, persona: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Per persona: number of calls, cache hits (by cache) and cached prompt token share, and
+    percentiles (PERCENTILES + mean) of the token counts, times (ms) and throughput (tokens/sec).
+    since: unix time, only calls that finished after it.
+    """
+    query = f"SELECT persona, {', '.join(COLUMNS)} FROM llm_calls WHERE created_at >= ?"
+    args: List[Any] = [since or 0]
+    if persona:
+        query += " AND persona = ?"
+        args.append(persona)
+    conn = connect_cache()
+    try:
+        rows = conn.execute(query + " ORDER BY id", args).fetchall()
+    finally:
+        conn.close()
+
+    by_persona: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_persona.setdefault(row[0], []).append(dict(zip(COLUMNS, row[1:])))
+
+    stats = {}
+    for name, calls in sorted(by_persona.items()):
+        hits: Dict[str, int] = {}
+        for call in calls:
+            if call["cache"]:
+                hits[call["cache"]] = hits.get(call["cache"], 0) + 1
+        prompt_total = sum(call["prompt_tokens"] or 0 for call in calls)
+        cached_total = sum(call["cached_tokens"] or 0 for call in calls)
+        entry = {
+            "calls": len(calls),
+            "cache_hits": hits,
+            "cache_hit_rate": round(sum(hits.values()) / len(calls), 3),
+            "cached_prompt_share": round(cached_total / prompt_total, 3) if prompt_total else 0.0,
+        }
+        for col in ("prompt_tokens", "generated_tokens", "load_ms", "prompt_ms", "decode_ms", "total_ms"):
+            entry[col] = _summary([call[col] for call in calls])
+        # throughput of what was actually evaluated: cached prompt tokens cost nothing
+        entry["prompt_tokens_per_sec"] = _summary([
+            _rate((call["prompt_tokens"] or 0) - (call["cached_tokens"] or 0), call["prompt_ms"]) for call in calls
+        ])
+        entry["decode_tokens_per_sec"] = _summary([_rate(call["generated_tokens"], call["decode_ms"]) for call in calls])
+        stats[name] = entry
+    return {"backend": Config.BACKEND, "since": since, "calls": len(rows), "personas": stats}
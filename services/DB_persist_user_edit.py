@@ -17,7 +17,7 @@ selector: #story-history, .mid-synopsis-area, .long-synopsis-area
 """
 
 import sqlite3
-from services.DB_token_cost import count_tokens
+from services.DB_token_cost import count_tokens_many
 from typing import Any, Dict, List, Union
 from services.llm_config import GlobalVars
 from services.DB_access_pipeline import write_connection
@@ -32,13 +32,12 @@ COLUMN_MAP = {
     '.long-synopsis-area': ('summary', 'summary_token_cost'),
 }
 
-def _apply_update(cursor: sqlite3.Cursor, paragraph_id: str, col: str, token_col: str, new_text: str) -> None:
+def _apply_update(cursor: sqlite3.Cursor, paragraph_id: str, col: str, token_col: str, new_text: str, token_count: int) -> None:
     """
     Update a single paragraph row setting col = new_text and token_col = token_count.
     If new_text is None or empty string, treat according to caller (we still write empty string).
+    token_count is computed up front (count_tokens_many) so we don't tokenize under the write lock.
     """
-    # Compute token cost (guard empty)
-    token_count = count_tokens(new_text or "")
     cursor.execute(
         f"UPDATE story_paragraphs SET {col} = ?, {token_col} = ? WHERE id = ?",
         (new_text, token_count, paragraph_id)
@@ -84,6 +83,13 @@ def persist_user_edit(user_edits: Union[Dict[str, Any], List[Dict[str, Any]], No
     if not diffs:
         return True
 
+    # Tokenize every update in one batch before taking the write lock
+    update_texts = []
+    for d in diffs:
+        if isinstance(d, dict) and d.get('newText') is not None:
+            update_texts.append(str(d.get('newText')))
+    token_counts = dict(zip(update_texts, count_tokens_many(update_texts, parallel=True)))
+
     try:
         with write_connection() as conn:
             conn.row_factory = sqlite3.Row
@@ -114,7 +120,7 @@ def persist_user_edit(user_edits: Union[Dict[str, Any], List[Dict[str, Any]], No
                     _apply_delete(cur, paragraph_id)
                 elif action in ('update', 'insert') or new_text is not None:
                     safe_text = '' if new_text is None else str(new_text)
-                    _apply_update(cur, paragraph_id, col, token_col, safe_text)
+                    _apply_update(cur, paragraph_id, col, token_col, safe_text, token_counts.get(safe_text, 0))
                 else:
                     print("persist_user_edit: skipping unrecognized action:", d)
 
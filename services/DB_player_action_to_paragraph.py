@@ -46,4 +46,14 @@ def player_action_to_paragraph(player_action: str) -> dict:
         )
         row = cursor.fetchone()
 
-        return {'id': row[0], 'content': row[1], 'story_id': row[2]}
\ No newline at end of file
+        return {'id': row[0], 'content': row[1], 'story_id': row[2]}
+
+def remove_player_action(paragraph_id: int) -> None:
+    """
+    Roll back player_action_to_paragraph() when the turn it started doesn't complete (e.g. cancelled evaluation).
+    """
+    with write_connection() as conn:
+        conn.execute(
+            "DELETE FROM story_paragraphs WHERE id = ? AND story_id = 'continue_with_UserAction'",
+            (paragraph_id,)
+        )
@@ -0,0 +1,131 @@
+# services.DB_response_cache.py
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from services.llm_config import Config
+from services.DB_access_pipeline import connect_cache
+
+"""
+Generation result cache for the cacheable personas ("cacheable" in PERSONAS: the GM evaluation and the taggers).
+They decode at near-zero temperature with a fixed seed (Config.SEED), so the same prompt on the same model
+gives the same answer: re-running /api/eval after an undo, or tagging an unchanged summary again, is a lookup.
+Keyed by model fingerprint + chat template + persona + sampling parameters + seed + both prompts, stored
+in the llm_responses table of the cache DB and evicted least recently used first once the stored
+responses exceed Config.RESPONSE_CACHE_MAX_BYTES. Opt-in: Config.RESPONSE_CACHE.
+"""
+
+# persona entries that don't change what gets decoded
+_NOT_SAMPLING = ("model", "priority", "timeout", "cacheable", "speculative", "session")
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+def _model_id(model: Dict[str, Any]) -> str:
+    """
+    What decodes: the GGUF's fingerprint and its chat template. llama-server renders with the template
+    it was started with and has whatever model it loaded - only its URL tells it apart.
+    """
+    if Config.BACKEND == "fake":
+        return "fake"
+    if Config.BACKEND == "llama_server":
+        return "llama_server:" + Config.LLAMA_SERVER_URL
+    from services.llm_registry import model_fingerprint
+    template = Path(model["template_path"]).read_bytes()
+    return model_fingerprint(model["model_path"]) + ":" + hashlib.sha256(template).hexdigest()
+
+def response_key(persona: str, params: Dict[str, Any], model: Dict[str, Any],
+                 system_prompt: str, user_prompt: str) -> str:
+    sampling = {k: v for k, v in params.items() if k not in _NOT_SAMPLING}
+    h = hashlib.sha256()
+    for part in (_model_id(model), persona, json.dumps(sampling, sort_keys=True, default=str), system_prompt, user_prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def response_get(key: str) -> Optional[str]:
+    """
+    The stored raw output for `key` or None; a hit counts as a use for the LRU.
+    """
+    try:
+        conn = connect_cache()
+        try:
+            row = conn.execute("SELECT response FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE llm_responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        logging.exception("response cache lookup failed")
+        row = None
+
+    with _lock:
+        _stats["hits" if row is not None else "misses"] += 1
+    return row[0] if row is not None else None
+
+def response_put(key: str, persona: str, response: str) -> None:
+    size = len(response.encode("utf-8"))
+    if size > Config.RESPONSE_CACHE_MAX_BYTES:
+        return
+    now = time.time()
+    try:
+        conn = connect_cache()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, persona, response, bytes, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, persona, response, size, now, now)
+            )
+            evicted = _evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        # a lost cache row only means we generate that answer again next time
+        logging.exception("response cache store failed")
+        return
+    if evicted:
+        with _lock:
+            _stats["evicted"] += evicted
+
+def _evict(conn) -> int:
+    """
+    Drop the least recently used responses until the rest fits into RESPONSE_CACHE_MAX_BYTES.
+    """
+    total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM llm_responses").fetchone()[0]
+    excess = total - Config.RESPONSE_CACHE_MAX_BYTES
+    if excess <= 0:
+        return 0
+    victims = []
+    for key, size in conn.execute("SELECT key, bytes FROM llm_responses ORDER BY last_used"):
+        victims.append((key,))
+        excess -= size
+        if excess <= 0:
+            break
+    conn.executemany("DELETE FROM llm_responses WHERE key = ?", victims)
+    return len(victims)
+
+def response_cache_stats() -> Dict[str, Any]:
+    """
+    Hit/miss counters since process start, plus what is stored.
+    """
+    with _lock:
+        stats = dict(_stats)
+    try:
+        conn = connect_cache()
+        try:
+            stats["entries"], stats["bytes"] = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM llm_responses"
+            ).fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        logging.exception("response cache stats failed")
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
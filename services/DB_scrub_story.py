@@ -11,3 +11,6 @@ def clear_story_tables():
             "DELETE FROM sqlite_sequence WHERE name = ?;",
             ("story_paragraphs",)
         )
+        # 3) Drop the old story's summarize jobs: their dedupe keys name paragraph ids the new story
+        #    starts handing out again, a finished one would keep the new paragraph's job from being queued
+        conn.execute("DELETE FROM summarize_jobs;")
@@ -0,0 +1,93 @@
+# services.DB_token_cache.py
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict
+
+from services.DB_access_pipeline import connect_cache
+
+"""
+Token count memoization.
+Keyed by (tokenizer hash, text hash): an in-memory LRU in front of the token_counts table
+in the cache DB, so counts survive restarts. The multi-kilobyte hardcodes get tokenized once, ever.
+"""
+
+# entries kept in memory; the SQLite store is unbounded (one small row per distinct text)
+LRU_SIZE = 4096
+
+_lru: "OrderedDict[tuple, int]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "store_hits": 0, "misses": 0}
+
+def text_hash(b: bytes) -> str:
+    return hashlib.sha256(b).hexdigest()
+
+def cache_get(tokenizer_hash: str, th: str) -> Optional[int]:
+    """
+    Cached token count or None. Promotes store hits into the LRU.
+    """
+    key = (tokenizer_hash, th)
+    with _lock:
+        if key in _lru:
+            _lru.move_to_end(key)
+            _stats["memory_hits"] += 1
+            return _lru[key]
+
+    try:
+        conn = connect_cache()
+        try:
+            row = conn.execute(
+                "SELECT token_count FROM token_counts WHERE tokenizer_hash = ? AND text_hash = ?",
+                key
+            ).fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        logging.exception("token cache lookup failed")
+        row = None
+
+    with _lock:
+        if row is None:
+            _stats["misses"] += 1
+            return None
+        _stats["store_hits"] += 1
+        _remember(key, int(row[0]))
+    return int(row[0])
+
+def cache_put(tokenizer_hash: str, th: str, count: int) -> None:
+    key = (tokenizer_hash, th)
+    with _lock:
+        _remember(key, count)
+    try:
+        conn = connect_cache()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO token_counts (tokenizer_hash, text_hash, token_count) VALUES (?, ?, ?)",
+                (tokenizer_hash, th, count)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        # a lost cache row only means we tokenize that text again next time
+        logging.exception("token cache store failed")
+
+def _remember(key: tuple, count: int) -> None:
+    # caller holds _lock
+    _lru[key] = count
+    _lru.move_to_end(key)
+    while len(_lru) > LRU_SIZE:
+        _lru.popitem(last=False)
+
+def token_cache_stats() -> Dict[str, float]:
+    """
+    Hit/miss counters since process start.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["lru_entries"] = len(_lru)
+    lookups = stats["memory_hits"] + stats["store_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["store_hits"]) / lookups, 3) if lookups else 0.0
+    return stats
@@ -2,18 +2,69 @@
 
 import sqlite3
 import logging
-from llama_cpp import Llama
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from services.llm_config import Config, GlobalVars
+from services.llm_registry import get_model, get_tokenizer, model_fingerprint
+from services.llm_backends import fake_tokenize
+from services.DB_token_cache import cache_get, cache_put, text_hash
 from services.DB_access_pipeline import write_connection, connect
-from typing import Optional
+from typing import Optional, Iterable, List, Sequence
 
-# point at the exact same ggml .bin model you pass to llama-cli
-# initialize a real Llama tokenizer instance
-llm: Llama = Llama(model_path=str(Config.MODEL_PATH))
+def _tokenizer():
+    """
+    Vocab-only tokenizer of the story model: counting tokens never maps the weights.
+    """
+    return get_tokenizer(Config.MODEL_PATH)
+
+def _tokenizer_hash() -> str:
+    """
+    Identifies the tokenizer in the token count cache.
+    """
+    if Config.BACKEND == "fake":
+        return "fake"
+    return model_fingerprint(Config.MODEL_PATH)
+
+def verify_tokenizer(samples: Optional[Iterable[str]] = None) -> bool:
+    """
+    Compare the vocab-only tokenizer against the resident full model on `samples`
+    (defaults to the system prompts in the DB). Logs and returns False on the first mismatch.
+    Loads the full model if it isn't resident yet - call after load_models().
+    Only meaningful for the in-process backend, the others report True.
+    """
+    if Config.BACKEND != "llama_cpp":
+        return True
+    if samples is None:
+        conn = connect(readonly=True)
+        try:
+            row = conn.execute("""
+                SELECT story_new, story_continue, story_player_action, eval_system
+                  FROM system_prompts
+                 WHERE id = 1
+            """).fetchone()
+        finally:
+            conn.close()
+        samples = [text for text in (row or []) if text]
+        samples.append('"Hey, you," he says softly. <PlayerAction>I draw my sword.</PlayerAction> Ünïcödé…')
+
+    vocab = _tokenizer()
+    full = get_model(Config.MODEL_PATH).llm
+    for text in samples:
+        b = str(text).encode('utf-8')
+        if vocab.tokenize(b, add_bos=False) != full.tokenize(b, add_bos=False):
+            logging.warning("Vocab-only tokenizer disagrees with the full model on: %r", str(text)[:80])
+            return False
+    return True
+
+# tokenizing releases the GIL inside llama.cpp, a few threads are enough for bulk counts
+_POOL_WORKERS = 4
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
 
 def count_tokens(text: Optional[str]) -> int:
     """
     Returns how many tokens llama.cpp would "consume" for `text`.
+    Memoized per (tokenizer, text) in DB_token_cache.
     """
     if not text:
         return 0
@@ -24,14 +75,42 @@ def count_tokens(text: Optional[str]) -> int:
     else:
         b = str(text).encode('utf-8')
 
+    tokenizer_hash = _tokenizer_hash()
+    th = text_hash(b)
+    cached = cache_get(tokenizer_hash, th)
+    if cached is not None:
+        return cached
+
     try:
-        token_ids = llm.tokenize(b, add_bos=False)
+        if Config.BACKEND == "fake":
+            # no GGUF to read the vocab from
+            token_ids = fake_tokenize(b.decode('utf-8', errors='replace'))
+        else:
+            token_ids = _tokenizer().tokenize(b, add_bos=False)
     except Exception:
         # If tokenizer fails for any reason, fall back to conservative estimate 0
         return 0
 
+    cache_put(tokenizer_hash, th, len(token_ids))
     return len(token_ids)
 
+def count_tokens_many(texts: Sequence[Optional[str]], parallel: bool = False) -> List[int]:
+    """
+    count_tokens for a list of texts in one call, counts returned in input order.
+    With parallel=True the tokenizing runs on a small thread pool.
+    Call this *before* taking write_connection(): bulk counting must not hold the write lock.
+    """
+    if not parallel or len(texts) < 2:
+        return [count_tokens(text) for text in texts]
+    return list(_get_pool().map(count_tokens, texts))
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_POOL_WORKERS, thread_name_prefix="count_tokens")
+        return _pool
+
 def get_prompt_cost():
     """
     Calc combined costs for prompts
@@ -159,37 +238,24 @@ def update_system_prompt_costs():
     """
     Reads from system_prompts (id=1), counts tokens for each, and updates *_token_cost.
     """
-    with write_connection() as conn:
-        # fetch the static prompts
-        row = conn.execute("""
-            SELECT story_new,
-                   story_continue,
-                   story_player_action,
-                   story_summarize,
-                   mid_memory_summarize,
-                   tag_generator,
-                   eval_system
-              FROM system_prompts
-             WHERE id = 1
-        """).fetchone()
-        if row is None:
-            raise RuntimeError("No row found in system_prompts (id=1)")
-
-        # count tokens for each prompt
-        costs = [count_tokens(text) for text in row]
-
-        # write them back
-        conn.execute("""
-            UPDATE system_prompts
-               SET sn_token_cost = ?,
-                   sc_token_cost = ?,
-                   sp_token_cost = ?,
-                   ss_token_cost = ?,
-                   mm_token_cost = ?,
-                   tg_token_cost = ?,
-                   es_token_cost = ?
-             WHERE id = 1
-        """, costs)
+    cols = [
+        "story_new",
+        "story_continue",
+        "story_player_action",
+        "story_summarize",
+        "mid_memory_summarize",
+        "tag_generator",
+        "eval_system",
+    ]
+    _update_costs("system_prompts", cols, """
+               sn_token_cost = ?,
+               sc_token_cost = ?,
+               sp_token_cost = ?,
+               ss_token_cost = ?,
+               mm_token_cost = ?,
+               tg_token_cost = ?,
+               es_token_cost = ?
+    """, lambda row: count_tokens_many(list(row), parallel=True))
     return
 
 def update_story_parameters_cost():
@@ -197,30 +263,17 @@ def update_story_parameters_cost():
     Reads all hardcode/user fields from story_parameters (id=1),
     sums their token counts, and stores the total in token_cost.
     """
-    with write_connection() as conn:
-        # fetch all text fields except id and token_cost
-        cols = [
-            "writing_style_hardcode",   "writing_style",
-            "world_setting_hardcode",   "world_setting",
-            "rules_hardcode",           "rules",
-            "player_hardcode",          "player",
-            "characters_hardcode",      "characters"
-        ]
-        row = conn.execute(
-            f"SELECT {','.join(cols)} FROM story_parameters WHERE id = 1"
-        ).fetchone()
-        if row is None:
-            raise RuntimeError("No row found in story_parameters (id=1)")
-
-        # sum token counts across all non-empty fields
-        total_cost = sum(count_tokens(text) for text in row if text)
-
-        # update the singleton row
-        conn.execute("""
-            UPDATE story_parameters
-               SET token_cost = ?
-             WHERE id = 1
-        """, (total_cost,))
+    # all text fields except id and token_cost
+    cols = [
+        "writing_style_hardcode",   "writing_style",
+        "world_setting_hardcode",   "world_setting",
+        "rules_hardcode",           "rules",
+        "player_hardcode",          "player",
+        "characters_hardcode",      "characters"
+    ]
+    # sum token counts across all non-empty fields
+    _update_costs("story_parameters", cols, "token_cost = ?",
+                  lambda row: [sum(count_tokens_many([text for text in row if text], parallel=True))])
     return
 
 def update_memory_costs():
@@ -229,24 +282,41 @@ def update_memory_costs():
     from the singleton memory row (id=1), sums their token counts, and updates
     token_cost with the total.
     """
-    with write_connection() as conn:
-        # fetch the memory fields
-        cols = [
-            "mid_memory_hardcode",
-            "long_memory_hardcode",
-        ]
-        row = conn.execute(
-            f"SELECT {', '.join(cols)} FROM memory WHERE id = 1"
-        ).fetchone()
+    cols = [
+        "mid_memory_hardcode",
+        "long_memory_hardcode",
+    ]
+    # sum token counts across all non-empty fields
+    _update_costs("memory", cols, "token_cost = ?",
+                  lambda row: [sum(count_tokens_many([text for text in row if text]))])
+    return
+
+# texts edited again while they were counted: counted again, at most this many times in all
+_COST_ATTEMPTS = 3
+
+def _update_costs(table: str, cols: List[str], assign: str, costs) -> None:
+    """
+    Read `cols` of the singleton row of `table`, count them outside the write lock (costs(row) -> values
+    for the `assign` SET clause) and store the result only if the texts are still the ones counted:
+    a concurrent edit must not be left with the cost of the text it replaced.
+    """
+    unchanged = " AND ".join(f"{col} IS ?" for col in cols)
+    for _ in range(_COST_ATTEMPTS):
+        conn = connect(readonly=True)
+        try:
+            row = conn.execute(f"SELECT {', '.join(cols)} FROM {table} WHERE id = 1").fetchone()
+        finally:
+            conn.close()
         if row is None:
-            raise RuntimeError("No row found in memory (id=1)")
+            raise RuntimeError(f"No row found in {table} (id=1)")
 
-        # sum token counts across all non-empty fields
-        total_cost = sum(count_tokens(text) for text in row if text)
+        values = costs(row)
 
-        # update the singleton row
-        conn.execute(
-            "UPDATE memory SET token_cost = ? WHERE id = 1",
-            (total_cost,),
-        )
-    return
+        with write_connection() as conn:
+            cur = conn.execute(
+                f"UPDATE {table} SET {assign} WHERE id = 1 AND {unchanged}",
+                (*values, *row)
+            )
+            if cur.rowcount:
+                return
+    logging.warning("%s: texts changed while counting their tokens, token cost not updated", table)
@@ -11,12 +11,12 @@ from pathlib import Path
 # 1. Ensure project root is on the import path
 sys.path.append(str(Path(__file__).resolve().parent.parent.parent))
 
-from llama_cpp import Llama
 from services.llm_config import Config
+from services.llm_registry import get_tokenizer
 from typing import Optional
 
-# initialize a real Llama tokenizer instance
-llm: Llama = Llama(model_path=str(Config.MODEL_PATH))
+# vocab-only tokenizer, same as the app's count_tokens (no weights mapped)
+llm = get_tokenizer(Config.MODEL_PATH)
 
 def _count_tokens(text: Optional[str]) -> int:
     """
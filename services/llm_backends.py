@@ -0,0 +1,634 @@
+# services.llm_backends.py
+
+import hashlib
+import json
+import logging
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+from services.llm_config import Config
+from services.llm_host_profile import load_params
+from services.llm_config_helper import output_cleaner
+from services.llm_cancel import CancelToken, check
+from services.DB_llm_calls import record_call
+
+logger = logging.getLogger(__name__)
+
+"""
+LLM backends.
+Every persona call goes through one backend (Config.BACKEND), llm_inference only picks the persona:
+    - "llama_cpp": models resident in-process (llama-cpp-python), the default
+    - "llama_cli": a llama-cli subprocess per call, what the story/summarize modules used to do themselves
+    - "llama_server": a running llama-server (Config.LLAMA_SERVER_URL)
+    - "fake": no model at all - deterministic text with a latency/tokens-per-second model, for load tests and profiling
+A backend gets the persona name, its PERSONAS entry (sampling, max_tokens, stop, grammar, ...) and its
+MODELS entry (model_path, template_path) and returns the generated text only.
+An optional CancelToken (llm_cancel) stops the generation early: the backend raises Cancelled.
+Each finished generation is reported to DB_llm_calls with the token counts and timings llama.cpp measured.
+"""
+
+class LLMBackend:
+    name = "base"
+    # True if generate_stream really yields token by token (background work can be preempted mid-generation)
+    streams = False
+    # independent sequences decoded together in one batch: background jobs run side by side up to this many
+    parallel = 1
+
+    def load(self, models: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Prepare the models up front (optional).
+        """
+
+    def generate(self, persona: str, params: Dict[str, Any], model: Dict[str, Any],
+                 system_prompt: str, user_prompt: str, cancel: Optional[CancelToken] = None) -> str:
+        raise NotImplementedError
+
+    def generate_stream(self, persona: str, params: Dict[str, Any], model: Dict[str, Any],
+                        system_prompt: str, user_prompt: str, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """
+        Raw text pieces as they are decoded. Backends that can't stream yield the whole text once.
+        """
+        yield self.generate(persona, params, model, system_prompt, user_prompt, cancel=cancel)
+
+# sentence end, optionally followed by a closing quote
+_SENTENCE_END = re.compile(r'[.!?]["\']?$')
+
+def sentence_stop_reached(n_generated: int, text: str, params: Dict[str, Any]) -> bool:
+    """
+    Early termination for personas with "stop_after_tokens": past the target, stop after a completed sentence.
+    Whatever we'd decode past that point remove_truncated would throw away.
+    """
+    target = params.get("stop_after_tokens")
+    if not target or n_generated < target:
+        return False
+    return bool(_SENTENCE_END.search(text.rstrip()))
+
+"""
+In-process llama-cpp-python
+"""
+class LlamaCppBackend(LLMBackend):
+    name = "llama_cpp"
+    streams = True
+
+    def __init__(self):
+        self._formatters = {}
+        self._grammars = {}
+        self._lock = threading.Lock()
+
+    def load(self, models):
+        from services.llm_context_planner import context_slots
+        for spec in models.values():
+            for n_ctx in context_slots():
+                self._get_model(spec, n_ctx)
+
+    def _get_model(self, spec: Dict[str, Any], n_ctx: Optional[int] = None):
+        """
+        Shared handle for a MODELS entry (context slot n_ctx, default N_CTX) plus the chat formatter for its template.
+        """
+        from services.llm_registry import get_model
+        handle = get_model(spec["model_path"], logits_all=spec.get("speculative", False), n_ctx=n_ctx)
+        formatter_key = (handle.fingerprint, str(spec["template_path"]))
+        with self._lock:
+            if formatter_key not in self._formatters:
+                self._formatters[formatter_key] = self._build_formatter(handle.llm, spec["template_path"])
+            return handle, self._formatters[formatter_key]
+
+    @staticmethod
+    def _build_formatter(llm, template_path):
+        """
+        Same Jinja chat template we used to hand llama-cli via --chat-template-file.
+        """
+        from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+        template = Path(template_path).read_text(encoding="utf-8")
+        eos = llm.detokenize([llm.token_eos()], special=True).decode("utf-8", errors="ignore")
+        bos = llm.detokenize([llm.token_bos()], special=True).decode("utf-8", errors="ignore")
+        return Jinja2ChatFormatter(
+            template=template,
+            eos_token=eos,
+            bos_token=bos,
+            stop_token_ids=[llm.token_eos()],
+        )
+
+    def _prepare(self, persona, params, model, system_prompt, user_prompt):
+        """
+        Render + tokenize the chat prompt and pick the context slot it fits in
+        (story sessions always run on the N_CTX one: their sequence lives there).
+        Returns (handle, prompt_tokens, stop, prefix_plan, load_ms) - load_ms: getting the model, loading it if it wasn't resident.
+        """
+        from services.llm_prefix_cache import plan_prefix
+        from services.llm_context_planner import pick_slot
+        start = time.perf_counter()
+        handle, formatter = self._get_model(model)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        chat = formatter(messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ])
+        added_special = getattr(chat, "added_special", False)
+        prompt_tokens = handle.llm.tokenize(chat.prompt.encode("utf-8"), add_bos=not added_special, special=True)
+        n_ctx = Config.N_CTX if self._session(params) else pick_slot(persona, len(prompt_tokens), params)
+        if n_ctx != handle.n_ctx:
+            start = time.perf_counter()
+            handle, _ = self._get_model(model, n_ctx)
+            load_ms += (time.perf_counter() - start) * 1000
+        prefix_plan = plan_prefix(persona, handle, model["template_path"], system_prompt,
+                                  chat.prompt, prompt_tokens, add_bos=not added_special)
+        return handle, prompt_tokens, chat.stop, prefix_plan, load_ms
+
+    @staticmethod
+    def _session(params) -> bool:
+        return bool(params.get("session")) and Config.STORY_SESSION
+
+    def _enter(self, persona, params, handle, prefix_plan, prompt_tokens) -> Optional[str]:
+        """
+        Put the call's cached state into the context: its story session, or else the KV prefix. Caller holds handle.lock.
+        Returns the cache that served it ("session", "prefix") or None.
+        """
+        from services.llm_prefix_cache import apply_prefix
+        from services.llm_session import enter
+        if enter(handle, persona if self._session(params) else None, prompt_tokens):
+            return "session"
+        return "prefix" if apply_prefix(handle, prefix_plan, prompt_tokens) else None
+
+    @staticmethod
+    def _perf_reset(handle) -> None:
+        """
+        Zero llama.cpp's perf counters of the context: what they show afterwards is this call. Caller holds handle.lock.
+        """
+        import llama_cpp
+        llama_cpp.llama_perf_context_reset(handle.llm.ctx)
+
+    @staticmethod
+    def _perf(handle):
+        """
+        The context's perf counters since _perf_reset: prompt eval (batches, incl. a prefix evaluated for
+        llm_prefix_cache) and eval (single tokens). Caller holds handle.lock.
+        """
+        import llama_cpp
+        return llama_cpp.llama_perf_context(handle.llm.ctx)
+
+    @staticmethod
+    def _record(persona, perf, prompt_tokens, n_generated, load_ms, start, cache) -> None:
+        """
+        Report the call. Prompt tokens that weren't evaluated came from the KV cache.
+        """
+        record_call(
+            persona,
+            prompt_tokens=len(prompt_tokens),
+            cached_tokens=max(0, len(prompt_tokens) - perf.n_p_eval),
+            generated_tokens=n_generated,
+            load_ms=load_ms,
+            prompt_ms=perf.t_p_eval_ms,
+            decode_ms=perf.t_eval_ms,
+            total_ms=(time.perf_counter() - start) * 1000,
+            cache=cache,
+        )
+
+    def _completion_kwargs(self, handle, params, prompt_tokens: List[int], stop, cancel=None) -> Dict[str, Any]:
+        from llama_cpp import StoppingCriteriaList
+        kwargs = {
+            "max_tokens": params["max_tokens"],
+            "temperature": params["temperature"],
+            "top_p": params["top_p"],
+            "repeat_penalty": params["repeat_penalty"],
+            "frequency_penalty": params["frequency_penalty"],
+            "presence_penalty": params["presence_penalty"],
+            "stop": list(stop or []) + list(params.get("stop", [])),
+        }
+        if params.get("seed") is not None:
+            kwargs["seed"] = params["seed"]
+        if params.get("json_schema") or params.get("gbnf"):
+            kwargs["grammar"] = self._persona_grammar(params)
+        criteria = []
+        if params.get("stop_after_tokens"):
+            criteria.append(self._sentence_boundary_stop(handle.llm, len(prompt_tokens), params))
+        if cancel is not None:
+            # ends the decode at the next token, generate() then raises Cancelled
+            criteria.append(lambda input_ids, logits: cancel.cancelled)
+        if criteria:
+            kwargs["stopping_criteria"] = StoppingCriteriaList(criteria)
+        return kwargs
+
+    def _persona_grammar(self, params):
+        """
+        The persona's grammar (GBNF as is, or converted from its JSON schema), parsed once.
+        """
+        from llama_cpp import LlamaGrammar
+        if params.get("gbnf"):
+            key = params["gbnf"]
+        else:
+            key = json.dumps(params["json_schema"], sort_keys=True)
+        with self._lock:
+            if key not in self._grammars:
+                if params.get("gbnf"):
+                    self._grammars[key] = LlamaGrammar.from_string(params["gbnf"], verbose=False)
+                else:
+                    self._grammars[key] = LlamaGrammar.from_json_schema(json.dumps(params["json_schema"]), verbose=False)
+            return self._grammars[key]
+
+    @staticmethod
+    def _sentence_boundary_stop(llm, n_prompt: int, params):
+        """
+        StoppingCriteria around sentence_stop_reached, on the tail of what was decoded so far.
+        """
+        def criterion(input_ids, logits) -> bool:
+            n_generated = len(input_ids) - n_prompt
+            if n_generated < params["stop_after_tokens"]:
+                return False
+            tail = llm.detokenize(list(input_ids[-2:])).decode("utf-8", errors="ignore")
+            return sentence_stop_reached(n_generated, tail, params)
+        return criterion
+
+    @staticmethod
+    @contextmanager
+    def _speculation(persona, handle, params):
+        """
+        Attach the draft model for speculative personas (llama-cpp-python keeps it per Llama, and story and GM
+        may share one) and log its acceptance rate afterwards. Caller holds handle.lock.
+        """
+        draft = None
+        if params.get("speculative") and handle.logits_all:
+            from services.llm_speculative import get_draft_model
+            draft = get_draft_model(handle)
+        if draft is None:
+            yield
+            return
+        draft.begin()
+        handle.llm.draft_model = draft
+        try:
+            yield
+        finally:
+            handle.llm.draft_model = None
+            drafted, accepted = draft.stats()
+            logger.info("%s: speculative %s/%s draft tokens accepted (%.0f%%)",
+                        persona, accepted, drafted, 100.0 * accepted / drafted if drafted else 0.0)
+
+    def generate(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        start = time.perf_counter()
+        handle, prompt_tokens, stop, prefix_plan, load_ms = self._prepare(persona, params, model, system_prompt, user_prompt)
+
+        # one context per model: serialize calls (Flask runs threaded), sampling is per request
+        with handle.lock, self._speculation(persona, handle, params):
+            check(cancel)
+            self._perf_reset(handle)
+            cache = self._enter(persona, params, handle, prefix_plan, prompt_tokens)
+            result = handle.llm.create_completion(prompt=prompt_tokens, **self._completion_kwargs(handle, params, prompt_tokens, stop, cancel))
+            perf = self._perf(handle)
+        check(cancel)
+
+        usage = result.get("usage", {})
+        self._record(persona, perf, prompt_tokens, usage.get("completion_tokens"), load_ms, start, cache)
+        logger.info("%s: %s prompt tokens, %s generated", persona, usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        return result["choices"][0]["text"] or ""
+
+    def generate_stream(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        """
+        The model stays locked until the generator is exhausted or closed (client gone).
+        """
+        start = time.perf_counter()
+        handle, prompt_tokens, stop, prefix_plan, load_ms = self._prepare(persona, params, model, system_prompt, user_prompt)
+
+        with handle.lock, self._speculation(persona, handle, params):
+            check(cancel)
+            self._perf_reset(handle)
+            cache = self._enter(persona, params, handle, prefix_plan, prompt_tokens)
+            n_generated = 0
+            for chunk in handle.llm.create_completion(prompt=prompt_tokens, stream=True, **self._completion_kwargs(handle, params, prompt_tokens, stop, cancel)):
+                piece = chunk["choices"][0]["text"]
+                if piece:
+                    n_generated += 1
+                    yield piece
+            check(cancel)
+            perf = self._perf(handle)
+
+        # a streamed piece is one token (llama-cpp-python only holds pieces back at a possible stop sequence)
+        self._record(persona, perf, prompt_tokens, n_generated, load_ms, start, cache)
+        logger.info("%s: %s prompt tokens, %s pieces streamed", persona, len(prompt_tokens), n_generated)
+
+"""
+llama-cli subprocess per call
+"""
+# the perf lines llama.cpp prints to stderr at exit (llama_perf_context_print, older builds llama_print_timings):
+#   load time =    1234.56 ms
+#   prompt eval time =     456.78 ms /   123 tokens (    3.71 ms per token,   269.32 tokens per second)
+#   eval time =     789.01 ms /    45 runs   (   17.53 ms per token,    57.03 tokens per second)
+_TIMING_LINE = re.compile(r"^\S*:\s*(load|prompt eval|eval) time\s*=\s*([\d.]+) ms(?:\s*/\s*(\d+) (?:tokens|runs))?", re.MULTILINE)
+_TIMING_FIELDS = {"load": ("load_ms", None), "prompt eval": ("prompt_ms", "prompt_tokens"), "eval": ("decode_ms", "generated_tokens")}
+
+def parse_llama_timings(output: str) -> Dict[str, Any]:
+    """
+    {"load_ms", "prompt_ms", "prompt_tokens", "decode_ms", "generated_tokens"} from llama.cpp's timing lines,
+    whichever of them are there. The last block wins (llama-cli prints the context perf once at exit).
+    """
+    timings: Dict[str, Any] = {}
+    for match in _TIMING_LINE.finditer(output or ""):
+        ms_key, count_key = _TIMING_FIELDS[match.group(1)]
+        timings[ms_key] = float(match.group(2))
+        if count_key and match.group(3):
+            timings[count_key] = int(match.group(3))
+    return timings
+
+class LlamaCliBackend(LLMBackend):
+    name = "llama_cli"
+
+    @staticmethod
+    def _ctx_size(persona, params, system_prompt, user_prompt) -> int:
+        """
+        Planned --ctx-size. Counted with the story model's tokenizer (cached), the template margin covers the chat tags.
+        """
+        # imported here: DB_token_cost imports this module
+        from services.DB_token_cost import count_tokens
+        from services.llm_context_planner import plan_context
+        return plan_context(persona, count_tokens(system_prompt) + count_tokens(user_prompt), params)
+
+    def generate(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        load = load_params(model["model_path"])
+        cmd = [
+            str(Config.LLAMA_CLI),
+            "-m", str(model["model_path"]),
+            "--ctx-size", str(self._ctx_size(persona, params, system_prompt, user_prompt)),
+        ]
+        if params["max_tokens"] != -1:
+            cmd += ["--n-predict", str(params["max_tokens"])]
+        cmd += [
+            "--threads", str(load["n_threads"]),
+            "--gpu-layers", str(load["n_gpu_layers"]),
+            "--batch-size", str(load["n_batch"]),
+            "--ubatch-size", str(load["n_ubatch"]),
+            "--temp", str(params["temperature"]),
+            "--top-p", str(params["top_p"]),
+            "--repeat-penalty", str(params["repeat_penalty"]),
+            "--frequency-penalty", str(params["frequency_penalty"]),
+            "--presence-penalty", str(params["presence_penalty"]),
+            "--chat-template-file", str(model["template_path"]),
+        ]
+        if params.get("seed") is not None:
+            cmd += ["--seed", str(params["seed"])]
+        if params.get("gbnf"):
+            cmd += ["--grammar", params["gbnf"]]
+        elif params.get("json_schema"):
+            cmd += ["--json-schema", json.dumps(params["json_schema"])]
+        cmd += [
+            "--system-prompt", system_prompt,
+            "--prompt", user_prompt,
+        ]
+        check(cancel)
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+        )
+        # wait in short slices so a cancelled call kills llama-cli instead of letting it run to the end
+        while True:
+            try:
+                stdout, stderr = proc.communicate(timeout=0.25)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel is not None and cancel.cancelled:
+                    proc.kill()
+                    proc.communicate()
+                    logger.info("%s: llama-cli killed (%s)", persona, cancel.reason)
+                    cancel.check()
+        if proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+
+        # a fresh process: nothing cached, the load is part of every call
+        timings = parse_llama_timings(stderr)
+        if not timings:
+            logger.warning("%s: no timing lines in llama-cli's stderr", persona)
+        record_call(persona, cached_tokens=0, total_ms=(time.perf_counter() - start) * 1000, **timings)
+        logger.info("%s: %s prompt tokens, %s generated (llama-cli)", persona,
+                    timings.get("prompt_tokens"), timings.get("generated_tokens"))
+        return output_cleaner(stdout or "", user_prompt)
+
+"""
+llama-server over HTTP
+"""
+class LlamaServerBackend(LLMBackend):
+    """
+    Talks to the OpenAI-compatible chat endpoint of a running llama-server, which applies its own chat
+    template (start it with --chat-template-file). The model is whatever the server has loaded.
+    """
+    name = "llama_server"
+    streams = True
+
+    @property
+    def parallel(self) -> int:
+        # the server's slots (--parallel), continuous batching across them
+        return max(1, Config.LLAMA_SERVER_PARALLEL)
+
+    def _payload(self, params, system_prompt, user_prompt) -> Dict[str, Any]:
+        payload = {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "stream": True,
+            "temperature": params["temperature"],
+            "top_p": params["top_p"],
+            "repeat_penalty": params["repeat_penalty"],
+            "frequency_penalty": params["frequency_penalty"],
+            "presence_penalty": params["presence_penalty"],
+            "max_tokens": params["max_tokens"],
+            "cache_prompt": True,
+        }
+        if params.get("stop"):
+            payload["stop"] = list(params["stop"])
+        if params.get("seed") is not None:
+            payload["seed"] = params["seed"]
+        if params.get("gbnf"):
+            payload["grammar"] = params["gbnf"]
+        elif params.get("json_schema"):
+            payload["response_format"] = {"type": "json_object", "schema": params["json_schema"]}
+        return payload
+
+    def generate_stream(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        check(cancel)
+        req = urllib.request.Request(
+            Config.LLAMA_SERVER_URL.rstrip("/") + "/v1/chat/completions",
+            data=json.dumps(self._payload(params, system_prompt, user_prompt)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        text = ""
+        n_generated = 0
+        timings = None
+        start = time.perf_counter()
+        first_piece = None
+        # closing the response aborts the generation on the server
+        with urllib.request.urlopen(req, timeout=Config.LLAMA_SERVER_TIMEOUT) as resp:
+            for raw in resp:
+                check(cancel)
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # the server's timings come with the last chunk
+                timings = chunk.get("timings", timings)
+                delta = chunk["choices"][0].get("delta", {}).get("content") if chunk.get("choices") else None
+                if not delta:
+                    continue
+                if first_piece is None:
+                    first_piece = time.perf_counter()
+                n_generated += 1
+                text += delta
+                yield delta
+                if sentence_stop_reached(n_generated, text, params):
+                    break
+        self._record(persona, timings, n_generated, start, first_piece)
+        logger.info("%s: %s pieces from llama-server", persona, n_generated)
+
+    @staticmethod
+    def _record(persona, timings, n_generated, start, first_piece) -> None:
+        """
+        From the server's timings (prompt_n: evaluated, cache_n: reused from the slot's cache). A stream we ended
+        early (sentence stop) has none: time to the first piece counts as prompt, the rest as decode.
+        """
+        end = time.perf_counter()
+        if timings:
+            prompt_n, cache_n = timings.get("prompt_n") or 0, timings.get("cache_n") or 0
+            record_call(persona, prompt_tokens=prompt_n + cache_n, cached_tokens=cache_n,
+                        generated_tokens=timings.get("predicted_n"), prompt_ms=timings.get("prompt_ms"),
+                        decode_ms=timings.get("predicted_ms"), total_ms=(end - start) * 1000)
+        else:
+            first_piece = first_piece or end
+            record_call(persona, generated_tokens=n_generated, prompt_ms=(first_piece - start) * 1000,
+                        decode_ms=(end - first_piece) * 1000, total_ms=(end - start) * 1000)
+
+    def generate(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        # streamed under the hood, so early termination and cancellation work the same way
+        return "".join(self.generate_stream(persona, params, model, system_prompt, user_prompt, cancel=cancel))
+
+"""
+Deterministic fake
+"""
+_FAKE_SENTENCES = [
+    "The lantern light trembles across the wet stones of the alley.",
+    "Somewhere behind you, a door creaks open and falls shut again.",
+    "You taste iron and rain on your lips as the wind picks up.",
+    "\"Keep moving,\" a hoarse voice whispers from the shadows.",
+    "The old map in your pocket feels heavier than it should.",
+    "A bell tolls twice in the distance, then the city holds its breath.",
+    "Your boots find the loose board you had almost forgotten about.",
+    "Smoke curls from the chimney of the inn at the end of the road.",
+    "For a moment nobody speaks, and the silence feels like a verdict.",
+    "The stranger's hand rests on the hilt of a worn, notched blade.",
+]
+
+def fake_tokenize(text: str) -> List[str]:
+    """
+    The fake backend's notion of a token: a word or a single punctuation mark.
+    """
+    return re.findall(r"\w+|[^\w\s]", text or "")
+
+class FakeBackend(LLMBackend):
+    """
+    No model. The output is a pure function of (persona, prompts): the same call always yields the same text.
+    Timing follows Config.FAKE_*: a fixed latency, prompt processing at FAKE_PROMPT_TOKENS_PER_SEC
+    and generation at FAKE_TOKENS_PER_SEC. Structured personas get structurally valid output
+    (tag JSON from the schema, one Outcome block), so the whole turn pipeline runs on it.
+    FAKE_FAILURE_RATE makes a share of the calls fail (not deterministic) for fault testing.
+    FAKE_PARALLEL sequences decode side by side at full speed each (ideal batching).
+    """
+    name = "fake"
+    streams = True
+
+    @property
+    def parallel(self) -> int:
+        return max(1, Config.FAKE_PARALLEL)
+
+    def _text(self, persona, params, system_prompt, user_prompt) -> str:
+        seed = hashlib.sha256("\0".join((persona, system_prompt, user_prompt)).encode("utf-8")).hexdigest()
+        rng = random.Random(seed)
+
+        if params.get("json_schema"):
+            obj = {}
+            for key, spec in params["json_schema"]["properties"].items():
+                if "enum" in spec:
+                    obj[key] = rng.choice(spec["enum"])
+                else:
+                    words = re.findall(r"[A-Za-z]+", rng.choice(_FAKE_SENTENCES))
+                    obj[key] = " ".join(words[:rng.randint(1, 3)])[:spec.get("maxLength", 40)]
+            return json.dumps(obj, ensure_ascii=False)
+
+        if persona == "eval_action":
+            from services.prompts_eval_action import OUTCOME_JUDGEMENTS
+            return "\n".join([
+                "<Outcome>",
+                f"Judgement: {rng.choice(OUTCOME_JUDGEMENTS)}",
+                f"Effect: {rng.choice(_FAKE_SENTENCES)}",
+                "Stat Update: Health (0, unharmed), Stamina (-1, rested)",
+                "Reasoning: Passed Dexterity check, Partially passed Perception check",
+                "</Outcome>",
+            ])
+
+        budget = params["max_tokens"] if params["max_tokens"] != -1 else Config.FAKE_DEFAULT_TOKENS
+        text = ""
+        while True:
+            candidate = (text + " " + rng.choice(_FAKE_SENTENCES)).strip()
+            if len(fake_tokenize(candidate)) > budget:
+                return text or candidate
+            text = candidate
+            if sentence_stop_reached(len(fake_tokenize(text)), text, params):
+                return text
+
+    def generate_stream(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        text = self._text(persona, params, system_prompt, user_prompt)
+        n_prompt = len(fake_tokenize(system_prompt)) + len(fake_tokenize(user_prompt))
+        sleep = time.sleep if cancel is None else cancel.sleep
+        start = time.perf_counter()
+        sleep(Config.FAKE_LATENCY + n_prompt / Config.FAKE_PROMPT_TOKENS_PER_SEC)
+        if Config.FAKE_FAILURE_RATE and random.random() < Config.FAKE_FAILURE_RATE:
+            raise RuntimeError(f"fake backend failure ({persona})")
+
+        prompted = time.perf_counter()
+        pieces = re.findall(r"\s*\S+", text)
+        for piece in pieces:
+            sleep(len(fake_tokenize(piece)) / Config.FAKE_TOKENS_PER_SEC)
+            yield piece
+        end = time.perf_counter()
+        record_call(persona, prompt_tokens=n_prompt, cached_tokens=0, generated_tokens=len(fake_tokenize(text)),
+                    load_ms=0.0, prompt_ms=(prompted - start) * 1000, decode_ms=(end - prompted) * 1000,
+                    total_ms=(end - start) * 1000)
+        logger.info("%s: %s prompt tokens, %s generated (fake)", persona, n_prompt, len(fake_tokenize(text)))
+
+    def generate(self, persona, params, model, system_prompt, user_prompt, cancel=None):
+        return "".join(self.generate_stream(persona, params, model, system_prompt, user_prompt, cancel=cancel))
+
+BACKENDS = {
+    LlamaCppBackend.name: LlamaCppBackend,
+    LlamaCliBackend.name: LlamaCliBackend,
+    LlamaServerBackend.name: LlamaServerBackend,
+    FakeBackend.name: FakeBackend,
+}
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> LLMBackend:
+    """
+    The configured backend (Config.BACKEND), created on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if Config.BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown LLM backend {Config.BACKEND!r}, expected one of {sorted(BACKENDS)}")
+            _backend = BACKENDS[Config.BACKEND]()
+            logger.info("LLM backend: %s", _backend.name)
+        return _backend
@@ -0,0 +1,216 @@
+# services.llm_bench.py
+
+import gc
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services.llm_config import Config, GlobalVars
+from services.llm_host_profile import host_name, write_host_profile
+
+"""
+Model autotuner (`python pgm.py bench-model`).
+Loads every distinct GGUF of the config (MODEL_PATH, MODEL_PATH_GM) with candidate values of
+n_threads, n_gpu_layers and n_batch and measures
+    - prompt evaluation tokens/sec at the prompt sizes the app sends: a GM prompt (tagging, evaluation)
+      and a full writer prompt (recent paragraphs + memory budgets, capped by N_CTX)
+    - decode tokens/sec, one token per forward pass after the writer prompt
+The winner per model is the combination with the shortest writer turn (writer prompt + MAX_GENERATION_TOKENS),
+written to the host profile that Config.HOST_PROFILE loads (llm_host_profile).
+Search: n_gpu_layers first (Config's threads and batch), then n_threads with the best layers, then n_batch -
+about a dozen loads per model. full=True measures the whole matrix instead.
+CPU only (no GPU offload in the llama.cpp build) sweeps n_gpu_layers = 0 only.
+The models are loaded directly, not through llm_registry: the app's resident handles stay as they are,
+run this while the app is not serving.
+"""
+
+# tokens decoded per measurement
+DECODE_TOKENS = 64
+# GM prompt size (tagging, evaluation)
+GM_PROMPT_TOKENS = 1536
+# filler the synthetic prompts are tokenized from: prompt speed doesn't depend on the text
+FILLER = (
+    "The lantern swung on its hook as the cart rolled over the cobbles, and the smell of rain and smoke drifted "
+    "through the narrow street. Somewhere behind the tavern a dog barked twice, then fell silent. "
+)
+# n_batch candidates; n_ubatch follows n_batch (llama-cpp-python would cap it at 512, making the larger ones
+# measure the same as 512), the profile and the loaders keep the pair
+BATCH_SIZES = [128, 256, 512, 1024, 2048]
+
+def _models() -> List[Path]:
+    """
+    The distinct GGUFs of the config, story model first.
+    """
+    seen, models = set(), []
+    for path in (Config.MODEL_PATH, Config.MODEL_PATH_GM):
+        resolved = Path(path).resolve()
+        if resolved not in seen:
+            seen.add(resolved)
+            models.append(resolved)
+    return models
+
+def _writer_prompt_tokens() -> int:
+    budgets = (GlobalVars.tc_budget_recent_paragraphs + GlobalVars.tc_budget_mid_memories
+               + GlobalVars.tc_budget_long_memories)
+    cap = Config.N_CTX - Config.MAX_GENERATION_TOKENS - Config.CONTEXT_TEMPLATE_MARGIN
+    return max(GM_PROMPT_TOKENS, min(budgets, cap))
+
+def thread_candidates() -> List[int]:
+    cpus = os.cpu_count() or 4
+    candidates = {max(1, cpus * share // 4) for share in (1, 2, 3, 4)}
+    candidates.add(min(Config.N_THREADS, cpus))
+    return sorted(candidates)
+
+def gpu_layer_candidates(n_layer: int) -> List[int]:
+    import llama_cpp
+    if not llama_cpp.llama_supports_gpu_offload():
+        return [0]
+    # n_layer + 1: the output layer goes along
+    candidates = {0, n_layer // 4, n_layer // 2, n_layer * 3 // 4, n_layer + 1, min(Config.N_GPU_LAYERS, n_layer + 1)}
+    return sorted(candidates)
+
+def _n_layer(model_path: Path) -> int:
+    from services.llm_registry import get_tokenizer
+    metadata = get_tokenizer(model_path).metadata
+    arch = metadata.get("general.architecture", "llama")
+    return int(metadata.get(f"{arch}.block_count", 32))
+
+def _prompt(llm, n_tokens: int) -> List[int]:
+    filler = llm.tokenize(FILLER.encode("utf-8"), add_bos=False)
+    return (filler * (n_tokens // len(filler) + 1))[:n_tokens]
+
+def measure(model_path: Path, n_threads: int, n_gpu_layers: int, n_batch: int,
+            prompt_sizes: List[int]) -> Dict[str, Any]:
+    """
+    One load with these parameters: {"n_threads", "n_gpu_layers", "n_batch", "n_ubatch", "prompt_tps": {size: tokens/sec},
+    "decode_tps"}, or with "error" if the model doesn't load (e.g. too many layers for the VRAM).
+    """
+    from llama_cpp import Llama
+    run: Dict[str, Any] = {"n_threads": n_threads, "n_gpu_layers": n_gpu_layers, "n_batch": n_batch, "n_ubatch": n_batch}
+    n_ctx = max(prompt_sizes) + DECODE_TOKENS + Config.CONTEXT_TEMPLATE_MARGIN
+    llm = None
+    try:
+        llm = Llama(model_path=str(model_path), n_ctx=n_ctx, n_threads=n_threads, n_gpu_layers=n_gpu_layers,
+                    n_batch=n_batch, n_ubatch=n_batch, verbose=False)
+        # warm-up: first touch of the mmapped weights, graph allocation
+        llm.eval(_prompt(llm, min(n_batch, 64)))
+
+        run["prompt_tps"] = {}
+        for size in prompt_sizes:
+            tokens = _prompt(llm, size)
+            llm.reset()
+            start = time.perf_counter()
+            llm.eval(tokens)
+            run["prompt_tps"][str(size)] = round(size / (time.perf_counter() - start), 1)
+
+        # after the largest prompt: decode speed at a realistic KV fill
+        start = time.perf_counter()
+        for token in tokens[:DECODE_TOKENS]:
+            llm.eval([token])
+        run["decode_tps"] = round(DECODE_TOKENS / (time.perf_counter() - start), 2)
+    except Exception as e:
+        run["error"] = str(e) or type(e).__name__
+    finally:
+        if llm is not None:
+            llm.close()
+        del llm
+        gc.collect()
+    return run
+
+def turn_seconds(run: Dict[str, Any], prompt_tokens: int) -> Optional[float]:
+    """
+    Estimated time of a writer turn: evaluate the writer prompt, decode MAX_GENERATION_TOKENS.
+    """
+    if "error" in run:
+        return None
+    return prompt_tokens / run["prompt_tps"][str(prompt_tokens)] + Config.MAX_GENERATION_TOKENS / run["decode_tps"]
+
+def _best(runs: List[Dict[str, Any]], prompt_tokens: int) -> Optional[Dict[str, Any]]:
+    timed = [run for run in runs if "error" not in run]
+    return min(timed, key=lambda run: turn_seconds(run, prompt_tokens)) if timed else None
+
+def bench_model(model_path: Path, full: bool = False, threads: Optional[List[int]] = None,
+                gpu_layers: Optional[List[int]] = None, batch_sizes: Optional[List[int]] = None,
+                report=print) -> Dict[str, Any]:
+    """
+    Sweep one model. Returns {"best": winning run + "turn_seconds", "runs": every run}.
+    threads/gpu_layers/batch_sizes: candidates instead of the defaults.
+    """
+    threads = threads or thread_candidates()
+    gpu_layers = gpu_layers if gpu_layers is not None else gpu_layer_candidates(_n_layer(model_path))
+    batch_sizes = batch_sizes or BATCH_SIZES
+    writer_tokens = _writer_prompt_tokens()
+    prompt_sizes = sorted({min(GM_PROMPT_TOKENS, writer_tokens), writer_tokens})
+    runs: List[Dict[str, Any]] = []
+    measured: Dict[tuple, Dict[str, Any]] = {}
+
+    def run(n_threads, n_gpu_layers, n_batch):
+        key = (n_threads, n_gpu_layers, n_batch)
+        if key not in measured:
+            result = measure(model_path, n_threads, n_gpu_layers, n_batch, prompt_sizes)
+            measured[key] = result
+            runs.append(result)
+            report(_format_run(result, writer_tokens))
+        return measured[key]
+
+    report(f"{model_path.name}: threads {threads}, gpu layers {gpu_layers}, batch {batch_sizes}, "
+           f"prompts {prompt_sizes} tokens")
+    if full:
+        for n_gpu_layers in gpu_layers:
+            for n_threads in threads:
+                for n_batch in batch_sizes:
+                    run(n_threads, n_gpu_layers, n_batch)
+    else:
+        default_threads = min(Config.N_THREADS, max(threads))
+        default_batch = Config.BATCH_SIZE
+        best = _best([run(default_threads, layers, default_batch) for layers in gpu_layers], writer_tokens)
+        if best is not None:
+            best = _best([run(n, best["n_gpu_layers"], default_batch) for n in threads], writer_tokens)
+            best = _best([run(best["n_threads"], best["n_gpu_layers"], b) for b in batch_sizes], writer_tokens)
+
+    best = _best(runs, writer_tokens)
+    if best is not None:
+        best = {**best, "turn_seconds": round(turn_seconds(best, writer_tokens), 2)}
+    return {"best": best, "runs": runs}
+
+def _format_run(run: Dict[str, Any], writer_tokens: int) -> str:
+    head = f"  threads {run['n_threads']:>3}  gpu layers {run['n_gpu_layers']:>3}  batch {run['n_batch']:>5}"
+    if "error" in run:
+        return f"{head}  failed: {run['error']}"
+    prompt = "  ".join(f"prompt@{size} {tps:>8.1f} t/s" for size, tps in run["prompt_tps"].items())
+    return f"{head}  {prompt}  decode {run['decode_tps']:>6.2f} t/s  turn {turn_seconds(run, writer_tokens):.1f}s"
+
+def bench_models(full: bool = False, threads: Optional[List[int]] = None, gpu_layers: Optional[List[int]] = None,
+                 batch_sizes: Optional[List[int]] = None, write: bool = True, report=print) -> Dict[str, Any]:
+    """
+    Sweep every model of the config and (write=True) save the host profile.
+    """
+    import llama_cpp
+    profile: Dict[str, Any] = {
+        "host": host_name(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "gpu_offload": bool(llama_cpp.llama_supports_gpu_offload()),
+        "llama_cpp_python": getattr(llama_cpp, "__version__", "unknown"),
+        "models": {},
+        "runs": {},
+    }
+    for model_path in _models():
+        if not model_path.exists():
+            report(f"{model_path.name}: not found, skipped")
+            continue
+        result = bench_model(model_path, full, threads, gpu_layers, batch_sizes, report)
+        profile["runs"][model_path.name] = result["runs"]
+        best = result["best"]
+        if best is None:
+            report(f"{model_path.name}: no configuration loaded, Config values stay in use")
+            continue
+        profile["models"][model_path.name] = best
+        report(f"{model_path.name}: threads {best['n_threads']}, gpu layers {best['n_gpu_layers']}, "
+               f"batch {best['n_batch']} - {best['turn_seconds']}s per writer turn")
+
+    if write:
+        report(f"host profile written to {write_host_profile(profile)}")
+    return profile
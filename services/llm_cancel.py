@@ -0,0 +1,123 @@
+# services.llm_cancel.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+"""
+Cancellation of in-flight LLM work.
+Every request/job that generates gets a CancelToken, handed down to llm_inference and the backend, which
+check it between tokens (llama_cpp: a stopping criterion; llama_cli: the subprocess is killed; llama_server:
+the HTTP stream is closed). Cancelled work raises Cancelled where it stops; nothing after that point runs,
+so the modules' DB writes (which all come after generation) don't happen.
+A token is cancelled by:
+    - cancel_job(name): /api/cancel/<job>
+    - a superseding job: start_job() with a name that is still running cancels the old one
+    - its probe: e.g. "the client has disconnected", polled at most every PROBE_INTERVAL seconds
+    - its parent (a cancelled request cancels the attempt it started) or its deadline (llm_supervisor timeouts)
+Jobs: "story" (new/continue/player_action/eval requests), "summarize" (the jobs the summarize worker runs).
+"""
+
+PROBE_INTERVAL = 0.25 # seconds
+
+class Cancelled(Exception):
+    """
+    Raised where cancelled work stops. Callers that turn errors into something else must let it pass.
+    """
+
+class CancelToken:
+    def __init__(self, name: Optional[str] = None, probe: Optional[Callable[[], bool]] = None,
+                 parent: Optional["CancelToken"] = None, deadline: Optional[float] = None):
+        self.name = name
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._probe = probe
+        self._probed_at = 0.0
+        self._parent = parent
+        self._deadline = deadline # time.monotonic()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            logger.info("%s cancelled: %s", self.name or "job", reason)
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self._parent is not None and self._parent.cancelled:
+            self.cancel(self._parent.reason)
+        if not self._event.is_set() and self._deadline is not None and time.monotonic() >= self._deadline:
+            self.cancel("timed out")
+        if not self._event.is_set() and self._probe is not None:
+            now = time.monotonic()
+            if now - self._probed_at >= PROBE_INTERVAL:
+                self._probed_at = now
+                if self._probe():
+                    self.cancel("client disconnected")
+        return self._event.is_set()
+
+    def check(self) -> None:
+        """
+        Raise Cancelled if the work should stop.
+        """
+        if self.cancelled:
+            raise Cancelled(f"{self.name or 'job'}: {self.reason}")
+
+    def sleep(self, seconds: float) -> None:
+        """
+        time.sleep() that ends early (raising Cancelled) when the token is cancelled.
+        """
+        deadline = time.monotonic() + seconds
+        while True:
+            self.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._event.wait(min(remaining, PROBE_INTERVAL))
+
+def check(cancel: Optional[CancelToken]) -> None:
+    if cancel is not None:
+        cancel.check()
+
+_jobs: Dict[str, CancelToken] = {}
+_jobs_lock = threading.Lock()
+
+def start_job(name: str, probe: Optional[Callable[[], bool]] = None) -> CancelToken:
+    """
+    Register a new running job `name`; a previous one of the same name is superseded (cancelled).
+    """
+    token = CancelToken(name, probe)
+    with _jobs_lock:
+        previous = _jobs.get(name)
+        _jobs[name] = token
+    if previous is not None:
+        previous.cancel("superseded by a newer request")
+    return token
+
+def finish_job(token: CancelToken) -> None:
+    with _jobs_lock:
+        if _jobs.get(token.name) is token:
+            del _jobs[token.name]
+
+@contextmanager
+def cancellable(name: str, probe: Optional[Callable[[], bool]] = None):
+    token = start_job(name, probe)
+    try:
+        yield token
+    finally:
+        finish_job(token)
+
+def cancel_job(name: str, reason: str = "cancelled by request") -> bool:
+    """
+    Cancel the running job `name`. False if nothing of that name is running.
+    """
+    with _jobs_lock:
+        token = _jobs.get(name)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
@@ -1,7 +1,9 @@
 # services.llm_config.py
 
 from pathlib import Path
+from typing import Any, Dict, List
 from services.llm_config_helper import get_n_ctx, get_recent, get_mid, get_long
+from services.llm_host_profile import read_host_profile
 
 BASE = Path(__file__).resolve().parent.parent
 
@@ -157,6 +159,7 @@ class Config:
     # llama.cpp can spill some transformer layers to the CPU when VRAM is tight.
     # Set this to match your machine’s available cores for optimal throughput.
     # I've settled on this with my i9-14900k (24 cores), leave some room for other stuff
+    # Other hardware: run `python pgm.py bench-model` and HOST_PROFILE overrides this, N_GPU_LAYERS and BATCH_SIZE.
     N_THREADS: int = 16
 
     # N_GPU_LAYERS: count of transformer layers loaded onto the GPU.
@@ -174,6 +177,11 @@ class Config:
     # I don't think this should be changed, certainly not lowered.
     MAX_GENERATION_TOKENS: int = 150
 
+    # Early termination for the story writers (story_continue, story_player_action):
+    # Once TARGET_GENERATION_TOKENS are decoded we stop at the next completed sentence,
+    # instead of decoding up to MAX_GENERATION_TOKENS and throwing the fragment away (remove_truncated).
+    TARGET_GENERATION_TOKENS: int = 110
+
     ##########
     ###
     ###     Thinking about integration
@@ -218,27 +226,123 @@ class Config:
     """
     N_CTX = get_n_ctx()
 
-    # I played around with streaming and other text rpg's use it, but I found that it kills my enjoyment.
-    # Code isn't written to handle it, front-end doesn't know what to do, don't pass this to the LLM,
-    # unless you are willing to refactor the pertaining services: story_*.py and summarize_*.py and the front-end
+    # Right-sized contexts (see llm_context_planner): a call asks for its prompt tokens + generation budget,
+    # rounded up to CONTEXT_BUCKET, instead of the full N_CTX (a ~1.5k token tag_recent doesn't need an 8k KV cache).
+    # CONTEXT_OPEN_GENERATION is the budget assumed for "until EOS" personas (story_new, the summaries),
+    # CONTEXT_TEMPLATE_MARGIN covers chat template tags and llama.cpp's own reserve.
+    CONTEXT_BUCKET: int = 1024
+    CONTEXT_OPEN_GENERATION: int = 1024
+    CONTEXT_TEMPLATE_MARGIN: int = 64
+    # llama_cpp only: extra context sizes kept resident next to the N_CTX one, e.g. [2048, 4096].
+    # A call runs on the smallest one it fits in. Each slot is its own Llama: the mmapped weights are shared
+    # on CPU, but offloaded layers (N_GPU_LAYERS) take their VRAM once per slot. Empty = one context of N_CTX.
+    CONTEXT_SLOTS: List[int] = []
+
+    # Backend every persona call goes through (see llm_backends):
+    # "llama_cpp" (in-process, default), "llama_cli" (subprocess per call), "llama_server" (HTTP) or
+    # "fake" (no model - deterministic text for load tests and profiling, see the FAKE_* settings).
+    BACKEND: str = "llama_cpp"
+
+    # Supervision of every generation (see llm_supervisor):
+    # timeouts per persona group (seconds; the call is cancelled and counts as failed), retries with backoff,
+    # and a circuit breaker: after BREAKER_FAILURES failed calls in a row requests get a 503 for BREAKER_COOLDOWN seconds.
+    LLM_TIMEOUT_STORY: float = 180.0 # story_new, story_continue, story_player_action
+    LLM_TIMEOUT_GM: float = 120.0 # eval_action, tag_long, tag_recent
+    LLM_TIMEOUT_SUMMARY: float = 600.0 # summarize_from_action, summarize_mid
+    LLM_RETRIES: int = 2
+    LLM_RETRY_BACKOFF: float = 1.0 # seconds, doubled per retry
+    BREAKER_FAILURES: int = 3
+    BREAKER_COOLDOWN: float = 30.0
+
+    # llama_server: a running llama-server, started with the model and --chat-template-file of your choice
+    LLAMA_SERVER_URL: str = "http://127.0.0.1:8080"
+    LLAMA_SERVER_TIMEOUT: float = 600.0
+    # the server's --parallel: independent summarize jobs are sent side by side and batched by the server
+    LLAMA_SERVER_PARALLEL: int = 1
+
+    # fake: latency model (seconds, tokens per second) and the length of "until EOS" generations
+    FAKE_LATENCY: float = 0.05
+    FAKE_PROMPT_TOKENS_PER_SEC: float = 2000.0
+    FAKE_TOKENS_PER_SEC: float = 25.0
+    FAKE_DEFAULT_TOKENS: int = 200
+    FAKE_FAILURE_RATE: float = 0.0 # share of calls that raise, to exercise llm_supervisor
+    FAKE_PARALLEL: int = 4 # sequences decoded side by side (see LLAMA_SERVER_PARALLEL)
+
+    # Streaming: the front-end uses the /api/*/stream endpoints (Server-Sent Events) for new/continue/player_action
+    # and shows the paragraph sentence by sentence while it decodes. Set False to get the whole paragraph at once.
+    # Summaries, tags and the GM evaluation never stream.
     STREAMING: bool = True
 
-    # Don't think we need it.
+    # Constrained decoding for the tagging personas (tag_long, tag_recent): the GM can only emit the
+    # tag object from prompts_tag.TAG_JSON_SCHEMA (JSON schema -> GBNF grammar). Set False for free-form + clean_llm_json.
+    CONSTRAINED_TAGS: bool = True
+
+    # Constrained decoding for the GM evaluation (eval_action): exactly one <Outcome> block with the
+    # fields of the Outcome Template (prompts_eval_action.get_outcome_grammar), then EOS.
+    CONSTRAINED_EVAL: bool = True
+
     # stop sequences: generation will end as soon as any of these substrings appears
-    # pass to llama-cpp-python as `stop=Config.STOP_SEQUENCES`
-    #STOP_SEQUENCES: List[str] = ["<|END_TEXT|>"]
+    # The writers sometimes hallucinate the next <PlayerAction> or an <Outcome> - clean_tags would cut
+    # everything from there on anyway, so we don't decode it in the first place.
+    STOP_SEQUENCES: List[str] = ["<PlayerAction>", "<Outcome>", "<playeraction>", "<outcome>"]
 
     # reproducible generations
     # supply to llama-cpp-python via `seed=…` or CLI `--seed N`
+    # (passed for the personas with a "seed": the GM evaluation and the taggers)
     SEED: int = 42
 
+    # Cache of the seeded personas' answers (see DB_response_cache), off by default: the same prompt gets
+    # the stored answer instead of a generation - /api/eval after an undo, re-tagging an unchanged summary.
+    # Bounded by the size of the stored responses, least recently used ones are evicted first.
+    RESPONSE_CACHE: bool = False
+    RESPONSE_CACHE_MAX_BYTES: int = 8 * 1024 * 1024
+
+    # Inference telemetry (see DB_llm_calls): tokens, load/prompt/decode ms and cache hits of every generation,
+    # stored in the cache DB and summarized per persona at /api/metrics. Keeps the newest LLM_CALLS_MAX_ROWS calls.
+    LLM_CALLS_LOG: bool = True
+    LLM_CALLS_MAX_ROWS: int = 50000
+
     # log level (CLI only): e.g. “info”, “warn”, “error” to silence perf prints
     LOG_LEVEL: str = "warn"
 
-    # batch size (Python binding only): number of prompt tokens processed per forward-pass
+    # batch size: number of prompt tokens processed per forward-pass (n_batch and n_ubatch, see llm_host_profile)
     # higher values use more CPU/RAM but can be faster
     BATCH_SIZE: int = 512
 
+    # Host profile (see llm_host_profile): N_THREADS, N_GPU_LAYERS and BATCH_SIZE per model file, measured on
+    # this machine by `python pgm.py bench-model` (writes host_profiles/<hostname>.json). Read at startup;
+    # where it has a value for the model it takes precedence over the ones above. {} = no profile for this host.
+    HOST_PROFILE: Dict[str, Any] = read_host_profile()
+
+    # Idle-time pre-generation of the next Continue paragraph (see story_continue_prefetch), off by default:
+    # it keeps the GPU busy while you read. Starts once the DB has been quiet for PREFETCH_IDLE_SECONDS
+    # and the summarize jobs are through; served only if nothing was written since.
+    PREFETCH_CONTINUE: bool = False
+    PREFETCH_IDLE_SECONDS: float = 3.0
+
+    # Speculative decoding for the story writers (story_continue, story_player_action), see llm_speculative.
+    # DRAFT_MODEL_PATH: a small GGUF of the same tokenizer family as MODEL_PATH (e.g. a 0.5-1B sibling), None = off.
+    # DRAFT_TOKENS: tokens the draft proposes per round - higher pays off while the draft agrees with the story model.
+    # Costs: the draft stays resident, and the story model keeps the logits of every position (logits_all),
+    # about N_CTX * vocab size * 4 bytes of RAM. The text itself does not change.
+    DRAFT_MODEL_PATH = None
+    #DRAFT_MODEL_PATH = BASE / "your-draft-model.Q8_0.gguf"
+    DRAFT_TOKENS: int = 8
+
+    # Persisted KV state of the static system prompt head (see llm_prefix_cache), stored in GlobalVars.kv_cache_folder.
+    # A state file is roughly n_tokens * (KV size per token) - hundreds of MB for a 12B model - hence the file limit.
+    KV_PREFIX_CACHE: bool = True
+    KV_PREFIX_MIN_TOKENS: int = 512 # shorter prefixes are cheaper to evaluate than to load
+    KV_PREFIX_MAX_FILES: int = 8
+
+    # Append-only story sessions for the writers (see story_session, llm_session), off by default.
+    # The recent paragraphs block stays anchored at its first paragraph and only grows, so each turn
+    # evaluates the new paragraph plus the kickoff instead of the whole block. Rebuilt when memories or
+    # story parameters change; once it would overflow N_CTX the oldest paragraphs are dropped (KV shift).
+    # llama_cpp: the writer that isn't running keeps its sequence parked in RAM (its KV cache, up to
+    # N_CTX * KV size per token - a few hundred MB for a 12B model).
+    STORY_SESSION: bool = False
+
 """
 Global Variables
 """
@@ -267,6 +371,11 @@ class GlobalVars:
     """
     log_folder = BASE / "logs"
 
+    """
+    KV cache states (llm_prefix_cache)
+    """
+    kv_cache_folder = BASE / "kv_cache"
+
     """
     Sorry if an old comment or whatever brought you here. Do not change these here, enter values in the frontend (cog icon).
     """
@@ -101,6 +101,43 @@ def normalize_output(text: str) -> str:
 
     return text
 
+class StreamCleaner:
+    """
+    Incremental post-processing for streamed story text.
+    feed() returns only text that is safe to show already: normalized (normalize_output),
+    without <PlayerAction>/<Outcome> spans (clean_tags) and cut after the last complete
+    sentence (what remove_truncated would keep). Nothing published is taken back later;
+    the caller replaces the streamed text with its own final post-processing once done.
+    """
+    def __init__(self):
+        self.raw = ""
+        self.published = ""
+
+    def feed(self, piece: str) -> str:
+        self.raw += piece
+        stable = self._stable()
+        if len(stable) > len(self.published) and stable.startswith(self.published):
+            delta = stable[len(self.published):]
+            self.published = stable
+            return delta
+        return ""
+
+    def _stable(self) -> str:
+        text = clean_tags(normalize_output(generation_cleaner(self.raw)))
+
+        # hold back a tag that is still being decoded ("<Play...")
+        last_lt = text.rfind("<")
+        if last_lt != -1 and text.find(">", last_lt) == -1:
+            text = text[:last_lt].rstrip()
+
+        # a sentence end only counts once we've seen what follows it (a closing quote may still come)
+        ended = self.raw[-1:].isspace()
+        last_end = 0
+        for m in re.finditer(r'[.!?]["\']?(?=\s|$)', text):
+            if m.end() < len(text) or ended:
+                last_end = m.end()
+        return text[:last_end]
+
 def output_cleaner(full_out: str, user_prompt: str) -> str:
     """
     Extracts the model's generated text from raw stdout by:
@@ -130,6 +167,14 @@ def output_cleaner(full_out: str, user_prompt: str) -> str:
             generated = generated.split(marker, 1)[1]
             break
 
+    return generation_cleaner(generated)
+
+def generation_cleaner(generated: str) -> str:
+    """
+    Tidies text that is already only the model's generation:
+    - Trimming at known end markers
+    - Removing empty lines
+    """
     # Trim everything including known end markers
     end_markers = [
         "> EOF by user",
@@ -0,0 +1,66 @@
+# services.llm_context_planner.py
+
+import logging
+from typing import Any, Dict, List
+
+from services.llm_config import Config
+
+logger = logging.getLogger(__name__)
+
+"""
+Context sizing per persona call.
+N_CTX is the ceiling the token budget is planned against, but most calls need far less: a tag_recent or
+summarize_mid prompt of ~1.5k tokens plus a short generation. We size the context to
+    prompt tokens + generation budget (max_tokens, CONTEXT_OPEN_GENERATION for "until EOS") + CONTEXT_TEMPLATE_MARGIN
+rounded up to Config.CONTEXT_BUCKET and clamped to N_CTX.
+    - llama_cli: passed as --ctx-size, the KV cache of every subprocess is allocated to size
+    - llama_cpp: contexts are resident, so the call picks the smallest of the pre-allocated
+      slots (Config.CONTEXT_SLOTS + N_CTX) it fits in
+    - llama_server: the context is fixed when the server starts (-c, split over its --parallel slots)
+"""
+
+def generation_budget(params: Dict[str, Any]) -> int:
+    """
+    Tokens a persona may generate. "Until EOS" personas get CONTEXT_OPEN_GENERATION
+    (with llama_cpp they may go on until their context is full, which is at least that much).
+    """
+    max_tokens = params.get("max_tokens", -1)
+    if max_tokens is None or max_tokens <= 0:
+        return Config.CONTEXT_OPEN_GENERATION
+    return max_tokens
+
+def context_needed(n_prompt: int, params: Dict[str, Any]) -> int:
+    return n_prompt + generation_budget(params) + Config.CONTEXT_TEMPLATE_MARGIN
+
+def plan_context(persona: str, n_prompt: int, params: Dict[str, Any]) -> int:
+    """
+    Context size for a call with `n_prompt` prompt tokens, rounded up to CONTEXT_BUCKET, at most N_CTX.
+    """
+    needed = context_needed(n_prompt, params)
+    bucket = max(1, Config.CONTEXT_BUCKET)
+    n_ctx = -(-needed // bucket) * bucket
+    if n_ctx > Config.N_CTX:
+        if needed > Config.N_CTX:
+            logger.warning("%s: needs %s tokens of context, more than N_CTX=%s", persona, needed, Config.N_CTX)
+        n_ctx = Config.N_CTX
+    logger.info("%s: %s prompt + %s generation tokens -> n_ctx %s", persona, n_prompt, generation_budget(params), n_ctx)
+    return n_ctx
+
+def context_slots() -> List[int]:
+    """
+    Context sizes the resident backend keeps loaded, ascending; N_CTX is always the last one.
+    """
+    return sorted({n for n in Config.CONTEXT_SLOTS if 0 < n < Config.N_CTX} | {Config.N_CTX})
+
+def pick_slot(persona: str, n_prompt: int, params: Dict[str, Any]) -> int:
+    """
+    The smallest resident context slot the call fits in (N_CTX if none is big enough).
+    """
+    needed = context_needed(n_prompt, params)
+    for n_ctx in context_slots():
+        if n_ctx >= needed:
+            break
+    else:
+        logger.warning("%s: needs %s tokens of context, more than N_CTX=%s", persona, needed, Config.N_CTX)
+    logger.info("%s: %s prompt + %s generation tokens -> context slot %s", persona, n_prompt, generation_budget(params), n_ctx)
+    return n_ctx
@@ -0,0 +1,77 @@
+# services.llm_host_profile.py
+
+import json
+import logging
+import socket
+from pathlib import Path
+from typing import Any, Dict
+
+BASE = Path(__file__).resolve().parent.parent
+
+logger = logging.getLogger(__name__)
+
+"""
+Host profiles: N_THREADS, N_GPU_LAYERS and BATCH_SIZE measured per machine instead of guessed.
+`python pgm.py bench-model` (llm_bench) sweeps them for each model in the config and writes the fastest
+combination per GGUF to host_profiles/<hostname>.json. Config.HOST_PROFILE reads the file of the host
+it runs on at startup; load_params() hands out the values for a model, Config's own values are the
+fallback (no profile for this host, model not benchmarked, or a value left out).
+The hostname keys the file, so one checkout can be shared between machines.
+Stdlib only: llm_config imports this module.
+"""
+
+PROFILE_FOLDER = BASE / "host_profiles"
+
+# profile key -> Config attribute it stands in for
+PARAMS = {
+    "n_threads": "N_THREADS",
+    "n_gpu_layers": "N_GPU_LAYERS",
+    "n_batch": "BATCH_SIZE",
+}
+
+def host_name() -> str:
+    return socket.gethostname() or "localhost"
+
+def profile_path(host: str = None) -> Path:
+    return PROFILE_FOLDER / f"{host or host_name()}.json"
+
+def read_host_profile() -> Dict[str, Any]:
+    """
+    This host's profile, {} if it has none (or it can't be read - the app runs on Config's values then).
+    """
+    path = profile_path()
+    if not path.exists():
+        return {}
+    try:
+        profile = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        logger.exception("Could not read host profile %s, using Config values", path)
+        return {}
+    if not isinstance(profile, dict) or not isinstance(profile.get("models"), dict):
+        logger.warning("Host profile %s has no models, using Config values", path)
+        return {}
+    return profile
+
+def write_host_profile(profile: Dict[str, Any]) -> Path:
+    path = profile_path(profile.get("host"))
+    PROFILE_FOLDER.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(profile, indent=2), encoding="utf-8")
+    tmp.replace(path)
+    return path
+
+def load_params(model_path) -> Dict[str, int]:
+    """
+    {"n_threads", "n_gpu_layers", "n_batch", "n_ubatch"} to load `model_path` with on this host.
+    n_ubatch (tokens per forward pass) is the profile's, else n_batch: llama-cpp-python's default caps it at 512.
+    """
+    # imported here: llm_config imports this module
+    from services.llm_config import Config
+    tuned = Config.HOST_PROFILE.get("models", {}).get(Path(model_path).resolve().name, {})
+    params = {}
+    for key, attr in PARAMS.items():
+        value = tuned.get(key)
+        params[key] = int(value) if isinstance(value, int) else getattr(Config, attr)
+    ubatch = tuned.get("n_ubatch")
+    params["n_ubatch"] = int(ubatch) if isinstance(ubatch, int) else params["n_batch"]
+    return params
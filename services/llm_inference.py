@@ -0,0 +1,269 @@
+# services.llm_inference.py
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional
+
+from services.llm_config import Config
+from services.llm_config_helper import generation_cleaner
+from services.llm_backends import get_backend
+from services.llm_scheduler import SCHEDULER, INTERACTIVE, BACKGROUND
+from services.llm_cancel import CancelToken
+from services.llm_supervisor import BREAKER, supervised, supervised_stream
+from services.DB_response_cache import response_key, response_get, response_put
+from services.DB_llm_calls import record_call
+from services.prompts_tag import TAG_JSON_SCHEMA, get_tag_max_tokens
+from services.prompts_eval_action import get_outcome_grammar, get_outcome_max_chars, get_outcome_max_tokens
+
+logger = logging.getLogger(__name__)
+
+"""
+Inference service.
+Every story_*/summarize_* module sends its prompts here by persona; the configured backend
+(llm_backends, Config.BACKEND) does the actual generation. With the default in-process backend the models
+are loaded once (load_models() on app start, or lazily on first use) and stay in memory,
+see llm_registry for how story/GM/tokenizer share a single copy.
+"""
+
+# Resident models: key -> GGUF + chat template (+ "speculative": loaded for draft-model decoding, see llm_speculative)
+MODELS: Dict[str, Dict[str, Any]] = {
+    "story": {"model_path": Config.MODEL_PATH, "template_path": Config.TEMPLATE_PATH, "speculative": bool(Config.DRAFT_MODEL_PATH)},
+    "gm": {"model_path": Config.MODEL_PATH_GM, "template_path": Config.TEMPLATE_PATH_GM},
+}
+
+# Personas: which model a call runs on and the sampling we used to pass on the llama-cli command line.
+# max_tokens = -1 means "until EOS" (llama-cli without --n-predict).
+# Optional early termination: "stop" (extra stop sequences), "stop_after_tokens" (end at the next
+# completed sentence once that many tokens are decoded).
+# "json_schema": decode constrained to that schema (GBNF grammar), the output is always a valid instance.
+# "gbnf": decode constrained to that GBNF grammar.
+# "priority": scheduling class (llm_scheduler) - INTERACTIVE preempts BACKGROUND.
+# "timeout": seconds per attempt before llm_supervisor cancels it (and retries).
+# "speculative": decode with the draft model when Config.DRAFT_MODEL_PATH is set (llama_cpp backend only).
+# "seed": fixed sampling seed (Config.SEED), the same prompt decodes the same way.
+# "cacheable": answers are kept in DB_response_cache (Config.RESPONSE_CACHE) - seeded personas only.
+# "session": the writer keeps an append-only story session (story_session, llm_session) when Config.STORY_SESSION is on.
+PERSONAS: Dict[str, Dict[str, Any]] = {
+    "story_new": {
+        "model": "story",
+        "priority": INTERACTIVE,
+        "timeout": Config.LLM_TIMEOUT_STORY,
+        "temperature": Config.TEMPERATURE_NEW,
+        "top_p": Config.TOP_P,
+        "repeat_penalty": Config.REPEAT_PENALTY,
+        "frequency_penalty": Config.FREQUENCY_PENALTY,
+        "presence_penalty": Config.PRESENCE_PENALTY,
+        "max_tokens": -1,
+    },
+    "story_continue": {
+        "model": "story",
+        "priority": INTERACTIVE,
+        "timeout": Config.LLM_TIMEOUT_STORY,
+        "temperature": Config.TEMPERATURE,
+        "top_p": Config.TOP_P,
+        "repeat_penalty": Config.REPEAT_PENALTY,
+        "frequency_penalty": Config.FREQUENCY_PENALTY,
+        "presence_penalty": Config.PRESENCE_PENALTY_CONTINUE,
+        "max_tokens": Config.MAX_GENERATION_TOKENS,
+        "stop": Config.STOP_SEQUENCES,
+        "stop_after_tokens": Config.TARGET_GENERATION_TOKENS,
+        "speculative": True,
+        "session": True,
+    },
+    "story_player_action": {
+        "model": "story",
+        "priority": INTERACTIVE,
+        "timeout": Config.LLM_TIMEOUT_STORY,
+        "temperature": Config.TEMPERATURE,
+        "top_p": Config.TOP_P,
+        "repeat_penalty": Config.REPEAT_PENALTY,
+        "frequency_penalty": Config.FREQUENCY_PENALTY,
+        "presence_penalty": Config.PRESENCE_PENALTY,
+        "max_tokens": Config.MAX_GENERATION_TOKENS,
+        "stop": Config.STOP_SEQUENCES,
+        "stop_after_tokens": Config.TARGET_GENERATION_TOKENS,
+        "speculative": True,
+        "session": True,
+    },
+    "eval_action": {
+        "model": "gm",
+        "priority": INTERACTIVE,
+        "timeout": Config.LLM_TIMEOUT_GM,
+        "temperature": Config.TEMPERATURE_EVAL,
+        "top_p": Config.TOP_P_slave,
+        "repeat_penalty": Config.REPEAT_PENALTY_slave,
+        "frequency_penalty": Config.FREQUENCY_PENALTY_slave,
+        "presence_penalty": Config.PRESENCE_PENALTY_slave,
+        # characters until load_models() counts the block in tokens
+        "max_tokens": get_outcome_max_chars() if Config.CONSTRAINED_EVAL else Config.MAX_GENERATION_TOKENS,
+        "gbnf": get_outcome_grammar() if Config.CONSTRAINED_EVAL else None,
+        "seed": Config.SEED,
+        "cacheable": True,
+    },
+    "summarize_from_action": {
+        "model": "story",
+        "priority": BACKGROUND,
+        "timeout": Config.LLM_TIMEOUT_SUMMARY,
+        "temperature": Config.TEMPERATURE_SUM_MID,
+        "top_p": Config.TOP_P,
+        "repeat_penalty": Config.REPEAT_PENALTY,
+        "frequency_penalty": Config.FREQUENCY_PENALTY,
+        "presence_penalty": Config.PRESENCE_PENALTY,
+        "max_tokens": -1,
+    },
+    "summarize_mid": {
+        "model": "story",
+        "priority": BACKGROUND,
+        "timeout": Config.LLM_TIMEOUT_SUMMARY,
+        "temperature": Config.TEMPERATURE_SUM_LONG,
+        "top_p": Config.TOP_P,
+        "repeat_penalty": Config.REPEAT_PENALTY,
+        "frequency_penalty": Config.FREQUENCY_PENALTY,
+        "presence_penalty": Config.PRESENCE_PENALTY,
+        "max_tokens": -1,
+    },
+    "tag_long": {
+        "model": "gm",
+        "priority": BACKGROUND,
+        "timeout": Config.LLM_TIMEOUT_GM,
+        "temperature": Config.TEMPERATURE_TAGS,
+        "top_p": Config.TOP_P_slave,
+        "repeat_penalty": Config.REPEAT_PENALTY_slave,
+        "frequency_penalty": Config.FREQUENCY_PENALTY_slave,
+        "presence_penalty": Config.PRESENCE_PENALTY_slave,
+        "max_tokens": get_tag_max_tokens() if Config.CONSTRAINED_TAGS else -1,
+        "json_schema": TAG_JSON_SCHEMA if Config.CONSTRAINED_TAGS else None,
+        "seed": Config.SEED,
+        "cacheable": True,
+    },
+    "tag_recent": {
+        "model": "gm",
+        "priority": BACKGROUND,
+        "timeout": Config.LLM_TIMEOUT_GM,
+        "temperature": Config.TEMPERATURE_TAGS,
+        "top_p": Config.TOP_P_slave,
+        "repeat_penalty": Config.REPEAT_PENALTY_slave,
+        "frequency_penalty": Config.FREQUENCY_PENALTY_slave,
+        "presence_penalty": Config.PRESENCE_PENALTY_slave,
+        "max_tokens": get_tag_max_tokens() if Config.CONSTRAINED_TAGS else -1,
+        "json_schema": TAG_JSON_SCHEMA if Config.CONSTRAINED_TAGS else None,
+        "seed": Config.SEED,
+        "cacheable": True,
+    },
+}
+
+def load_models():
+    """
+    Load every resident model up front so the first player turn doesn't pay for it.
+    Story and GM share one copy when they are the same GGUF. Safe to call more than once.
+    """
+    get_backend().load(MODELS)
+    if Config.CONSTRAINED_EVAL:
+        PERSONAS["eval_action"]["max_tokens"] = get_outcome_max_tokens()
+        logger.info("eval_action: Outcome block capped at %s tokens", PERSONAS["eval_action"]["max_tokens"])
+
+def generate(persona: str, system_prompt: str, user_prompt: str, cancel: Optional[CancelToken] = None) -> str:
+    """
+    Run one completion for `persona` on the configured backend.
+    Returns only the generated text (no echoed prompt), trimmed of end markers and empty lines.
+    Cacheable personas are answered from DB_response_cache when Config.RESPONSE_CACHE is on.
+    Raises llm_cancel.Cancelled when `cancel` fires before or during the generation,
+    llm_supervisor.InferenceError when the backend fails for good (timeouts, errors, open circuit breaker).
+    """
+    params = PERSONAS[persona]
+    cache_key = None
+    if Config.RESPONSE_CACHE and params.get("cacheable"):
+        start = time.perf_counter()
+        cache_key = response_key(persona, params, MODELS[params["model"]], system_prompt, user_prompt)
+        cached = response_get(cache_key)
+        if cached is not None:
+            logger.info("%s: answered from the response cache", persona)
+            record_call(persona, total_ms=(time.perf_counter() - start) * 1000, cache="response")
+            return generation_cleaner(cached)
+
+    # unhealthy backend: fail now, not after queueing for the slot
+    BREAKER.check(persona, claim=False)
+    if params["priority"] == BACKGROUND:
+        text = _run_background(persona, params, system_prompt, user_prompt, cancel)
+    else:
+        with SCHEDULER.slot(INTERACTIVE, cancel):
+            text = supervised(persona, params, lambda token: get_backend().generate(
+                persona, params, MODELS[params["model"]], system_prompt, user_prompt, cancel=token
+            ), cancel)
+
+    if cache_key is not None:
+        response_put(cache_key, persona, text)
+    return generation_cleaner(text)
+
+def generate_alternatives(persona: str, system_prompt: str, user_prompt: str, n: int,
+                          cancel: Optional[CancelToken] = None) -> List[str]:
+    """
+    n completions of one prompt (story_regenerate), cleaned like generate() cleans them.
+    They hold the slot together: on a backend that decodes several sequences in one batch
+    (LLMBackend.parallel) side by side, otherwise one after the other - the prompt is still in the
+    context (or the server's slot cache) from the first one, each costs its decode only.
+    """
+    params = PERSONAS[persona]
+    BREAKER.check(persona, claim=False)
+
+    def one(_) -> str:
+        return generation_cleaner(supervised(persona, params, lambda token: get_backend().generate(
+            persona, params, MODELS[params["model"]], system_prompt, user_prompt, cancel=token
+        ), cancel))
+
+    width = min(n, get_backend().parallel)
+    with SCHEDULER.slot(params["priority"], cancel):
+        if width <= 1:
+            return [one(i) for i in range(n)]
+        with ThreadPoolExecutor(max_workers=width, thread_name_prefix=persona) as pool:
+            return list(pool.map(one, range(n)))
+
+def generate_stream(persona: str, system_prompt: str, user_prompt: str, priority: Optional[int] = None,
+                    cancel: Optional[CancelToken] = None) -> Iterator[str]:
+    """
+    Like generate(), but yields the raw text pieces as they are decoded.
+    Post-processing is the caller's job (see llm_config_helper.StreamCleaner).
+    priority overrides the persona's scheduling class (story_continue_prefetch writes in the background).
+    """
+    params = PERSONAS[persona]
+    BREAKER.check(persona, claim=False)
+    with _slot(params["priority"] if priority is None else priority, cancel):
+        yield from _stream(persona, params, system_prompt, user_prompt, cancel)
+
+def _slot(priority: int, cancel: Optional[CancelToken]):
+    # background generations share the sequences the backend decodes in one batch, interactive ones run alone
+    width = get_backend().parallel if priority == BACKGROUND else 1
+    return SCHEDULER.slot(priority, cancel, width)
+
+def _stream(persona: str, params: Dict[str, Any], system_prompt: str, user_prompt: str,
+            cancel: Optional[CancelToken]) -> Iterator[str]:
+    return supervised_stream(persona, params, lambda token: get_backend().generate_stream(
+        persona, params, MODELS[params["model"]], system_prompt, user_prompt, cancel=token
+    ), cancel)
+
+def _run_background(persona: str, params: Dict[str, Any], system_prompt: str, user_prompt: str,
+                    cancel: Optional[CancelToken] = None) -> str:
+    """
+    Background generation that steps aside for interactive requests: streamed internally, and at every
+    token boundary we check whether the player is waiting. If so the generation is dropped (closing the
+    stream stops decoding), the slot is released and the call starts over afterwards.
+    """
+    # a backend that returns everything at once has nothing to give up half-way
+    preemptible = get_backend().streams
+    attempt = 0
+    while True:
+        attempt += 1
+        with _slot(BACKGROUND, cancel):
+            pieces = []
+            stream = _stream(persona, params, system_prompt, user_prompt, cancel)
+            try:
+                for piece in stream:
+                    pieces.append(piece)
+                    if preemptible and SCHEDULER.interactive_waiting():
+                        break
+                else:
+                    return "".join(pieces)
+            finally:
+                stream.close()
+        logger.info("%s preempted after %s pieces (attempt %s), requeued behind interactive work", persona, len(pieces), attempt)
@@ -0,0 +1,205 @@
+# services.llm_prefix_cache.py
+
+import ctypes
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import llama_cpp
+
+from services.llm_config import Config, GlobalVars
+from services.llm_registry import ModelHandle
+
+logger = logging.getLogger(__name__)
+
+"""
+Persisted KV state for the static head of the system prompts.
+Every persona's system prompt opens with a large block that hardly ever changes (system_prompts row,
+story_parameters hardcodes, the writing style law, ...). We keep the evaluated KV state of that block on disk,
+keyed by prefix hash + model fingerprint + chat template + n_ctx, and load it instead of prompt-processing
+the block again. llama.cpp then only evaluates the rest (memories, recent paragraphs), see the prefix
+matching in Llama.generate.
+
+Where the static block ends is learned per persona: the longest common prefix of two consecutive
+system prompts, cut back to a segment boundary ("\n\n" - the builders join their segments with it).
+"""
+
+KV_DIR: Path = GlobalVars.kv_cache_folder
+
+# llama-cpp-python surface this relies on, checked against 0.3.16 (requirements.txt): the llama.h bindings
+# llama_state_save_file / llama_state_load_file and Llama.ctx / input_ids / n_tokens. Without them: no prefix cache,
+# the whole prompt is evaluated. Logits are never restored: Llama.generate matches the prefix against all but the
+# last prompt token, so that one is always evaluated again.
+_STATE_API = (all(hasattr(llama_cpp, name) for name in ("llama_state_save_file", "llama_state_load_file"))
+              and all(hasattr(llama_cpp.Llama, name) for name in ("ctx", "eval", "reset")))
+
+_lock = threading.Lock()
+_entries: Optional[Dict[str, dict]] = None     # key -> sidecar metadata
+_last_system: Dict[str, str] = {}              # persona -> previous system prompt
+
+def _key(prefix_text: str, handle: ModelHandle, template_path) -> str:
+    h = hashlib.sha256()
+    for part in (prefix_text, handle.fingerprint, str(template_path), str(handle.n_ctx)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _load_index() -> Dict[str, dict]:
+    # caller holds _lock
+    global _entries
+    if _entries is None:
+        _entries = {}
+        KV_DIR.mkdir(parents=True, exist_ok=True)
+        for sidecar in KV_DIR.glob("*.json"):
+            try:
+                meta = json.loads(sidecar.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if (KV_DIR / f"{meta['key']}.bin").exists():
+                _entries[meta["key"]] = meta
+    return _entries
+
+def plan_prefix(persona: str, handle: ModelHandle, template_path, system_prompt: str,
+                rendered_prompt: str, prompt_tokens: List[int], add_bos: bool) -> Optional[dict]:
+    """
+    Decide which static prefix this call can reuse (or should save).
+    Returns {"key", "n_tokens", "saved"} or None when there is nothing worth caching.
+    """
+    if not Config.KV_PREFIX_CACHE or not _STATE_API:
+        return None
+
+    with _lock:
+        entries = _load_index()
+        previous = _last_system.get(persona)
+        _last_system[persona] = system_prompt
+
+        # a prefix we already have on disk: longest first
+        for meta in sorted(entries.values(), key=lambda m: m["chars"], reverse=True):
+            if meta["persona"] != persona or meta["chars"] > len(system_prompt):
+                continue
+            if _key(system_prompt[:meta["chars"]], handle, template_path) == meta["key"]:
+                return {"key": meta["key"], "n_tokens": meta["n_tokens"], "saved": True}
+
+    if previous is None:
+        return None
+
+    # learn the static head: common prefix with the previous call, cut at a segment boundary
+    common = 0
+    for a, b in zip(previous, system_prompt):
+        if a != b:
+            break
+        common += 1
+    chars = system_prompt.rfind("\n\n", 0, common) if common < len(system_prompt) else common
+    if chars <= 0:
+        return None
+
+    # the same prefix in tokens: render up to the boundary and match against the full prompt
+    start = rendered_prompt.find(system_prompt)
+    if start == -1:
+        return None
+    prefix_tokens = handle.llm.tokenize(rendered_prompt[:start + chars].encode("utf-8"), add_bos=add_bos, special=True)
+    n_tokens = 0
+    for a, b in zip(prefix_tokens, prompt_tokens):
+        if a != b:
+            break
+        n_tokens += 1
+    # the last token may merge with what follows the boundary
+    n_tokens = min(n_tokens, len(prefix_tokens) - 1)
+    if n_tokens < Config.KV_PREFIX_MIN_TOKENS:
+        return None
+
+    return {
+        "key": _key(system_prompt[:chars], handle, template_path),
+        "persona": persona,
+        "chars": chars,
+        "n_tokens": n_tokens,
+        "saved": False,
+    }
+
+def apply_prefix(handle: ModelHandle, plan: Optional[dict], prompt_tokens: List[int]) -> bool:
+    """
+    Put the planned prefix into the model's context. Caller holds handle.lock.
+    - saved and already resident (the previous call shared it): nothing to do
+    - saved: load the state file
+    - new: evaluate the prefix on its own and save the state, create_completion continues from there
+    True if the prefix came from a state file (call telemetry counts it as a cache hit).
+    """
+    if plan is None:
+        return False
+    llm = handle.llm
+    n = plan["n_tokens"]
+    prefix = prompt_tokens[:n]
+
+    path = KV_DIR / f"{plan['key']}.bin"
+    if plan["saved"]:
+        if llm.n_tokens >= n and list(llm.input_ids[:n]) == prefix:
+            return False
+        try:
+            if _load_state(llm, path, prefix):
+                path.touch()
+                logger.info("KV prefix restored: %s tokens", n)
+                return True
+        except Exception:
+            logger.exception("KV prefix restore failed")
+        # stale or unreadable: forget it, the rest of the prompt is evaluated as usual
+        _drop(plan["key"])
+        llm.reset()
+        return False
+
+    # keep what the context already shares with the prefix, evaluate only the remainder.
+    # Anything past the prefix goes (eval truncates the KV at n_tokens): the state file must hold the prefix only.
+    shared = 0
+    for a, b in zip(llm.input_ids[:llm.n_tokens], prefix):
+        if a != b:
+            break
+        shared += 1
+    llm.n_tokens = shared
+    llm.eval(prefix[shared:])
+
+    try:
+        _save_state(llm, path, prefix)
+    except Exception:
+        logger.exception("KV prefix save failed")
+        return False
+    meta = {k: plan[k] for k in ("key", "persona", "chars", "n_tokens")}
+    (KV_DIR / f"{plan['key']}.json").write_text(json.dumps(meta), encoding="utf-8")
+    with _lock:
+        _load_index()[plan["key"]] = meta
+    logger.info("KV prefix saved: %s tokens (%s)", n, plan["persona"])
+    _evict()
+    return False
+
+def _save_state(llm, path: Path, tokens: List[int]) -> None:
+    arr = (llama_cpp.llama_token * len(tokens))(*tokens)
+    if not llama_cpp.llama_state_save_file(llm.ctx, str(path).encode("utf-8"), arr, len(tokens)):
+        raise RuntimeError(f"llama_state_save_file failed for {path.name}")
+
+def _load_state(llm, path: Path, expected: List[int]) -> bool:
+    capacity = llm.n_ctx()
+    arr = (llama_cpp.llama_token * capacity)()
+    n_loaded = ctypes.c_size_t(0)
+    if not llama_cpp.llama_state_load_file(llm.ctx, str(path).encode("utf-8"), arr, capacity, ctypes.byref(n_loaded)):
+        return False
+    tokens = list(arr[:n_loaded.value])
+    if tokens != expected:
+        return False
+    llm.input_ids[:len(tokens)] = tokens
+    llm.n_tokens = len(tokens)
+    return True
+
+def _drop(key: str) -> None:
+    with _lock:
+        _load_index().pop(key, None)
+    for suffix in (".bin", ".json"):
+        (KV_DIR / f"{key}{suffix}").unlink(missing_ok=True)
+
+def _evict() -> None:
+    """
+    Keep at most Config.KV_PREFIX_MAX_FILES states (they are hundreds of MB each), least recently used go first.
+    """
+    states = sorted(KV_DIR.glob("*.bin"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for stale in states[Config.KV_PREFIX_MAX_FILES:]:
+        _drop(stale.stem)
@@ -0,0 +1,128 @@
+# services.llm_registry.py
+
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, TYPE_CHECKING
+
+from services.llm_config import Config
+from services.llm_host_profile import load_params
+
+if TYPE_CHECKING:
+    from llama_cpp import Llama
+
+logger = logging.getLogger(__name__)
+
+"""
+Model registry.
+Hands out one shared, resident Llama per distinct GGUF. MODEL_PATH and MODEL_PATH_GM usually
+point at the same file - they (and the tokenizer in DB_token_cost) must not load the weights twice.
+Handles are deduplicated by resolved path first and by content fingerprint second (copies, symlinks).
+A model can be resident with several context sizes (Config.CONTEXT_SLOTS, see llm_context_planner):
+one handle per (fingerprint, n_ctx), each with its own Llama and lock.
+Sampling is not part of a handle: personas pass their own parameters per request.
+llama_cpp is imported on first load only: the llama_server/fake backends run without it.
+"""
+
+# bytes read from the head and the tail of a GGUF for its fingerprint
+FINGERPRINT_CHUNK = 4 * 1024 * 1024
+
+class ModelHandle:
+    """
+    One loaded model with one context of n_ctx tokens. `lock` serializes generation on it.
+    `session`/`parked`: the story session live in the context and the ones parked in RAM (llm_session).
+    """
+    def __init__(self, llm: "Llama", model_path: Path, fingerprint: str, logits_all: bool = False,
+                 n_ctx: int = Config.N_CTX):
+        self.llm = llm
+        self.model_path = model_path
+        self.fingerprint = fingerprint
+        self.logits_all = logits_all
+        self.n_ctx = n_ctx
+        self.lock = threading.Lock()
+        self.session: Optional[Dict[str, Any]] = None
+        self.parked: Dict[str, Dict[str, Any]] = {}
+
+_handles: Dict[Tuple[str, int], ModelHandle] = {}  # (fingerprint, n_ctx) -> handle
+_tokenizers: Dict[str, "Llama"] = {}         # fingerprint -> vocab-only Llama
+_fingerprints: Dict[Path, str] = {}        # resolved path -> fingerprint
+_registry_lock = threading.Lock()
+
+def model_fingerprint(model_path) -> str:
+    """
+    Content fingerprint of a GGUF: sha256 over file size + first and last FINGERPRINT_CHUNK bytes.
+    Hashing all ~10 GB on every start would cost more than the load we are trying to save;
+    header (metadata, tensor table) + tail + size tells apart every real-world pair of files.
+    """
+    path = Path(model_path).resolve()
+    if path in _fingerprints:
+        return _fingerprints[path]
+
+    size = os.path.getsize(path)
+    h = hashlib.sha256()
+    h.update(str(size).encode("utf-8"))
+    with open(path, "rb") as f:
+        h.update(f.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK:
+            f.seek(max(FINGERPRINT_CHUNK, size - FINGERPRINT_CHUNK))
+            h.update(f.read(FINGERPRINT_CHUNK))
+
+    fingerprint = h.hexdigest()
+    _fingerprints[path] = fingerprint
+    return fingerprint
+
+def get_model(model_path, logits_all: bool = False, n_ctx: Optional[int] = None) -> ModelHandle:
+    """
+    Return the shared handle for `model_path` with a context of n_ctx (default N_CTX), loading it on first use only.
+    logits_all keeps the logits of every evaluated position (needed to verify draft tokens, see llm_speculative);
+    it is fixed at load time, so the first caller decides.
+    """
+    n_ctx = n_ctx or Config.N_CTX
+    with _registry_lock:
+        fingerprint = model_fingerprint(model_path)
+        handle = _handles.get((fingerprint, n_ctx))
+        if handle is None:
+            from llama_cpp import Llama
+            path = Path(model_path).resolve()
+            params = load_params(path)
+            logger.info("Loading model %s (%s), n_ctx %s, %s", path.name, fingerprint[:12], n_ctx, params)
+            llm = Llama(
+                model_path=str(path),
+                n_ctx=n_ctx,
+                logits_all=logits_all,
+                verbose=False,
+                **params,
+            )
+            handle = ModelHandle(llm, path, fingerprint, logits_all, n_ctx)
+            _handles[(fingerprint, n_ctx)] = handle
+        else:
+            if logits_all and not handle.logits_all:
+                logger.warning("%s was loaded without logits_all, speculative decoding is off for it", handle.model_path.name)
+            if Path(model_path).resolve() != handle.model_path:
+                logger.info("%s is the same model as %s, sharing it", Path(model_path).name, handle.model_path.name)
+        return handle
+
+def get_tokenizer(model_path) -> "Llama":
+    """
+    Vocab-only Llama for `model_path`: reads the GGUF's tokenizer metadata, maps no weights
+    and allocates no context. Tokenizes exactly like the full model (see DB_token_cost.verify_tokenizer).
+    """
+    with _registry_lock:
+        fingerprint = model_fingerprint(model_path)
+        tokenizer = _tokenizers.get(fingerprint)
+        if tokenizer is None:
+            from llama_cpp import Llama
+            path = Path(model_path).resolve()
+            logger.info("Loading vocab of %s (%s)", path.name, fingerprint[:12])
+            tokenizer = Llama(model_path=str(path), vocab_only=True, verbose=False)
+            _tokenizers[fingerprint] = tokenizer
+        return tokenizer
+
+def loaded_models() -> Dict[Tuple[str, int], ModelHandle]:
+    """
+    Snapshot of what is resident, keyed by (fingerprint, n_ctx).
+    """
+    with _registry_lock:
+        return dict(_handles)
@@ -0,0 +1,78 @@
+# services.llm_scheduler.py
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from services.llm_cancel import CancelToken, Cancelled, check, PROBE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+"""
+Inference scheduler.
+One generation runs at a time (one GPU/CPU, and story and GM usually share a single context) - except
+background work on a backend that decodes several sequences in one batch (LLMBackend.parallel, e.g. a
+llama-server with --parallel): up to `width` background generations hold the slot together.
+Whoever waits with the highest priority goes next:
+    - INTERACTIVE: what the player is waiting for (story writers, GM evaluation)
+    - BACKGROUND: memory bookkeeping (summaries, tags)
+A running background generation checks at every token whether an interactive request is waiting and,
+if so, gives up its slot (see llm_inference._run_background). It can't pause in place - the interactive
+call reuses the context/KV - so it is started again once the interactive work is done.
+"""
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class Scheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._running = 0
+        self._running_priority: Optional[int] = None
+        self._waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+
+    def _blocked(self, priority: int, width: int) -> bool:
+        # caller holds _cond
+        if any(n for p, n in self._waiting.items() if p < priority):
+            return True
+        return self._running > 0 and (self._running_priority != priority or self._running >= width)
+
+    @contextmanager
+    def slot(self, priority: int, cancel: Optional[CancelToken] = None, width: int = 1):
+        """
+        Hold the inference slot for the duration of the block, shared with at most width - 1
+        other holders of the same priority. A cancelled request stops waiting for it (Cancelled).
+        """
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while self._blocked(priority, width):
+                    check(cancel)
+                    self._cond.wait(timeout=None if cancel is None else PROBE_INTERVAL)
+                check(cancel)
+            except Cancelled:
+                # lower priorities may have been waiting on us
+                self._cond.notify_all()
+                raise
+            finally:
+                self._waiting[priority] -= 1
+            self._running += 1
+            self._running_priority = priority
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                if not self._running:
+                    self._running_priority = None
+                self._cond.notify_all()
+
+    def interactive_waiting(self) -> bool:
+        """
+        True while an interactive request waits for the slot - the cue for background work to yield.
+        """
+        with self._cond:
+            return self._waiting[INTERACTIVE] > 0
+
+SCHEDULER = Scheduler()
@@ -0,0 +1,133 @@
+# services.llm_session.py
+
+import ctypes
+import logging
+from typing import List, Optional
+
+import llama_cpp
+
+from services.llm_registry import ModelHandle
+
+logger = logging.getLogger(__name__)
+
+"""
+KV side of the story sessions (story_session, Config.STORY_SESSION) on the llama_cpp backend.
+A handle has a single context, the writers ("session" in PERSONAS) each own a session in it: the one
+that ran last is live in the context. Before another persona evaluates on it the live sequence is parked -
+its KV cells copied into RAM (llama_state_seq_get_data) - and the writer's next call restores it instead of
+evaluating its prompt again. Llama.generate then keeps the longest common prefix as usual, only the new
+paragraph and the tail are decoded.
+A second context per writer would keep both sequences resident, but every Llama in llama-cpp-python
+maps its own copy of the weights.
+When story_session drops the oldest paragraphs (context full) the paragraphs that stay are moved down over
+the gap (llama_memory_seq_add) instead of being evaluated again.
+"""
+
+# tokens of the new prompt past the common prefix that must be found in the old sequence for a shift
+SHIFT_PROBE = 16
+
+# llama-cpp-python surface this relies on, checked against 0.3.16 (requirements.txt): the llama.h bindings below
+# and Llama.ctx / input_ids / n_tokens - no private Llama attributes. Without the sequence state calls there are
+# no sessions (every call evaluates its prompt), without the memory calls no shift (the tail is evaluated again).
+# Logits are never restored: Llama.generate matches the prefix against all but the last prompt token, so that
+# one is always evaluated again.
+_SEQ_API = all(hasattr(llama_cpp, name) for name in (
+    "llama_state_seq_get_size", "llama_state_seq_get_data", "llama_state_seq_set_data",
+    "llama_get_memory", "llama_memory_clear", "llama_memory_seq_rm",
+))
+_SHIFT_API = _SEQ_API and all(hasattr(llama_cpp, name) for name in ("llama_memory_can_shift", "llama_memory_seq_add"))
+
+def enter(handle: ModelHandle, session: Optional[str], prompt_tokens: List[int]) -> bool:
+    """
+    Ready the context for a call of `session` (None: not a session call). Caller holds handle.lock.
+    True if the session's sequence is in the context: there is no prefix to load on top of it.
+    """
+    if not _SEQ_API:
+        return False
+    live = handle.session
+    if live is not None and live["name"] != session:
+        _park(handle)
+        live = None
+    if session is None:
+        return False
+
+    if live is not None:
+        resumed, n_prompt = True, live["n_prompt"]
+    else:
+        parked = handle.parked.pop(session, None)
+        resumed = parked is not None and _restore(handle, parked)
+        n_prompt = parked["n_prompt"] if resumed else 0
+    if resumed:
+        _shift(handle, session, prompt_tokens, n_prompt)
+    handle.session = {"name": session, "n_prompt": len(prompt_tokens)}
+    return resumed
+
+def _park(handle: ModelHandle) -> None:
+    llm = handle.llm
+    live, handle.session = handle.session, None
+    size = llama_cpp.llama_state_seq_get_size(llm.ctx, 0)
+    state = (ctypes.c_uint8 * size)()
+    if llama_cpp.llama_state_seq_get_data(llm.ctx, state, size, 0) != size:
+        logger.warning("%s session could not be parked, it starts over", live["name"])
+        return
+    handle.parked[live["name"]] = {
+        "tokens": list(llm.input_ids[:llm.n_tokens]),
+        "state": state,
+        "n_prompt": live["n_prompt"],
+    }
+    logger.info("%s session parked: %s tokens, %.1f MB", live["name"], llm.n_tokens, size / 2**20)
+
+def _restore(handle: ModelHandle, parked: dict) -> bool:
+    llm = handle.llm
+    # whatever the other persona left in the context goes, the parked sequence replaces it
+    llama_cpp.llama_memory_clear(llama_cpp.llama_get_memory(llm.ctx), True)
+    state = parked["state"]
+    if not llama_cpp.llama_state_seq_set_data(llm.ctx, state, len(state), 0):
+        logger.warning("session restore failed, evaluating its prompt")
+        llm.reset()
+        return False
+    tokens = parked["tokens"]
+    llm.input_ids[:len(tokens)] = tokens
+    llm.n_tokens = len(tokens)
+    return True
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+def _shift(handle: ModelHandle, session: str, prompt_tokens: List[int], n_prompt: int) -> None:
+    """
+    Paragraphs dropped from the front of the block: the new prompt leaves the old one after the common
+    prefix h and picks it up again d tokens later. Remove [h, h+d) and move the rest d positions down,
+    so the common prefix covers the kept paragraphs as well.
+    Only matched inside the old prompt (n_prompt tokens): the generated tokens after it are no paragraph yet.
+    """
+    llm = handle.llm
+    old = list(llm.input_ids[:llm.n_tokens])
+    h = _common_prefix(old, prompt_tokens)
+    probe = prompt_tokens[h:h + SHIFT_PROBE]
+    if len(probe) < SHIFT_PROBE or h >= n_prompt:
+        return
+    for start in range(h + 1, n_prompt - SHIFT_PROBE + 1):
+        if old[start:start + SHIFT_PROBE] == probe:
+            break
+    else:
+        return
+    if not _SHIFT_API:
+        return
+    memory = llama_cpp.llama_get_memory(llm.ctx)
+    if not llama_cpp.llama_memory_can_shift(memory):
+        return
+    d = start - h
+    if not llama_cpp.llama_memory_seq_rm(memory, 0, h, start):
+        return
+    llama_cpp.llama_memory_seq_add(memory, 0, start, -1, -d)
+    kept = old[:h] + old[start:]
+    llm.input_ids[:len(kept)] = kept
+    llm.n_tokens = len(kept)
+    logger.info("%s session shifted: %s tokens dropped, %s reused", session, d,
+                h + _common_prefix(old[start:], prompt_tokens[h:]))
@@ -0,0 +1,127 @@
+# services.llm_speculative.py
+
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+from llama_cpp.llama_speculative import LlamaDraftModel
+
+from services.llm_config import Config
+from services.llm_registry import ModelHandle, get_model, model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+"""
+Speculative decoding for the story writers.
+A small draft model (Config.DRAFT_MODEL_PATH, same tokenizer family as MODEL_PATH) greedily proposes the
+next Config.DRAFT_TOKENS tokens; llama-cpp-python evaluates them on the story model in one batch and keeps
+them as long as the story model samples the very same token (Llama.generate). Every token is still sampled by the
+story model from its own distribution - the output follows the same distribution as without a draft (with greedy
+decoding: the very same text), the story model just decodes in batches. The writers sample (TEMPERATURE=0.32), so
+a run with a draft is a different draw than one without. Works best at low temperature: the draft agrees more often.
+
+Acceptance is measured from the token ids llama-cpp-python hands back on the next round: the part of the
+previous proposal the story model kept. The proposal of the last round of a call is never verified and not counted.
+"""
+
+class DraftModel(LlamaDraftModel):
+    """
+    Greedy proposals from a resident draft Llama, with its own context kept in sync with the story model's.
+    The draft handle's lock is held while proposing: the same GGUF may serve another persona or caller.
+    """
+    def __init__(self, handle: ModelHandle, n_draft: int):
+        self.handle = handle
+        self.n_draft = n_draft
+        self._proposal: List[int] = []
+        self._proposal_at = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def begin(self) -> None:
+        self._proposal = []
+        self._proposal_at = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def stats(self) -> Tuple[int, int]:
+        """
+        (drafted, accepted) tokens of the current call, verified rounds only.
+        """
+        return self.drafted, self.accepted
+
+    def _score(self, ids: List[int]) -> None:
+        # ids = what the story model has accepted so far (+ the token it sampled itself)
+        if not self._proposal:
+            return
+        kept = 0
+        for a, b in zip(self._proposal, ids[self._proposal_at:]):
+            if a != b:
+                break
+            kept += 1
+        self.drafted += len(self._proposal)
+        self.accepted += kept
+
+    def __call__(self, input_ids, /, **kwargs):
+        ids = input_ids.tolist()
+        self._score(ids)
+
+        with self.handle.lock:
+            llm = self.handle.llm
+            n = min(self.n_draft, llm.n_ctx() - len(ids) - 1)
+            if n <= 0:
+                self._proposal = []
+                return np.array([], dtype=np.intc)
+
+            # reuse what the draft context already shares with the story; at least one token is evaluated for fresh logits
+            shared = 0
+            for a, b in zip(llm.input_ids[:llm.n_tokens], ids):
+                if a != b:
+                    break
+                shared += 1
+            llm.n_tokens = min(shared, len(ids) - 1)
+            llm.eval(ids[llm.n_tokens:])
+
+            proposal = []
+            eos = llm.token_eos()
+            for i in range(n):
+                token = llm.sample(temp=0.0)
+                if token == eos:
+                    break
+                proposal.append(token)
+                if i < n - 1:
+                    llm.eval([token])
+
+        self._proposal = proposal
+        self._proposal_at = len(ids)
+        return np.array(proposal, dtype=np.intc)
+
+_draft: Optional[DraftModel] = None
+_draft_failed = False
+_draft_lock = threading.Lock()
+
+def get_draft_model(target: ModelHandle) -> Optional[DraftModel]:
+    """
+    The draft model for `target`, loaded on first use. None when speculative decoding is off or unusable:
+    no DRAFT_MODEL_PATH, the draft is the target itself, or the vocabularies differ.
+    """
+    global _draft, _draft_failed
+    if not Config.DRAFT_MODEL_PATH or _draft_failed:
+        return None
+    with _draft_lock:
+        if _draft is None:
+            try:
+                if model_fingerprint(Config.DRAFT_MODEL_PATH) == target.fingerprint:
+                    raise ValueError("DRAFT_MODEL_PATH is the story model itself")
+                handle = get_model(Config.DRAFT_MODEL_PATH)
+                # proposals are token ids of the story vocabulary - the draft must tokenize the same way
+                if (handle.llm.n_vocab() != target.llm.n_vocab()
+                        or handle.llm.token_eos() != target.llm.token_eos()
+                        or handle.llm.token_bos() != target.llm.token_bos()):
+                    raise ValueError(f"{handle.model_path.name} does not share the story model's vocabulary")
+            except Exception:
+                logger.exception("draft model unusable, speculative decoding disabled")
+                _draft_failed = True
+                return None
+            _draft = DraftModel(handle, Config.DRAFT_TOKENS)
+        return _draft
@@ -0,0 +1,184 @@
+# services.llm_supervisor.py
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from services.llm_config import Config
+from services.llm_cancel import CancelToken, Cancelled
+
+logger = logging.getLogger(__name__)
+
+"""
+Supervision of backend calls (llm_inference wraps every generation in it).
+    - timeout per persona ("timeout" in PERSONAS): the attempt is cancelled like a client abort
+      (llm_cancel, llama-cli gets killed) and counts as a failure
+    - bounded retries with backoff (Config.LLM_RETRIES, Config.LLM_RETRY_BACKOFF doubled per retry);
+      a stream is only retried as long as it hasn't yielded anything
+    - circuit breaker over the backend: after Config.BREAKER_FAILURES calls in a row failed for good,
+      calls fail fast with BackendUnavailable for Config.BREAKER_COOLDOWN seconds, then one trial call decides
+Cancelled (the caller gave up) is passed through untouched and says nothing about the backend's health.
+app.py turns InferenceError into a JSON error response (503 for BackendUnavailable).
+"""
+
+class InferenceError(Exception):
+    """
+    A generation failed for good (after retries). `kind` names the failure for the JSON response.
+    """
+    kind = "inference_failed"
+    status = 502
+
+    def __init__(self, message: str, persona: Optional[str] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.persona = persona
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        body = {"error": self.kind, "message": str(self)}
+        if self.persona:
+            body["persona"] = self.persona
+        if self.retry_after is not None:
+            body["retry_after"] = round(self.retry_after, 1)
+        return body
+
+class InferenceTimeout(InferenceError):
+    kind = "inference_timeout"
+    status = 504
+
+class BackendUnavailable(InferenceError):
+    kind = "backend_unavailable"
+    status = 503
+
+class CircuitBreaker:
+    """
+    closed -> (BREAKER_FAILURES failures in a row) -> open -> (BREAKER_COOLDOWN) -> half-open: one trial call
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    def check(self, persona: Optional[str] = None, claim: bool = True) -> None:
+        """
+        Raise BackendUnavailable while open. In half-open state one caller gets through
+        (another one if the trial hasn't reported back within a cooldown, e.g. it was cancelled).
+        claim=False only looks: it doesn't take the trial call.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            remaining = Config.BREAKER_COOLDOWN - (now - self._opened_at)
+            if remaining <= 0 and (self._trial_at is None or now - self._trial_at >= Config.BREAKER_COOLDOWN):
+                if claim:
+                    self._trial_at = now
+                    logger.info("circuit breaker half-open, trial call for %s", persona)
+                return
+            raise BackendUnavailable(
+                f"LLM backend unavailable after {self._failures} failed calls",
+                persona, retry_after=max(remaining, 1.0),
+            )
+
+    def success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("circuit breaker closed")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_at = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_at is not None or (self._opened_at is None and self._failures >= Config.BREAKER_FAILURES):
+                logger.error("circuit breaker open: %s failed calls in a row", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_at = None
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"open": self._opened_at is not None, "failures": self._failures}
+
+BREAKER = CircuitBreaker()
+
+def _attempt_token(persona: str, params: Dict[str, Any], cancel: Optional[CancelToken]) -> CancelToken:
+    timeout = params.get("timeout")
+    deadline = time.monotonic() + timeout if timeout else None
+    return CancelToken(persona, parent=cancel, deadline=deadline)
+
+def _failed(persona: str, attempt: int, error: BaseException, cancel: Optional[CancelToken]) -> bool:
+    """
+    Log a failed attempt; True if another one is due (after the backoff).
+    """
+    if attempt > Config.LLM_RETRIES:
+        return False
+    delay = Config.LLM_RETRY_BACKOFF * (2 ** (attempt - 1))
+    logger.warning("%s attempt %s failed (%s: %s), retrying in %.1fs", persona, attempt, type(error).__name__, error, delay)
+    if cancel is not None:
+        cancel.sleep(delay)
+    else:
+        time.sleep(delay)
+    return True
+
+def _give_up(persona: str, error: BaseException) -> InferenceError:
+    BREAKER.failure()
+    if isinstance(error, InferenceError):
+        return error
+    return InferenceError(f"{type(error).__name__}: {error}", persona)
+
+def supervised(persona: str, params: Dict[str, Any], call: Callable[[CancelToken], str],
+               cancel: Optional[CancelToken] = None) -> str:
+    """
+    Run call(attempt_token) under timeout, retries and the circuit breaker.
+    """
+    BREAKER.check(persona)
+    attempt = 0
+    while True:
+        attempt += 1
+        token = _attempt_token(persona, params, cancel)
+        try:
+            result = call(token)
+        except Cancelled:
+            if cancel is not None and cancel.cancelled:
+                raise
+            error = InferenceTimeout(f"{persona} timed out after {params.get('timeout')}s", persona)
+        except Exception as e:
+            error = e
+        else:
+            BREAKER.success()
+            return result
+        if not _failed(persona, attempt, error, cancel):
+            raise _give_up(persona, error) from (None if isinstance(error, InferenceError) else error)
+
+def supervised_stream(persona: str, params: Dict[str, Any], stream: Callable[[CancelToken], Iterator[str]],
+                      cancel: Optional[CancelToken] = None) -> Iterator[str]:
+    """
+    Like supervised() for a stream of pieces. Once a piece went out a failure is final:
+    the caller already has half a paragraph.
+    """
+    BREAKER.check(persona)
+    attempt = 0
+    while True:
+        attempt += 1
+        token = _attempt_token(persona, params, cancel)
+        started = False
+        pieces = stream(token)
+        try:
+            for piece in pieces:
+                started = True
+                yield piece
+        except Cancelled:
+            if cancel is not None and cancel.cancelled:
+                raise
+            error = InferenceTimeout(f"{persona} timed out after {params.get('timeout')}s", persona)
+        except Exception as e:
+            error = e
+        else:
+            BREAKER.success()
+            return
+        finally:
+            pieces.close()
+        if started or not _failed(persona, attempt, error, cancel):
+            raise _give_up(persona, error) from (None if isinstance(error, InferenceError) else error)
@@ -2,13 +2,14 @@
 
 import sqlite3
 from typing import Tuple
-from services.DB_token_cost import update_story_parameters_cost, update_system_prompt_costs, count_tokens
+from services.DB_token_cost import update_story_parameters_cost, update_system_prompt_costs
 from services.DB_access_pipeline import connect
 from services.prompt_builder_memory_mid import build_mid_memory
 from services.prompt_builder_memory_long import build_long_memory
 from services.prompt_builder_indent_helper import indent_one, indent_three, indent_two
 from services.llm_config import GlobalVars, Config
 from services.prompts_kickoffs import Kickoffs
+from services.prompt_builder_segments import StructuredPrompt, SYSTEM, USER, STATIC, STORY, TURN
 
 LOG_DIR  = GlobalVars.log_folder
 LOG_FILE = 'evaluate_action.log'
@@ -96,44 +97,50 @@ def get_eval_player_action_prompts() -> Tuple[str, str]:
     ind_mid_memory = indent_three(mid_memory)
 
     # System prompt assembly
-    system_segments = [
-        eval_system,
-        ruleset,
-        eval_sheet,
-        rules_hc, ind_rules_pre, ind_rules,
-        world_hc, ind_world_pre, ind_world,
-        ind_prepend_chars, ind_chars,
-        ind_prepend_player, ind_player,
-        ind_prepend_long, ind_long_memory,
-        ind_prepend_mid, ind_mid_memory
-    ]
-    system_prompt = "\n\n".join(filter(None, system_segments))
+    # (already stable first; the difficulty ruleset stays ahead of the sheet, they are numbered 1.5 and 1.6)
+    prompt = StructuredPrompt()
+    prompt.add(SYSTEM, STATIC, "eval_system", eval_system)
+    prompt.add(SYSTEM, STORY, "ruleset", ruleset)
+    prompt.add(SYSTEM, STATIC, "eval_sheet", eval_sheet)
+    prompt.add(SYSTEM, STATIC, "rules_hardcode", rules_hc)
+    prompt.add(SYSTEM, STATIC, "prepend_rules", ind_rules_pre)
+    prompt.add(SYSTEM, STORY, "rules", ind_rules)
+    prompt.add(SYSTEM, STATIC, "world_setting_hardcode", world_hc)
+    prompt.add(SYSTEM, STATIC, "prepend_world_setting", ind_world_pre)
+    prompt.add(SYSTEM, STORY, "world_setting", ind_world)
+    prompt.add(SYSTEM, STATIC, "prepend_characters", ind_prepend_chars)
+    prompt.add(SYSTEM, STORY, "characters", ind_chars)
+    prompt.add(SYSTEM, STATIC, "prepend_player", ind_prepend_player)
+    prompt.add(SYSTEM, STORY, "player", ind_player)
+    prompt.add(SYSTEM, STATIC, "long_memory_hardcode", ind_prepend_long)
+    prompt.add(SYSTEM, TURN, "long_memory", ind_long_memory)
+    prompt.add(SYSTEM, STATIC, "mid_memory_hardcode", ind_prepend_mid)
+    prompt.add(SYSTEM, TURN, "mid_memory", ind_mid_memory)
 
     # User prompt assembly
-    # kickoff
-    kickoff = Kickoffs.eval_kickoff
-
-    # most recent paragraph (highest id)
+    # kickoff + most recent paragraph (highest id)
     recent_para = rows[0] if rows else None
     action_text = f"<Evaluate>{recent_para['content']}</Evaluate>"
+    prompt.add(USER, STATIC, "kickoff", Kickoffs.eval_kickoff)
+    prompt.add(USER, TURN, "action", action_text)
 
-    user_prompt = "\n\n".join([kickoff, action_text])
-
-    # We can only now choose memories, because token cost was undetermined before:
-    combined_prompt = f"{system_prompt}\n\n{user_prompt}"
-    tc = count_tokens(combined_prompt)
+    # We can only now choose memories, because token cost was undetermined before
+    # (summed per segment: only the memories and the action are new to the token count cache)
+    tc = prompt.tokens()
 
     # Append system prompt with recent memories (respect token budget)
     recent_memories = _choose_memories(tc)
-    ind_recent_memories = indent_two(recent_memories)
-    system_prompt = f"{system_prompt}\n\n{ind_recent_memories}"
+    prompt.add(SYSTEM, TURN, "recent_memories", indent_two(recent_memories))
+    system_prompt, user_prompt = prompt.render()
 
     # Log both prompts
     with open(log_path, 'w', encoding='utf-8') as log_f:
         log_f.write("=== SYSTEM PROMPT ===\n")
         log_f.write(system_prompt + "\n\n")
         log_f.write("=== USER PROMPT ===\n")
-        log_f.write(user_prompt + "\n")
+        log_f.write(user_prompt + "\n\n")
+        log_f.write("=== SEGMENTS ===\n")
+        log_f.write(prompt.describe() + "\n")
 
     return system_prompt, user_prompt
 
@@ -0,0 +1,85 @@
+# services.prompt_builder_segments.py
+
+from typing import List, Optional, Tuple
+
+from services.DB_token_cost import count_tokens
+
+"""
+Structured prompts.
+The builders assemble their prompts from ordered segments, each tagged with how often it changes:
+    STATIC - fixed text: system instructions, hardcodes, prepend labels, memory headers, kickoffs
+    STORY  - the story's settings: user story parameters, writing style, difficulty
+    TURN   - changes from call to call: memories, recent paragraphs, outcomes, the evaluated action
+Segments of a role are joined with "\n\n" and empty ones skipped, the layout the builders always had.
+Order them stable first: llama.cpp (and llm_prefix_cache) reuse the KV cache up to the first token that
+changed, so a turn should only change segments after the last STORY one.
+Token counts come per segment from count_tokens, memoized per text: a segment that didn't change since
+the last call is not tokenized again.
+"""
+
+STATIC = "static"
+STORY = "story"
+TURN = "turn"
+
+SYSTEM = "system"
+USER = "user"
+
+SEPARATOR = "\n\n"
+
+class PromptSegment:
+    def __init__(self, role: str, tier: str, name: str, text: str):
+        self.role = role
+        self.tier = tier
+        self.name = name
+        self.text = text
+
+    @property
+    def tokens(self) -> int:
+        return count_tokens(self.text)
+
+class StructuredPrompt:
+    """
+    Ordered segments of a system + user prompt.
+    """
+    def __init__(self):
+        self.segments: List[PromptSegment] = []
+
+    def add(self, role: str, tier: str, name: str, text: Optional[str]) -> None:
+        if text:
+            self.segments.append(PromptSegment(role, tier, name, text))
+
+    def text(self, role: str) -> str:
+        return SEPARATOR.join(s.text for s in self.segments if s.role == role)
+
+    def render(self) -> Tuple[str, str]:
+        """
+        (system_prompt, user_prompt)
+        """
+        return self.text(SYSTEM), self.text(USER)
+
+    def tokens(self, role: Optional[str] = None) -> int:
+        """
+        Token count of the rendered prompt (one role or both) from the segment counts,
+        a separator counted as one token.
+        """
+        segments = [s for s in self.segments if role is None or s.role == role]
+        return sum(s.tokens for s in segments) + max(0, len(segments) - 1)
+
+    def stable_tokens(self) -> int:
+        """
+        Tokens before the first TURN segment: what a new turn leaves in the KV cache.
+        """
+        n = 0
+        for segment in self.segments:
+            if segment.tier == TURN:
+                break
+            n += segment.tokens + 1
+        return n
+
+    def describe(self) -> str:
+        """
+        One line per segment (role, tier, tokens, name) for the prompt logs.
+        """
+        lines = [f"{s.role:<6} {s.tier:<6} {s.tokens:>6}  {s.name}" for s in self.segments]
+        lines.append(f"stable prefix: {self.stable_tokens()} of {self.tokens()} tokens")
+        return "\n".join(lines)
@@ -1,20 +1,26 @@
 # services.prompt_builder_story_continue.py
 
 import sqlite3
-from typing import Tuple
+from typing import List, Optional, Tuple
 from services.llm_config import GlobalVars
 from services.DB_access_pipeline import connect
 from services.prompts_kickoffs import Kickoffs
 from services.prompt_builder_memory_mid import build_mid_memory
 from services.prompt_builder_memory_long import build_long_memory
 from services.prompt_builder_indent_helper import indent_one, indent_two, indent_three
+from services.prompt_builder_segments import StructuredPrompt, SYSTEM, USER, STATIC, STORY, TURN
 
 LOG_DIR  = GlobalVars.log_folder
 LOG_FILE = 'story_continue.log'
 
-def get_story_continue_prompts() -> Tuple[str, str]:
-    log_path = LOG_DIR / LOG_FILE
+RECENT_HEADER = "Here is what happened recently (short term memory):"
 
+def _story_continue_frame() -> StructuredPrompt:
+    """
+    The system prompt and the head of the user prompt: story parameters and memories.
+    Stable first: the system prompt is static + writing style, the memories follow the
+    user story parameters so a new turn leaves both cached.
+    """
     # Start DB data gathering
     conn = connect(readonly=True)
     try:
@@ -71,22 +77,32 @@ def get_story_continue_prompts() -> Tuple[str, str]:
     ind_mid_hc = indent_one(mid_memory_hc)
     ind_mid = indent_three(mid_memory)
 
-    system_segments = [
-        story_continue,
-        chars_hc,
-        player_hc,
-        rules_hc,
-        world_hc,
-        style_hc,
-        style,
-        ind_long_hc,
-        ind_long,
-        ind_mid_hc,
-        ind_mid,
-    ]
-    system_prompt = "\n\n".join(filter(None, system_segments))
-
-    # Load story paragraphs
+    prompt = StructuredPrompt()
+    prompt.add(SYSTEM, STATIC, "system_prompt", story_continue)
+    prompt.add(SYSTEM, STATIC, "characters_hardcode", chars_hc)
+    prompt.add(SYSTEM, STATIC, "player_hardcode", player_hc)
+    prompt.add(SYSTEM, STATIC, "rules_hardcode", rules_hc)
+    prompt.add(SYSTEM, STATIC, "world_setting_hardcode", world_hc)
+    prompt.add(SYSTEM, STATIC, "writing_style_hardcode", style_hc)
+    prompt.add(SYSTEM, STORY, "writing_style", style)
+
+    # Collect user segments
+    prompt.add(USER, STATIC, "prepend_characters", prepend_chars)
+    prompt.add(USER, STORY, "characters", indent_one(chars))
+    prompt.add(USER, STATIC, "prepend_player", prepend_player)
+    prompt.add(USER, STORY, "player", indent_one(player))
+    prompt.add(USER, STATIC, "prepend_rules", prepend_rules)
+    prompt.add(USER, STORY, "rules", indent_one(rules))
+    prompt.add(USER, STATIC, "prepend_world_setting", prepend_world_setting)
+    prompt.add(USER, STORY, "world_setting", indent_one(world))
+
+    prompt.add(USER, STATIC, "long_memory_hardcode", ind_long_hc)
+    prompt.add(USER, TURN, "long_memory", ind_long)
+    prompt.add(USER, STATIC, "mid_memory_hardcode", ind_mid_hc)
+    prompt.add(USER, TURN, "mid_memory", ind_mid)
+    return prompt
+
+def _load_paragraphs() -> List[sqlite3.Row]:
     conn = connect(readonly=True)
     try:
         conn.row_factory = sqlite3.Row
@@ -96,11 +112,14 @@ def get_story_continue_prompts() -> Tuple[str, str]:
               FROM story_paragraphs
              ORDER BY id
         """)
-        rows = cur.fetchall()
+        return cur.fetchall()
     finally:
         conn.close()
 
-    # Select recent paragraphs
+def _select_recent(rows: List[sqlite3.Row]) -> List[sqlite3.Row]:
+    """
+    The newest paragraphs within the recent paragraphs budget, oldest first.
+    """
     max_recent = GlobalVars.tc_budget_recent_paragraphs
     selected, acc = [], 0
     for row in reversed(rows):
@@ -110,61 +129,88 @@ def get_story_continue_prompts() -> Tuple[str, str]:
         selected.append(row)
         acc += cost
     selected.reverse()
+    return selected
+
+def _wrap(row: sqlite3.Row) -> str:
+    text = row["content"].strip()
+    if row["story_id"] == "continue_with_UserAction":
+        text = f"<PlayerAction>{text}</PlayerAction>"
+    return text
+
+def _resolving_outcome(selected: List[sqlite3.Row]) -> Optional[str]:
+    """
+    The outcome of the last PlayerAction, if exactly one non-PlayerAction paragraph follows it and ends the block.
+    """
+    if (
+            len(selected) >= 2 and
+            selected[-2]["story_id"] == "continue_with_UserAction" and
+            selected[-1]["story_id"] != "continue_with_UserAction" and
+            selected[-2]["outcome"]
+    ):
+        return selected[-2]["outcome"].strip()
+    return None
+
+def _log_prompts(system_prompt: str, user_prompt: str, prompt: StructuredPrompt) -> None:
+    log_path = LOG_DIR / LOG_FILE
+    with open(log_path, 'w', encoding='utf-8') as log_f:
+        log_f.write("=== SYSTEM PROMPT ===\n")
+        log_f.write(system_prompt + "\n\n")
+        log_f.write("=== USER PROMPT ===\n")
+        log_f.write(user_prompt + "\n\n")
+        log_f.write("=== SEGMENTS ===\n")
+        log_f.write(prompt.describe() + "\n")
 
-    # Identify the last PlayerAction in the selected block
-    last_playeraction_index = None
-    for idx in range(len(selected) - 1, -1, -1):
-        if selected[idx]["story_id"] == "continue_with_UserAction":
-            last_playeraction_index = idx
-            break
+def build_story_continue_prompt() -> StructuredPrompt:
+    prompt = _story_continue_frame()
+    selected = _select_recent(_load_paragraphs())
 
-    # Build recent block, inserting outcome only if last PlayerAction
-    # is followed by exactly one non-PlayerAction paragraph
-    wrapped_texts = []
-    for idx, r in enumerate(selected):
-        text = r["content"].strip()
-        if r["story_id"] == "continue_with_UserAction":
-            text = f"<PlayerAction>{text}</PlayerAction>"
-            wrapped_texts.append(text)
-
-            if idx == last_playeraction_index and r["outcome"]:
-                # Check if exactly one non-player paragraph follows
-                if (
-                        idx + 1 < len(selected) and
-                        selected[idx + 1]["story_id"] != "continue_with_UserAction" and
-                        idx + 2 == len(selected)  # ensure it's the last element
-                ):
-                    outcome_block = indent_one(r["outcome"].strip())
-                    wrapped_texts.append(outcome_block)
-            continue
-        wrapped_texts.append(text)
+    # Build recent block, inserting the outcome of the last PlayerAction
+    # if exactly one non-PlayerAction paragraph follows it
+    wrapped_texts = [_wrap(r) for r in selected]
+    outcome = _resolving_outcome(selected)
+    if outcome:
+        wrapped_texts.insert(len(wrapped_texts) - 1, indent_one(outcome))
 
     indented_wrapped = [indent_one(text) for text in wrapped_texts]
-    recent_block = "Here is what happened recently (short term memory):\n\n" + "\n\n".join(indented_wrapped)
-    kickoff = Kickoffs.continue_kickoff
-    indent_recent = indent_one(recent_block)
+    recent_block = RECENT_HEADER + "\n\n" + "\n\n".join(indented_wrapped)
 
-    # Collect user segments
-    ind_char = indent_one(chars)
-    ind_player = indent_one(player)
-    ind_rules = indent_one(rules)
-    ind_world = indent_one(world)
-
-    user_segments = [
-        prepend_chars, ind_char,
-        prepend_player, ind_player,
-        prepend_rules, ind_rules,
-        prepend_world_setting, ind_world,
-        indent_recent,
-        kickoff,
-    ]
-    user_prompt = "\n\n".join(filter(None, user_segments))
+    prompt.add(USER, TURN, "recent_paragraphs", indent_one(recent_block))
+    prompt.add(USER, STATIC, "kickoff", Kickoffs.continue_kickoff)
+    return prompt
+
+def get_story_continue_prompts() -> Tuple[str, str]:
+    prompt = build_story_continue_prompt()
+    system_prompt, user_prompt = prompt.render()
 
     # Log both prompts
-    with open(log_path, 'w', encoding='utf-8') as log_f:
-        log_f.write("=== SYSTEM PROMPT ===\n")
-        log_f.write(system_prompt + "\n\n")
-        log_f.write("=== USER PROMPT ===\n")
-        log_f.write(user_prompt + "\n")
+    _log_prompts(system_prompt, user_prompt, prompt)
 
     return system_prompt, user_prompt
+
+def get_story_continue_session_parts(start_id: Optional[int] = None) -> dict:
+    """
+    The same prompts in the append-only layout of story_session: the recent block holds every paragraph
+    from start_id on (None: the recent paragraphs budget decides, like get_story_continue_prompts), one
+    piece per paragraph, and everything that changes from turn to turn goes into the tail - the outcome
+    of the last PlayerAction follows the block instead of sitting inside it.
+    Returns {"system", "head", "paragraphs": [(id, piece)], "tail"}; user prompt = head + pieces + tail.
+    """
+    prompt = _story_continue_frame()
+    rows = _load_paragraphs()
+    selected = _select_recent(rows)
+    if start_id is not None:
+        selected = [row for row in rows if row["id"] >= start_id]
+
+    # indent_one(recent_block) line by line: the "\n\n" between paragraphs becomes "\n\t\n"
+    prompt.add(USER, STATIC, "recent_header", indent_one(RECENT_HEADER))
+    system_prompt, head = prompt.render()
+    paragraphs = [(row["id"], "\n\t\n" + indent_one(indent_one(_wrap(row)))) for row in selected]
+
+    tail = ""
+    outcome = _resolving_outcome(selected)
+    if outcome:
+        tail += "\n\t\n" + indent_one(indent_one(indent_one(outcome)))
+    tail += "\n\n" + Kickoffs.continue_kickoff
+
+    _log_prompts(system_prompt, head + "".join(piece for _, piece in paragraphs) + tail, prompt)
+    return {"system": system_prompt, "head": head, "paragraphs": paragraphs, "tail": tail}
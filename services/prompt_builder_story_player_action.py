@@ -1,7 +1,7 @@
 # services.prompt_builder_player_action.py
 
 import sqlite3
-from typing import Tuple
+from typing import List, Optional, Tuple
 from services.DB_token_cost import update_story_parameters_cost, update_memory_costs, update_system_prompt_costs
 from services.DB_access_pipeline import connect
 from services.prompt_builder_indent_helper import indent_one, indent_three, indent_two
@@ -9,30 +9,88 @@ from services.prompt_builder_memory_mid import build_mid_memory
 from services.prompt_builder_memory_long import build_long_memory
 from services.llm_config import GlobalVars
 from services.prompts_kickoffs import Kickoffs
+from services.prompt_builder_segments import StructuredPrompt, SYSTEM, USER, STATIC, STORY, TURN
 
 LOG_DIR  = GlobalVars.log_folder
 LOG_FILE = 'story_player_action.log'
 
-def get_story_player_action_prompts() -> Tuple[str, str]:
+RECENT_HEADER = "Here is what happened recently (short term memory):"
+
+def build_story_player_action_prompt() -> StructuredPrompt:
     """
-    Fetches and concatenates all the story_player_action prompt components from the SQLite database.
-    Returns:
-      system_prompt: string combining:
-                     system prompt
+    Fetches and assembles all the story_player_action prompt components from the SQLite database.
+      system prompt: system prompt
                      + all hardcode story parameters
                      + writing_style (user)
+      user prompt:   prepend + dynamic characters, player, rules, world setting
                      + long-term memories
                      + mid-term memories
-      user_prompt:   string combining:
-                     prepend + dynamic characters, player, rules,
-                     world setting, and writing style if needed
-                     + relevant tagged paragraphs (recent block)
-                     + story so far (last n paragraphs within budget)
-                     + User attempted action with tag wrap
-                     + Outcome (already tag wrapped, appended at end)
+                     + story so far (last n paragraphs within budget, PlayerActions tag wrapped)
+                     + Outcome of the latest action (already tag wrapped)
+                     + kickoff
     """
-    log_path = LOG_DIR / LOG_FILE
+    prompt = _story_player_action_frame()
+    rows = _load_paragraphs()
+
+    # Prepare recent block with budget
+    selected, latest_outcome = _select_recent(rows)
+
+    # Build the “recent_block” with UserAction wrapping
+    wrapped_texts = [_wrap(r) for r in selected]
+
+    indented_wrapped = [indent_one(text) for text in wrapped_texts]
+
+    recent_block = RECENT_HEADER + "\n\n" + "\n\n".join(indented_wrapped)
+
+    # Append outcome if available
+    if latest_outcome:
+        ind_outcome = indent_two(latest_outcome)
+        recent_block += "\n\n" + ind_outcome
+
+    prompt.add(USER, TURN, "recent_paragraphs", recent_block)
+    prompt.add(USER, STATIC, "kickoff", Kickoffs.action_kickoff)
+    return prompt
+
+def get_story_player_action_prompts() -> Tuple[str, str]:
+    prompt = build_story_player_action_prompt()
+    system_prompt, user_prompt = prompt.render()
+
+    # Log both prompts
+    _log_prompts(system_prompt, user_prompt, prompt)
+
+    return system_prompt, user_prompt
+
+def get_story_player_action_session_parts(start_id: Optional[int] = None) -> dict:
+    """
+    The same prompts in the append-only layout of story_session: the recent block holds every paragraph
+    from start_id on (None: the recent paragraphs budget decides, like get_story_player_action_prompts),
+    one piece per paragraph; the outcome and the kickoff are the tail.
+    Returns {"system", "head", "paragraphs": [(id, piece)], "tail"}; user prompt = head + pieces + tail.
+    """
+    prompt = _story_player_action_frame()
+    rows = _load_paragraphs()
+    selected, latest_outcome = _select_recent(rows)
+    if start_id is not None:
+        selected = [row for row in rows if row["id"] >= start_id]
+
+    prompt.add(USER, STATIC, "recent_header", RECENT_HEADER)
+    system_prompt, head = prompt.render()
+    paragraphs = [(row["id"], "\n\n" + indent_one(_wrap(row))) for row in selected]
 
+    tail = ""
+    if latest_outcome:
+        tail += "\n\n" + indent_two(latest_outcome)
+    tail += "\n\n" + Kickoffs.action_kickoff
+
+    _log_prompts(system_prompt, head + "".join(piece for _, piece in paragraphs) + tail, prompt)
+    return {"system": system_prompt, "head": head, "paragraphs": paragraphs, "tail": tail}
+
+def _story_player_action_frame() -> StructuredPrompt:
+    """
+    The system prompt and the head of the user prompt: story parameters and memories.
+    Stable first: the system prompt is static + writing style, the memories follow the
+    user story parameters so a new turn leaves both cached.
+    """
     # Update token costs in DB
     update_story_parameters_cost()
     update_memory_costs()
@@ -106,23 +164,34 @@ def get_story_player_action_prompts() -> Tuple[str, str]:
     ind_mid = indent_three(mid_memory)
 
     # Assemble system prompt in logical order
-    system_segments = [
-        story_player_action,
-        chars_hc,
-        player_hc,
-        rules_hc,
-        world_hc,
-        style_hc,
-        # user writing style as system
-        style,
-        # memories
-        ind_long_hc,
-        ind_long,
-        ind_mid_hc,
-        ind_mid,
-    ]
-    system_prompt = "\n\n".join(filter(None, system_segments))
-
+    prompt = StructuredPrompt()
+    prompt.add(SYSTEM, STATIC, "system_prompt", story_player_action)
+    prompt.add(SYSTEM, STATIC, "characters_hardcode", chars_hc)
+    prompt.add(SYSTEM, STATIC, "player_hardcode", player_hc)
+    prompt.add(SYSTEM, STATIC, "rules_hardcode", rules_hc)
+    prompt.add(SYSTEM, STATIC, "world_setting_hardcode", world_hc)
+    prompt.add(SYSTEM, STATIC, "writing_style_hardcode", style_hc)
+    # user writing style as system
+    prompt.add(SYSTEM, STORY, "writing_style", style)
+
+    # user values, indented for structure
+    prompt.add(USER, STATIC, "prepend_characters", prepend_chars)
+    prompt.add(USER, STORY, "characters", indent_one(chars))
+    prompt.add(USER, STATIC, "prepend_player", prepend_player)
+    prompt.add(USER, STORY, "player", indent_one(player))
+    prompt.add(USER, STATIC, "prepend_rules", prepend_rules)
+    prompt.add(USER, STORY, "rules", indent_one(rules))
+    prompt.add(USER, STATIC, "prepend_world_setting", prepend_world_setting)
+    prompt.add(USER, STORY, "world_setting", indent_one(world))
+
+    # memories: after everything that only changes with the story
+    prompt.add(USER, STATIC, "long_memory_hardcode", ind_long_hc)
+    prompt.add(USER, TURN, "long_memory", ind_long)
+    prompt.add(USER, STATIC, "mid_memory_hardcode", ind_mid_hc)
+    prompt.add(USER, TURN, "mid_memory", ind_mid)
+    return prompt
+
+def _load_paragraphs() -> List[sqlite3.Row]:
     # Load all story_paragraphs, ordered by id
     conn = connect(readonly=True)
     try:
@@ -133,11 +202,15 @@ def get_story_player_action_prompts() -> Tuple[str, str]:
                       FROM story_paragraphs
                      ORDER BY id
                 """)
-        rows = cur.fetchall()
+        return cur.fetchall()
     finally:
         conn.close()
 
-    # Prepare recent block with budget
+def _select_recent(rows: List[sqlite3.Row]) -> Tuple[List[sqlite3.Row], Optional[str]]:
+    """
+    The newest paragraphs within the recent paragraphs budget (minus the latest outcome), oldest first,
+    and the latest outcome.
+    """
     max_recent = GlobalVars.tc_budget_recent_paragraphs
     selected = []
     acc = 0
@@ -163,52 +236,20 @@ def get_story_player_action_prompts() -> Tuple[str, str]:
 
     # restore original chronological order
     selected.reverse()
+    return selected, latest_outcome
 
-    # Build the “recent_block” with UserAction wrapping
-    wrapped_texts = []
-    for r in selected:
-        text = r["content"].strip()
-        if r["story_id"] == "continue_with_UserAction":
-            text = f"<PlayerAction>{text}</PlayerAction>"
-        wrapped_texts.append(text)
-
-    indented_wrapped = [indent_one(text) for text in wrapped_texts]
-
-    recent_block = (
-            "Here is what happened recently (short term memory):\n\n"
-            + "\n\n".join(indented_wrapped)
-    )
+def _wrap(row: sqlite3.Row) -> str:
+    text = row["content"].strip()
+    if row["story_id"] == "continue_with_UserAction":
+        text = f"<PlayerAction>{text}</PlayerAction>"
+    return text
 
-    # Append outcome if available
-    if latest_outcome:
-        ind_outcome = indent_two(latest_outcome)
-        recent_block += "\n\n" + ind_outcome
-
-    # indent user values for structure
-    ind_chars = indent_one(chars)
-    ind_player = indent_one(player)
-    ind_rules = indent_one(rules)
-    ind_world = indent_one(world)
-
-    # kickoff
-    kickoff = Kickoffs.action_kickoff
-
-    # Collect all user-defined segments
-    user_segments = [
-        prepend_chars, ind_chars,
-        prepend_player, ind_player,
-        prepend_rules, ind_rules,
-        prepend_world_setting, ind_world,
-        recent_block, kickoff
-    ]
-
-    user_prompt = "\n\n".join(filter(None, user_segments))
-
-    # Log both prompts
+def _log_prompts(system_prompt: str, user_prompt: str, prompt: StructuredPrompt) -> None:
+    log_path = LOG_DIR / LOG_FILE
     with open(log_path, 'w', encoding='utf-8') as log_f:
         log_f.write("=== SYSTEM PROMPT ===\n")
         log_f.write(system_prompt + "\n\n")
         log_f.write("=== USER PROMPT ===\n")
-        log_f.write(user_prompt + "\n")
-
-    return system_prompt, user_prompt
\ No newline at end of file
+        log_f.write(user_prompt + "\n\n")
+        log_f.write("=== SEGMENTS ===\n")
+        log_f.write(prompt.describe() + "\n")
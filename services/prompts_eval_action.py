@@ -4,6 +4,89 @@ from services.DB_token_cost import count_tokens
 from services.DB_access_pipeline import write_connection
 from services.DB_difficulty import get_difficulty
 
+import re
+
+"""
+The Outcome block as a grammar: eval_action decodes against it (llm_inference, Config.CONSTRAINED_EVAL),
+so the GM emits exactly one <Outcome> with the fields of the **Outcome Template** (prompts_system) and stops.
+"""
+OUTCOME_JUDGEMENTS = ["Success", "Partial Success", "Failure", "Partial Failure", "Critical Failure", "Impossible Action"]
+
+# field label -> (story_paragraphs column, max characters); the order is the template's
+OUTCOME_FIELDS = {
+    "Judgement": ("outcome_judgement", None),
+    "Effect": ("outcome_effect", 240),
+    "Stat Update": ("outcome_stat_update", 240),
+    "Reasoning": ("outcome_reasoning", 200),
+}
+
+def get_outcome_grammar() -> str:
+    """
+    GBNF for a single Outcome block. Free-text fields are one line, no markup, bounded length.
+    """
+    judgements = " | ".join(f'"{j}"' for j in OUTCOME_JUDGEMENTS)
+    rules = [f"judgement ::= {judgements}"]
+    root = ['"<Outcome>\\n"']
+    for label, (column, max_len) in OUTCOME_FIELDS.items():
+        if max_len is None:
+            root.append(f'"{label}: " judgement "\\n"')
+        else:
+            rule = column.replace("_", "-")
+            rules.append(f"{rule} ::= [^\\n<] [^\\n<]{{0,{max_len - 1}}}")
+            root.append(f'"{label}: " {rule} "\\n"')
+    root.append('"</Outcome>"')
+    return "root ::= " + " ".join(root) + "\n" + "\n".join(rules) + "\n"
+
+# stands in for the free-text fields when the longest Outcome block is measured in tokens
+_OUTCOME_FILLER = "The guard shrugs and steps aside, Stamina (-1, tired), passed Dexterity check; "
+# headroom on the measured block: denser text than the filler, the GM's vocabulary vs. the story model's
+OUTCOME_TOKEN_MARGIN = 1.25
+
+def _longest_outcome() -> str:
+    """
+    The Outcome block at its longest: the longest judgement, every free-text field at its character limit.
+    """
+    lines = ["<Outcome>"]
+    for label, (column, max_len) in OUTCOME_FIELDS.items():
+        if max_len is None:
+            value = max(OUTCOME_JUDGEMENTS, key=len)
+        else:
+            value = (_OUTCOME_FILLER * (max_len // len(_OUTCOME_FILLER) + 1))[:max_len]
+        lines.append(f"{label}: {value}")
+    lines.append("</Outcome>")
+    return "\n".join(lines)
+
+def get_outcome_max_chars() -> int:
+    """
+    Upper bound for a grammar-conform Outcome block in characters - no token is shorter than one.
+    The eval_action cap until the tokenizer is there (get_outcome_max_tokens).
+    """
+    return len(_longest_outcome())
+
+def get_outcome_max_tokens() -> int:
+    """
+    Generation cap for a grammar-conform Outcome block in tokens: the longest block counted (count_tokens)
+    plus OUTCOME_TOKEN_MARGIN. The grammar ends the block on its own; a cap hit cuts the last field short,
+    parse_outcome keeps the others. Loads the vocab-only tokenizer: llm_inference.load_models() applies it.
+    """
+    tokens = count_tokens(_longest_outcome())
+    if not tokens:
+        # no tokenizer (count_tokens reports 0)
+        return get_outcome_max_chars()
+    return int(tokens * OUTCOME_TOKEN_MARGIN) + 1
+
+def parse_outcome(text: str) -> dict:
+    """
+    Split an Outcome block into its fields: column -> value (None if missing).
+    Works on unconstrained output as well, as long as the fields sit on their own lines.
+    """
+    parsed = {column: None for column, _ in OUTCOME_FIELDS.values()}
+    for label, (column, _) in OUTCOME_FIELDS.items():
+        m = re.search(rf"^\s*{label}:\s*(.+?)\s*$", text or "", re.MULTILINE | re.IGNORECASE)
+        if m:
+            parsed[column] = re.sub(r"</?Outcome>", "", m.group(1), flags=re.IGNORECASE).strip() or None
+    return parsed
+
 """
 We galaxy-brain cheat: easy = medium, medium = hard, hard = souls like death-march
 """
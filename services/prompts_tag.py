@@ -1,7 +1,49 @@
 # services.prompts_tag.py
 
+import json
+
 from services.DB_access_pipeline import write_connection
 
+"""
+The tag schema as JSON schema: tag_long/tag_recent decode against it (llm_inference, Config.CONSTRAINED_TAGS),
+so the model can only emit exactly this object. Keep it in line with get_tagging_style() below.
+"""
+TAG_IMPORTANCE = ["Very High", "High", "Medium", "Low", "Very Low"]
+
+TAG_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "location": {"type": "string", "minLength": 1, "maxLength": 60},
+        "character": {"type": "string", "minLength": 1, "maxLength": 120},
+        "importance": {"type": "string", "enum": TAG_IMPORTANCE},
+        "emotion": {"type": "string", "minLength": 1, "maxLength": 80},
+        "state": {"type": "string", "minLength": 1, "maxLength": 160},
+    },
+    "required": ["location", "character", "importance", "emotion", "state"],
+    "additionalProperties": False,
+}
+
+# tokens per character of the longest tag object: a token is at least one byte, a non-ASCII letter two
+# bytes in UTF-8 (byte-fallback vocabularies may spend a token on each)
+TAG_TOKENS_PER_CHAR = 2
+# whitespace the grammar allows around braces, ":" and "," - a newline plus indentation per key
+TAG_WHITESPACE_PER_KEY = 24
+
+def get_tag_max_tokens() -> int:
+    """
+    Generation cap for a schema-conform tag object: its longest serialization (every string at maxLength,
+    the longest enum value) at TAG_TOKENS_PER_CHAR, plus TAG_WHITESPACE_PER_KEY per key.
+    A safety margin, not a hard bound (3-4 byte characters, \\u escapes): the grammar ends the object on its own
+    long before, and an object cut off at the cap is closed by clean_llm_json instead of being lost.
+    """
+    longest = {}
+    for key, spec in TAG_JSON_SCHEMA["properties"].items():
+        if "enum" in spec:
+            longest[key] = max(spec["enum"], key=len)
+        else:
+            longest[key] = "x" * spec["maxLength"]
+    return len(json.dumps(longest)) * TAG_TOKENS_PER_CHAR + len(longest) * TAG_WHITESPACE_PER_KEY
+
 def get_tagging_style():
     return """
     2. **Output a single valid JSON object that exactly matches this schema and nothing else**:
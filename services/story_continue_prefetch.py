@@ -0,0 +1,112 @@
+# services.story_continue_prefetch.py
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from services.llm_config import Config
+from services.llm_config_helper import generation_cleaner
+from services.llm_inference import generate_stream
+from services.llm_scheduler import SCHEDULER, BACKGROUND
+from services.story_session import get_writer_prompts
+from services.DB_access_pipeline import connect, write_version
+from services.summarize_jobs import summarize_idle
+
+logger = logging.getLogger(__name__)
+
+"""
+Idle-time pre-generation of the next "Continue" paragraph (opt-in: Config.PREFETCH_CONTINUE).
+While the player reads, the model has nothing to do once the summarize jobs are through. We generate the
+story_continue paragraph the next Continue click would ask for and keep it as a pending candidate,
+tagged with the DB write version (DB_access_pipeline.write_version) its prompts were built from.
+story_continue serves it instead of generating when the version still matches - any write in between
+(player action, persist_user_edit, parameter update, a new summary, ...) makes it stale.
+    - runs at BACKGROUND priority and gives up the moment an interactive call waits or the DB changes
+    - nothing is persisted until the player actually clicks Continue
+"""
+
+_candidate: Optional[dict] = None   # {"version", "text", "system", "user"}
+_candidate_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+
+def take_prefetched() -> Optional[dict]:
+    """
+    The pre-generated continue output if it is still current, else None:
+    {"text": raw, like generate() returns it, "system", "user": the prompts it was generated from}.
+    A candidate is handed out once.
+    """
+    global _candidate
+    with _candidate_lock:
+        candidate, _candidate = _candidate, None
+    if candidate is None:
+        return None
+    if candidate["version"] != write_version():
+        logger.info("prefetched continue discarded, the story changed since")
+        return None
+    return {key: candidate[key] for key in ("text", "system", "user")}
+
+def start_prefetch_worker():
+    """
+    Start the prefetch thread (once), if enabled.
+    """
+    global _worker
+    if not Config.PREFETCH_CONTINUE:
+        return
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=_work, name="continue_prefetch", daemon=True)
+        _worker.start()
+
+def _work():
+    last_seen = write_version()
+    attempted = None
+    while True:
+        time.sleep(Config.PREFETCH_IDLE_SECONDS)
+        version = write_version()
+        # still writing (turn in progress, summaries landing): wait until it's quiet
+        if version != last_seen:
+            last_seen = version
+            continue
+        if version == attempted or not summarize_idle() or not _continue_is_next():
+            continue
+        attempted = version
+        try:
+            _prefetch(version)
+        except Exception:
+            logger.exception("continue prefetch failed")
+
+def _continue_is_next() -> bool:
+    """
+    Only worth it when Continue would run story_continue: there is a story and it doesn't end on a player action.
+    """
+    conn = connect(readonly=True)
+    try:
+        row = conn.execute("SELECT story_id FROM story_paragraphs ORDER BY id DESC LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    return row is not None and row[0] != "continue_with_UserAction"
+
+def _prefetch(version: int):
+    global _candidate
+    system_prompt, user_prompt = get_writer_prompts("story_continue")
+
+    pieces = []
+    stream = generate_stream("story_continue", system_prompt, user_prompt, priority=BACKGROUND)
+    try:
+        for piece in stream:
+            if write_version() != version or SCHEDULER.interactive_waiting():
+                logger.info("continue prefetch abandoned after %s pieces", len(pieces))
+                return
+            pieces.append(piece)
+    finally:
+        stream.close()
+
+    if write_version() != version:
+        return
+    with _candidate_lock:
+        _candidate = {"version": version, "text": generation_cleaner("".join(pieces)),
+                      "system": system_prompt, "user": user_prompt}
+    logger.info("continue prefetched (DB version %s)", version)
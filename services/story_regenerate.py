@@ -0,0 +1,90 @@
+# services.story_regenerate.py
+
+import logging
+import threading
+from typing import Callable, Optional
+
+from services.DB_access_pipeline import connect, write_connection
+from services.DB_token_cost import count_tokens
+from services.llm_inference import generate_alternatives
+
+logger = logging.getLogger(__name__)
+
+"""
+Regenerate the last paragraph (/api/regenerate, the Re-Do button).
+Deleting a paragraph and pressing Continue again builds both memories, scores the tag cloud, tokenizes
+and evaluates the whole prompt - to end up with the same prompt. The writers remember the exact prompts
+behind the paragraph they persisted last (remember_generation); regenerating resamples those, so the
+cost is the decode: llama_cpp still holds the prompt in its context (Llama.generate reuses it, a story
+session stays live), llama-server in its slot's prompt cache.
+Only the last paragraph can be regenerated, and only while it is still the one the remembered prompts
+produced. n alternatives are decoded together (llm_inference.generate_alternatives); the first replaces
+the paragraph, the player can swap in another one like any edit (persist_user_edit).
+"""
+
+MAX_ALTERNATIVES = 4
+
+# derived from the old text and planned again for the new one (summarize_pipeline keys tag_recent by content).
+# Summaries and long-memory tags are only made once a paragraph has left the recent window: the last one has none.
+_STALE_COLUMNS = ("tags_recent",)
+
+_last: Optional[dict] = None    # {"persona", "system", "user", "paragraph", "clean"}
+_lock = threading.Lock()
+
+def remember_generation(persona: str, system_prompt: str, user_prompt: str, paragraph: dict,
+                        clean: Callable[[str], str]) -> None:
+    """
+    Called by the writers once `paragraph` ({"id", "content", "story_id"}) is persisted.
+    clean: the writer's post-processing from generated text to paragraph content.
+    """
+    global _last
+    with _lock:
+        _last = {"persona": persona, "system": system_prompt, "user": user_prompt,
+                 "paragraph": paragraph, "clean": clean}
+
+def regenerate_last(paragraph_id: Optional[int] = None, n: int = 1, cancel=None) -> Optional[dict]:
+    """
+    Resample the last paragraph (paragraph_id: the one the client means, if given).
+    Returns {"story": the replaced paragraph, "alternatives": [content, ...]},
+    None when there is nothing to regenerate (other paragraph, story changed since, server restarted).
+    """
+    with _lock:
+        last = _last
+    if last is None or (paragraph_id is not None and paragraph_id != last["paragraph"]["id"]):
+        return None
+    if not _is_last(last["paragraph"]["id"]):
+        return None
+
+    n = max(1, min(int(n), MAX_ALTERNATIVES))
+    generated = generate_alternatives(last["persona"], last["system"], last["user"], n, cancel)
+    alternatives = [last["clean"](text) for text in generated]
+
+    paragraph = {**last["paragraph"], "content": alternatives[0]}
+    if not _replace(paragraph):
+        return None
+    last["paragraph"] = paragraph
+    logger.info("%s: paragraph %s regenerated (%s alternatives)", last["persona"], paragraph["id"], n)
+    return {"story": paragraph, "alternatives": alternatives}
+
+def _is_last(paragraph_id: int) -> bool:
+    conn = connect(readonly=True)
+    try:
+        row = conn.execute("SELECT MAX(id) FROM story_paragraphs").fetchone()
+    finally:
+        conn.close()
+    return row is not None and row[0] == paragraph_id
+
+def _replace(paragraph: dict) -> bool:
+    """
+    Write the new content into the paragraph's row, if it is still the last one.
+    """
+    token_cost = count_tokens(paragraph["content"])
+    # the same text again keeps what was derived from it: its tag_recent job is done already
+    stale = ", ".join(f"{col} = CASE WHEN content = :content THEN {col} END" for col in _STALE_COLUMNS)
+    with write_connection() as conn:
+        cur = conn.execute(
+            f"UPDATE story_paragraphs SET {stale}, content = :content, token_cost = :token_cost "
+            "WHERE id = :id AND id = (SELECT MAX(id) FROM story_paragraphs)",
+            {"content": paragraph["content"], "token_cost": token_cost, "id": paragraph["id"]}
+        )
+        return cur.rowcount == 1
@@ -0,0 +1,84 @@
+# services.story_session.py
+
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from services.llm_config import Config
+from services.prompt_builder_story_continue import get_story_continue_prompts, get_story_continue_session_parts
+from services.prompt_builder_story_player_action import get_story_player_action_prompts, get_story_player_action_session_parts
+from services.DB_token_cost import count_tokens
+from services.llm_context_planner import context_needed
+from services.llm_inference import PERSONAS
+
+logger = logging.getLogger(__name__)
+
+"""
+Append-only story sessions for the writers (Config.STORY_SESSION).
+The builders re-select the recent paragraphs every turn, so the window slides and everything from its
+first paragraph on is evaluated again. In session mode the window stays anchored at the paragraph it
+started with: turn N+1's user prompt is turn N's head and paragraphs plus the new paragraph, with only the
+tail (outcome + kickoff) in flux - prompt processing is the new paragraph and the tail (llm_session keeps
+the KV cache of the writer's sequence on the llama_cpp backend).
+The session is rebuilt (re-anchored on the recent paragraphs budget, like the builders pick it) when
+    - the system prompt changed: the writing style
+    - the head changed: mid/long memories were published, user story parameters
+    - the anchor paragraph is gone: new story, undo past it
+    - the prompt no longer fits N_CTX: the paragraphs before the budget window are dropped, which on
+      llama_cpp is a KV shift instead of a re-evaluation
+One session per writer persona: their system prompts differ, so they never share a sequence.
+"""
+
+# persona -> (normal prompts, session parts)
+WRITERS = {
+    "story_continue": (get_story_continue_prompts, get_story_continue_session_parts),
+    "story_player_action": (get_story_player_action_prompts, get_story_player_action_session_parts),
+}
+
+_lock = threading.Lock()
+_sessions: Dict[str, dict] = {}  # persona -> {"system", "head", "start_id"}
+
+def _rebuild_reason(session: Optional[dict], parts: dict) -> Optional[str]:
+    if session is None:
+        return "new session"
+    if not parts["paragraphs"] or parts["paragraphs"][0][0] != session["start_id"]:
+        return "story changed"
+    if parts["system"] != session["system"]:
+        return "system prompt changed"
+    if parts["head"] != session["head"]:
+        return "memories or story parameters changed"
+    return None
+
+def _render(parts: dict) -> str:
+    return parts["head"] + "".join(piece for _, piece in parts["paragraphs"]) + parts["tail"]
+
+def _fits(persona: str, system_prompt: str, user_prompt: str) -> bool:
+    n_prompt = count_tokens(system_prompt) + count_tokens(user_prompt)
+    return context_needed(n_prompt, PERSONAS[persona]) <= Config.N_CTX
+
+def get_writer_prompts(persona: str) -> Tuple[str, str]:
+    """
+    (system_prompt, user_prompt) for a writer persona: the session layout when Config.STORY_SESSION is on,
+    the builder's prompts otherwise.
+    """
+    get_prompts, get_parts = WRITERS[persona]
+    if not Config.STORY_SESSION:
+        return get_prompts()
+
+    with _lock:
+        session = _sessions.get(persona)
+        parts = get_parts(session["start_id"] if session else None)
+        reason = _rebuild_reason(session, parts)
+        if reason is None and not _fits(persona, parts["system"], _render(parts)):
+            reason = "context full"
+        if reason is not None:
+            if session is not None:
+                # re-anchor on the recent paragraphs budget
+                parts = get_parts(None)
+            logger.info("%s session rebuilt (%s), %s paragraphs", persona, reason, len(parts["paragraphs"]))
+
+        if parts["paragraphs"]:
+            _sessions[persona] = {"system": parts["system"], "head": parts["head"], "start_id": parts["paragraphs"][0][0]}
+        else:
+            _sessions.pop(persona, None)
+    return parts["system"], _render(parts)
@@ -0,0 +1,296 @@
+# services.summarize_jobs.py
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+from services.DB_access_pipeline import connect, write_connection
+from services.llm_backends import get_backend
+from services.llm_cancel import CancelToken, Cancelled, start_job, finish_job
+from services.summarize_pipeline import plan_summarize_jobs, JOB_DEPENDENCIES
+from services.summarize_from_player_action import summarize_from_player_action
+from services.summarize_mid_memory import summarize_mid_memory
+from services.summarize_tag_long import summarize_create_tags
+from services.summarize_tag_recent import summarize_tag_recent
+
+logger = logging.getLogger(__name__)
+
+"""
+Durable job queue for the summarize pipeline.
+/api/summarize only plans (summarize_pipeline.plan_summarize_jobs) and enqueues; a worker thread runs the
+jobs from the summarize_jobs table. Nothing is lost when the browser aborts the request or the
+app dies half-way: jobs that were running are pending again on the next start.
+    - enqueue is idempotent per dedupe_key (pending, running or done jobs are not added again, failed ones
+      not for FAILED_RETRY_AFTER - the follow-up planning after every job would retry them without end);
+      a new story empties the table (DB_scrub_story.clear_story_tables), the keys name paragraph ids
+    - jobs that don't depend on each other (summarize_pipeline.JOB_DEPENDENCIES) run side by side, as many
+      as the backend decodes in one batch (LLMBackend.parallel) - one at a time on the in-process backend
+    - a failing job is retried with backoff, MAX_ATTEMPTS times, then marked failed
+    - after every finished job the pipeline is planned again, the next step may be due now
+    - the running jobs can be cancelled (llm_cancel job "summarize", /api/cancel/summarize): they are marked
+      cancelled, not retried; the next /api/summarize plans them again
+"""
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 5.0 # seconds, doubled per attempt
+KEEP_FINISHED = 200 # done/failed/cancelled rows kept for the status endpoint
+FAILED_RETRY_AFTER = 600 # seconds: a job that failed for good is not planned again before that
+WORKER_ERROR_WAIT = 2.0 # seconds the worker waits after an unexpected error (e.g. a locked DB) before looking again
+
+JOBS = {
+    "summarize_from_action": lambda args, cancel: summarize_from_player_action(cancel=cancel),
+    "summarize_mid": lambda args, cancel: summarize_mid_memory(args["ids"], cancel=cancel),
+    "tag_long": lambda args, cancel: summarize_create_tags(args["id"], cancel=cancel),
+    "tag_recent": lambda args, cancel: summarize_tag_recent(cancel=cancel),
+}
+
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+_running: Dict[int, str] = {}             # job id -> kind, in flight in this process
+_group: Optional[CancelToken] = None      # llm_cancel job "summarize", parent of the running jobs' tokens
+_running_lock = threading.Lock()
+
+def enqueue_summarize() -> int:
+    """
+    Plan the pipeline against the current DB and queue whatever is due. Returns how many jobs were added.
+    """
+    added = 0
+    planned = plan_summarize_jobs()
+    if planned:
+        with write_connection(versioned=False) as conn:
+            for kind, args, key in planned:
+                exists = conn.execute("""
+                    SELECT 1
+                      FROM summarize_jobs
+                     WHERE dedupe_key = ?
+                       AND (status IN ('pending', 'running', 'done')
+                            OR (status = 'failed'
+                                AND updated_at > strftime('%Y-%m-%dT%H:%M:%f','now','localtime',?)))
+                     LIMIT 1
+                """, (key, f"-{FAILED_RETRY_AFTER} seconds")).fetchone()
+                if exists:
+                    continue
+                conn.execute(
+                    "INSERT INTO summarize_jobs (kind, args, dedupe_key) VALUES (?, ?, ?)",
+                    (kind, json.dumps(args), key)
+                )
+                added += 1
+    if added:
+        _wake.set()
+    return added
+
+def start_summarize_worker():
+    """
+    Start the worker thread (once). Jobs left 'running' by a previous process are resumed.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        with write_connection(versioned=False) as conn:
+            resumed = conn.execute("""
+                UPDATE summarize_jobs
+                   SET status = 'pending',
+                       updated_at = strftime('%Y-%m-%dT%H:%M:%f','now','localtime')
+                 WHERE status = 'running'
+            """).rowcount
+        if resumed:
+            logger.info("resuming %s interrupted summarize job(s)", resumed)
+        _worker = threading.Thread(target=_work, name="summarize_worker", daemon=True)
+        _worker.start()
+    _wake.set()
+
+def _work():
+    while True:
+        try:
+            _work_once()
+        except Exception:
+            # e.g. "database is locked": the worker stays alive, the queue is durable
+            logger.exception("summarize worker iteration failed, retrying in %ss", WORKER_ERROR_WAIT)
+            time.sleep(WORKER_ERROR_WAIT)
+
+def _work_once():
+    # cleared before looking: an enqueue or a finished job from here on wakes us again
+    _wake.clear()
+    now = time.time()
+    with _running_lock:
+        free = get_backend().parallel - len(_running)
+    jobs = _claim(now, free) if free > 0 else []
+    for job in jobs:
+        threading.Thread(target=_run, args=(job,), name=f"summarize_job_{job['id']}", daemon=True).start()
+    if not jobs:
+        # nothing runnable: sleep until enqueue, a finished job or the next retry time
+        _wake.wait(timeout=_next_due(now))
+
+def _claim(now: float, limit: int) -> List[Dict[str, Any]]:
+    """
+    Mark up to `limit` due jobs running whose dependencies are through: no job of a kind they wait for
+    is running or queued before them.
+    """
+    claimed = []
+    with write_connection(versioned=False) as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("""
+            SELECT id, kind, args, attempts, status, not_before
+              FROM summarize_jobs
+             WHERE status IN ('pending', 'running')
+             ORDER BY id
+        """).fetchall()
+        ahead = {row["kind"] for row in rows if row["status"] == "running"}
+        for row in rows:
+            if row["status"] != "pending":
+                continue
+            waits_for = JOB_DEPENDENCIES.get(row["kind"], {row["kind"]})
+            if len(claimed) < limit and row["not_before"] <= now and not (waits_for & ahead):
+                claimed.append(row)
+            ahead.add(row["kind"])
+        for job in claimed:
+            conn.execute("""
+                UPDATE summarize_jobs
+                   SET status = 'running',
+                       attempts = attempts + 1,
+                       updated_at = strftime('%Y-%m-%dT%H:%M:%f','now','localtime')
+                 WHERE id = ?
+            """, (job["id"],))
+    jobs = [dict(job) for job in claimed]
+    with _running_lock:
+        for job in jobs:
+            _running[job["id"]] = job["kind"]
+    return jobs
+
+def _job_token(job: Dict[str, Any]) -> CancelToken:
+    """
+    The job's own token, a child of the "summarize" llm_cancel job that /api/cancel/summarize cancels.
+    A cancelled group is replaced for the jobs started after it.
+    """
+    global _group
+    with _running_lock:
+        if _group is None or _group.cancelled:
+            _group = start_job("summarize")
+        return CancelToken(f"summarize {job['kind']}", parent=_group)
+
+def _job_ended(job: Dict[str, Any]):
+    global _group
+    with _running_lock:
+        _running.pop(job["id"], None)
+        if not _running and _group is not None:
+            finish_job(_group)
+            _group = None
+    _wake.set()
+
+def _run(job: Dict[str, Any]):
+    try:
+        _run_job(job)
+    finally:
+        _job_ended(job)
+
+def _run_job(job: Dict[str, Any]):
+    attempt = job["attempts"] + 1
+    cancel = _job_token(job)
+    try:
+        JOBS[job["kind"]](json.loads(job["args"] or "{}"), cancel)
+    except Cancelled as e:
+        logger.info("summarize job %s (%s) cancelled", job["id"], job["kind"])
+        with write_connection(versioned=False) as conn:
+            conn.execute("""
+                UPDATE summarize_jobs
+                   SET status = 'cancelled',
+                       last_error = ?,
+                       updated_at = strftime('%Y-%m-%dT%H:%M:%f','now','localtime')
+                 WHERE id = ?
+            """, (str(e), job["id"]))
+        return
+    except Exception as e:
+        logger.exception("summarize job %s (%s) failed, attempt %s", job["id"], job["kind"], attempt)
+        failed = attempt >= MAX_ATTEMPTS
+        with write_connection(versioned=False) as conn:
+            conn.execute("""
+                UPDATE summarize_jobs
+                   SET status = ?,
+                       not_before = ?,
+                       last_error = ?,
+                       updated_at = strftime('%Y-%m-%dT%H:%M:%f','now','localtime')
+                 WHERE id = ?
+            """, (
+                "failed" if failed else "pending",
+                time.time() + RETRY_BACKOFF * (2 ** (attempt - 1)),
+                f"{type(e).__name__}: {e}",
+                job["id"],
+            ))
+        return
+
+    with write_connection(versioned=False) as conn:
+        conn.execute("""
+            UPDATE summarize_jobs
+               SET status = 'done',
+                   last_error = NULL,
+                   updated_at = strftime('%Y-%m-%dT%H:%M:%f','now','localtime')
+             WHERE id = ?
+        """, (job["id"],))
+        conn.execute("""
+            DELETE FROM summarize_jobs
+             WHERE status IN ('done', 'failed', 'cancelled')
+               AND id NOT IN (SELECT id FROM summarize_jobs WHERE status IN ('done', 'failed', 'cancelled') ORDER BY id DESC LIMIT ?)
+        """, (KEEP_FINISHED,))
+    logger.info("summarize job %s (%s) done", job["id"], job["kind"])
+
+    # the next pipeline step may be due now
+    try:
+        enqueue_summarize()
+    except Exception:
+        logger.exception("planning follow-up summarize jobs failed")
+
+def _next_due(now: float) -> Optional[float]:
+    """
+    Seconds until the earliest pending job in backoff may run (None = wait for enqueue or a finished job:
+    jobs that are due already only wait for a dependency or a free slot).
+    """
+    conn = connect(readonly=True)
+    try:
+        row = conn.execute(
+            "SELECT MIN(not_before) FROM summarize_jobs WHERE status = 'pending' AND not_before > ?", (now,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not row or row[0] is None:
+        return None
+    return max(0.0, row[0] - time.time())
+
+def summarize_idle() -> bool:
+    """
+    True when no summarize job is pending or running.
+    """
+    conn = connect(readonly=True)
+    try:
+        row = conn.execute("SELECT 1 FROM summarize_jobs WHERE status IN ('pending', 'running') LIMIT 1").fetchone()
+    finally:
+        conn.close()
+    return row is None
+
+def summarize_status(limit: int = 20) -> Dict[str, Any]:
+    """
+    Queue overview for /api/summarize/status: counts per status and the newest jobs.
+    """
+    conn = connect(readonly=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        counts = {row["status"]: row["n"] for row in conn.execute(
+            "SELECT status, COUNT(*) AS n FROM summarize_jobs GROUP BY status"
+        )}
+        jobs = [dict(row) for row in conn.execute("""
+            SELECT id, kind, dedupe_key, status, attempts, last_error, created_at, updated_at
+              FROM summarize_jobs
+             ORDER BY id DESC
+             LIMIT ?
+        """, (limit,))]
+    finally:
+        conn.close()
+    return {
+        "worker_alive": bool(_worker is not None and _worker.is_alive()),
+        "counts": counts,
+        "jobs": jobs,
+    }
@@ -1,39 +1,69 @@
 # services.summarize_pipeline.py
 
+import hashlib
 import sqlite3
 from services.llm_config import GlobalVars
-from services.summarize_from_player_action import summarize_from_player_action
-from services.summarize_mid_memory import summarize_mid_memory
-from services.summarize_tag_long import summarize_create_tags
-from services.summarize_tag_recent import summarize_tag_recent
 from services.DB_access_pipeline import connect
 from services.DB_token_cost import check_long_memories_tc
 
-def summarize():
-    debug = True
+def plan_summarize_jobs() -> list[tuple[str, dict, str]]:
+    """
+    What the pipeline would do right now, as (kind, args, dedupe_key) in pipeline order.
+    Later steps depend on earlier ones, so the job worker plans again after every finished job.
+    """
+    jobs = []
 
-    # Mid-term memory: create summary from player action if needed
-    handle = _check_mid_memories()
-    if handle: summarize_from_player_action()
-    if debug: print("finished summarize from_player_action" if handle else "skipped summarize from_player_action")
+    action_id = _check_mid_memories()
+    if action_id:
+        jobs.append(("summarize_from_action", {}, f"summarize_from_action:{action_id}"))
 
-    # Long-term memory: create summary if needed
     summarize_ids = _check_long_memories()
-    if summarize_ids: summarize_mid_memory(summarize_ids)
-    if debug: print("finished summarize mid" if summarize_ids else "skipped summarize mid")
+    if summarize_ids:
+        jobs.append(("summarize_mid", {"ids": summarize_ids}, "summarize_mid:" + ",".join(map(str, summarize_ids))))
 
-    # Missing tags: create tags for a long-term memory if needed
     handle, tag_id = _check_missing_tags()
-    if handle: summarize_create_tags(tag_id)
-    if debug: print("finished summarize create_tags" if handle else "skipped summarize create_tags")
-
-    # Long-term memory budget check: tag recent story if budget full
-    handle = check_long_memories_tc()
-    if handle: summarize_tag_recent()
-    if debug: print("finished summarize tag_recent" if handle else "skipped summarize tag_recent")
-
-    if debug: print("Backend done.")
-    return
+    if handle:
+        jobs.append(("tag_long", {"id": tag_id}, f"tag_long:{tag_id}"))
+
+    if check_long_memories_tc():
+        recent = _newest_untagged_recent()
+        if recent:
+            # keyed by content too: a regenerated paragraph (story_regenerate) is tagged again under its old id
+            recent_id, content = recent
+            digest = hashlib.sha256((content or "").encode("utf-8")).hexdigest()[:16]
+            jobs.append(("tag_recent", {}, f"tag_recent:{recent_id}:{digest}"))
+
+    return jobs
+
+# job kind -> kinds it waits for while one of them is running or was queued before it (summarize_jobs).
+# A job's rows are pinned when it is planned, so only reads of what another job writes order them:
+#   - tag_long reads the summaries (up to the one it tags) that summarize_mid writes
+#   - a kind never runs alongside itself, it keeps the planned order
+# summarize_from_action (writes summary_from_action), summarize_mid (ids that have theirs already)
+# and tag_recent (the newest paragraphs) touch disjoint data and decode side by side.
+JOB_DEPENDENCIES = {
+    "summarize_from_action": {"summarize_from_action"},
+    "summarize_mid": {"summarize_mid"},
+    "tag_long": {"tag_long", "summarize_mid"},
+    "tag_recent": {"tag_recent"},
+}
+
+def _newest_untagged_recent() -> tuple[int, str] | None:
+    """
+    (id, content) of the paragraph summarize_tag_recent would write to.
+    """
+    conn = connect(readonly=True)
+    try:
+        row = conn.execute("""
+            SELECT id, content
+              FROM story_paragraphs
+             WHERE (tags_recent IS NULL OR tags_recent = '')
+             ORDER BY id DESC
+             LIMIT 1
+        """).fetchone()
+    finally:
+        conn.close()
+    return (int(row[0]), row[1]) if row else None
 
 def _check_long_memories() -> list[int]:
     conn = connect(readonly=True)
@@ -132,11 +162,11 @@ def _check_missing_tags():
     return False, None
 
 
-def _check_mid_memories() -> bool:
+def _check_mid_memories() -> int | None:
     """
-    Returns True if there is a "new" 'continue_with_UserAction' paragraph
+    Returns the id of a "new" 'continue_with_UserAction' paragraph (truthy) if there is one
     that falls outside the recent-token window and has no summary_from_action,
-    and no paragraph with a higher id already has a summary_from_action.
+    and no paragraph with a higher id already has a summary_from_action. Otherwise a falsy value.
     """
     conn = connect(readonly=True)
     try:
@@ -197,7 +227,7 @@ def _check_mid_memories() -> bool:
                 if higher_id > current_id and has_summary:
                     return False
 
-            return True
+            return current_id
 
     return False
 
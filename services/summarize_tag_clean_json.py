@@ -35,8 +35,11 @@ def clean_llm_json(raw: str) -> str:
     try:
         obj = json.loads(fixed)
     except json.JSONDecodeError:
-        # As last resort, wrap in dict
-        return json.dumps({"raw": raw}, ensure_ascii=False)
+        # cut off at max_tokens (constrained tags, see prompts_tag.get_tag_max_tokens): keep the complete keys
+        obj = _close_truncated(raw)
+        if obj is None:
+            # As last resort, wrap in dict
+            return json.dumps({"raw": raw}, ensure_ascii=False)
 
     # --- Step 3: normalize "state" field ---
     if "state" in obj and isinstance(obj["state"], str):
@@ -47,3 +50,42 @@ def clean_llm_json(raw: str) -> str:
         obj["state"] = s.strip()
 
     return json.dumps(obj, ensure_ascii=False)
+
+def _close_truncated(raw: str):
+    """
+    Parse an object that ends mid-way: close the open string and the object, at the end or else at
+    the last "," before it (dropping the incomplete key). None if no cut parses.
+    """
+    text = raw.strip()
+    start = text.find("{")
+    if start == -1:
+        return None
+    text = text[start:]
+    cut = len(text)
+    while cut > 0:
+        candidate = _close_string(text[:cut]).rstrip().rstrip(",")
+        try:
+            obj = json.loads(candidate + "}")
+        except json.JSONDecodeError:
+            cut = text.rfind(",", 0, cut)
+            continue
+        return obj if isinstance(obj, dict) else None
+    return None
+
+def _close_string(text: str) -> str:
+    """
+    Close a string literal left open at the end of `text` (dropping a dangling escape).
+    """
+    in_string = escaped = False
+    for ch in text:
+        if escaped:
+            escaped = False
+        elif ch == "\\" and in_string:
+            escaped = True
+        elif ch == '"':
+            in_string = not in_string
+    if not in_string:
+        return text
+    if escaped:
+        text = text[:-1]
+    return text + '"'
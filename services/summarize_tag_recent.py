@@ -1,62 +1,27 @@
 # services.summarize_tag_recent.py
 
-import subprocess
-import sys
 import sqlite3
 
-from services.llm_config import Config, GlobalVars
-from services.llm_config_helper import output_cleaner
+from services.llm_config import GlobalVars
+from services.llm_inference import generate
 from services.DB_access_pipeline import write_connection
 from services.prompt_builder_tag_recent import get_prompts_tag_recent
 from services.summarize_tag_clean_json import clean_llm_json
 
-LLAMA_CLI_PATH = Config.LLAMA_CLI
 LOG_DIR  = GlobalVars.log_folder
 LOG_FILE = 'tag_recent_json.log'
 
-def summarize_tag_recent():
+def summarize_tag_recent(cancel=None):
     log_path = LOG_DIR / LOG_FILE
     # build prompts
     system_prompt, user_prompt = get_prompts_tag_recent()
 
-    # invoke llama-cli
-    cmd = [
-        LLAMA_CLI_PATH,
-        "-m", str(Config.MODEL_PATH_GM),
-        "--ctx-size", str(Config.N_CTX),
-        "--threads", str(Config.N_THREADS),
-        "--gpu-layers", str(Config.N_GPU_LAYERS),
-        "--temp", str(Config.TEMPERATURE_TAGS),
-        "--top-p", str(Config.TOP_P_slave),
-        "--repeat-penalty", str(Config.REPEAT_PENALTY_slave),
-        "--frequency-penalty", str(Config.FREQUENCY_PENALTY_slave),
-        "--presence-penalty", str(Config.PRESENCE_PENALTY_slave),
-        "--chat-template-file", str(Config.TEMPLATE_PATH_GM),
-        "--system-prompt", system_prompt,
-        "--prompt", user_prompt,
-    ]
-    try:
-        result = subprocess.run(
-            cmd,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=True
-        )
-    except subprocess.CalledProcessError as e:
-        print(f"[ERROR] llama-cli exited with {e.returncode}", file=sys.stderr)
-        print(e.stderr, file=sys.stderr)
-        sys.exit(e.returncode)
-
-    full_out = result.stdout or ""
-    print("=== raw stdout ===\n", full_out)
-    generated = output_cleaner(full_out, user_prompt)
+    # run on the resident GM model
+    generated = generate("tag_recent", system_prompt, user_prompt, cancel=cancel)
+    print("=== raw output ===\n", generated)
 
     tags = generated.strip()
-    # attempt json repair
+    # attempt json repair (a no-op fast path when the grammar constrained the output, see Config.CONSTRAINED_TAGS)
     tags_repaired = clean_llm_json(tags)
 
     # Log both
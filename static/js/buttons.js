@@ -39,6 +39,8 @@ function button_lock(shouldLock) {
   }
 
   if (lock && statusEl) statusEl.innerText = '…loading';
+  // keep error/outcome messages, only drop the loading hint
+  if (!lock && statusEl && statusEl.innerText === '…loading') statusEl.innerText = '';
 }
 
 // -----------------------------------------------------------------------------
@@ -59,6 +61,9 @@ async function callSummarize(signalOrFlag) {
       summarizeController.abort();
       summarizeController = null;
     }
+    // The jobs run server-side, aborting the fetch alone doesn't stop them
+    fetch('/api/cancel/summarize', { method: 'POST' })
+      .catch(err => console.warn('summarize cancel failed', err));
     return;
   }
 
@@ -69,9 +74,8 @@ async function callSummarize(signalOrFlag) {
   summarizeController = new AbortController();
   const { signal } = summarizeController;
 
-  // Show locked UI while summarizing
-  button_lock(true);
-  if (statusEl) statusEl.innerText = '…summarizing';
+  // Summaries are background work: the server lets the next action preempt them, so the UI stays usable
+  if (statusEl && !statusEl.innerText) statusEl.innerText = '…summarizing';
 
   try {
     const res = await fetch('/api/summarize', {
@@ -86,7 +90,7 @@ async function callSummarize(signalOrFlag) {
     const text = await res.text();
     console.log('summarize response:', text);
 
-    if (statusEl) statusEl.innerText = '';
+    if (statusEl && statusEl.innerText === '…summarizing') statusEl.innerText = '';
     return text;
   } catch (err) {
     if (err.name === 'AbortError') {
@@ -98,12 +102,31 @@ async function callSummarize(signalOrFlag) {
     if (statusEl) statusEl.innerText = 'summarize error';
     throw err;
   } finally {
-    // Always unlock UI and clear controller when finished
+    // Always clear controller when finished
     summarizeController = null;
-    button_lock(false);
   }
 }
 
+// -----------------------------------------------------------------------------
+// Error responses
+// -----------------------------------------------------------------------------
+
+/**
+ * Message for a failed response: the server's JSON error ({error, message, retry_after}) if there is one.
+ */
+async function errorMessage(res) {
+  try {
+    const body = await res.json();
+    if (body.error === 'backend_unavailable') {
+      return `model unavailable, retry in ${Math.ceil(body.retry_after || 0)}s`;
+    }
+    if (body.message) return body.message;
+  } catch (e) {
+    // not JSON
+  }
+  return `HTTP ${res.status}`;
+}
+
 // -----------------------------------------------------------------------------
 // Payload Builder (attach any candidateSnapshot present)
 // -----------------------------------------------------------------------------
@@ -147,7 +170,11 @@ async function callAction(endpoint, payload = {}) {
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload)
     });
-    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    if (!res.ok) {
+      const message = await errorMessage(res);
+      if (statusEl) statusEl.innerText = message;
+      throw new Error(message);
+    }
 
     const json = await res.json();
     console.log('API response:', json);
@@ -179,6 +206,101 @@ async function callAction(endpoint, payload = {}) {
 
     return res; // return raw response for caller
   } finally {
+    // Summaries run detached from the request: unlock now, then queue them
+    button_lock(false);
+    // Call the summarize pipeline after every action
+    callSummarize('start_summarize');
+  }
+}
+
+// -----------------------------------------------------------------------------
+// Streaming Action Pipeline (Server-Sent Events over fetch)
+// -----------------------------------------------------------------------------
+
+// Endpoints with a /stream variant
+const STREAM_ENDPOINTS = ['/api/new', '/api/continue', '/api/player_action'];
+
+/**
+ * Parse one SSE block ("event: x\ndata: {...}") into { event, data }.
+ */
+function parseSseBlock(block) {
+  let event = 'message';
+  const dataLines = [];
+  block.split('\n').forEach(line => {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+  });
+  if (!dataLines.length) return null;
+  return { event, data: JSON.parse(dataLines.join('\n')) };
+}
+
+/**
+ * Like callAction, but renders the paragraph while it is being generated.
+ * The final "done" event carries the persisted paragraph (id + cleaned content).
+ */
+async function callActionStream(endpoint, payload = {}) {
+  button_lock(true);
+  let pEl = null;
+  try {
+    const res = await fetch(`${endpoint}/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(payload)
+    });
+    if (!res.ok || !res.body) throw new Error(await errorMessage(res));
+
+    if (statusEl) statusEl.innerText = '…writing';
+    pEl = document.createElement('p');
+    pEl.classList.add('streaming');
+    historyEl.appendChild(pEl);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) !== -1) {
+        const msg = parseSseBlock(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+        if (!msg) continue;
+
+        if (msg.event === 'token') {
+          pEl.textContent += msg.data.text;
+        } else if (msg.event === 'done') {
+          const { id, content, story_id } = msg.data.story;
+          pEl.classList.remove('streaming');
+          pEl.dataset.paragraphId = id;
+          if (story_id) pEl.dataset.storyId = story_id;
+          pEl.textContent = content;
+          if (actionEl) actionEl.value = '';
+          styleStoryHistory();
+          window.Snapshot.notifyBackendUpdate('#story-history');
+
+          document.querySelector('.mid-synopsis-area').innerHTML = msg.data.mid_memory;
+          window.Snapshot.notifyBackendUpdate('.mid-synopsis-area');
+          document.querySelector('.long-synopsis-area').innerHTML = msg.data.long_memory;
+          window.Snapshot.notifyBackendUpdate('.long-synopsis-area');
+          pEl = null;
+        } else if (msg.event === 'error') {
+          throw new Error(msg.data.message);
+        }
+      }
+    }
+    if (statusEl) statusEl.innerText = '';
+    return res;
+  } catch (err) {
+    // Drop a half-streamed paragraph that was never persisted
+    if (pEl) pEl.remove();
+    if (statusEl) statusEl.innerText = err.message || 'generation error';
+    throw err;
+  } finally {
+    // Summaries run detached from the request: unlock now, then queue them
+    button_lock(false);
     // Call the summarize pipeline after every action
     callSummarize('start_summarize');
   }
@@ -197,7 +319,7 @@ async function callEvalThenAction(endpoint, payload = {}) {
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload)   // payload includes `action`
     });
-    if (!evalRes.ok) throw new Error(`Eval HTTP ${evalRes.status}`);
+    if (!evalRes.ok) throw new Error(`Eval: ${await errorMessage(evalRes)}`);
     const evalJson = await evalRes.json();
 
     // Depending on your backend, evalJson may look like:
@@ -226,15 +348,28 @@ async function callEvalThenAction(endpoint, payload = {}) {
     }
 
     // ---- Real player action -----------------------------------------
-    return await callAction(endpoint, payload);
+    return await runAction(endpoint, payload);
   } catch (err) {
     console.error('Evaluation or action failed', err);
-    if (statusEl) statusEl.innerText = 'evaluation error';
+    if (statusEl) statusEl.innerText = err.message || 'evaluation error';
     throw err;
+  } finally {
+    // a failed eval never reaches runAction, which unlocks otherwise
+    button_lock(false);
   }
 }
 
 
+/**
+ * Pick streaming or blocking generation.
+ */
+function runAction(endpoint, payload = {}) {
+  if (window.pgmStreaming && STREAM_ENDPOINTS.includes(endpoint)) {
+    return callActionStream(endpoint, payload);
+  }
+  return callAction(endpoint, payload);
+}
+
 // -----------------------------------------------------------------------------
 // Button Handlers
 // -----------------------------------------------------------------------------
@@ -267,7 +402,7 @@ function handleContinue() {
     // payload.action is already '' (empty)
   }
 
-  const runner = endpoint === '/api/player_action' ? callEvalThenAction : callAction;
+  const runner = endpoint === '/api/player_action' ? callEvalThenAction : runAction;
 
   runner(endpoint, payload)
     .then(res => {
@@ -276,9 +411,53 @@ function handleContinue() {
     .catch(err => console.error('handleContinue failed', err));
 }
 
+/**
+ * Resample the last paragraph from the prompts it was generated from (/api/regenerate).
+ * Replaces its text in place. Resolves to null when the server can't (409: not the paragraph
+ * its last generation wrote) so the caller replays the turn instead.
+ */
+async function callRegenerate(lastEl) {
+  button_lock(true);
+  try {
+    const res = await fetch('/api/regenerate', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ paragraph_id: Number(lastEl.dataset.paragraphId) })
+    });
+    if (res.status === 409) {
+      const body = await res.clone().json().catch(() => ({}));
+      if (body.message === 'nothing_to_regenerate') return null;
+    }
+    if (!res.ok) {
+      const message = await errorMessage(res);
+      if (statusEl) statusEl.innerText = message;
+      throw new Error(message);
+    }
+
+    const json = await res.json();
+    console.log('API response:', json);
+
+    lastEl.textContent = json.story.content;
+    styleStoryHistory();
+    window.Snapshot.notifyBackendUpdate('#story-history');
+
+    document.querySelector('.mid-synopsis-area').innerHTML = json.mid_memory;
+    window.Snapshot.notifyBackendUpdate('.mid-synopsis-area');
+    document.querySelector('.long-synopsis-area').innerHTML = json.long_memory;
+    window.Snapshot.notifyBackendUpdate('.long-synopsis-area');
+    if (statusEl) statusEl.innerText = '';
+    return res;
+  } finally {
+    button_lock(false);
+    // The paragraph changed: its summaries and tags are made again
+    callSummarize('start_summarize');
+  }
+}
+
 /**
  * Handle "Redo" button click.
- * Removes last paragraph and replays pipeline.
+ * Regenerates the last paragraph, or - when there are unsaved edits or the server
+ * can't - removes it and replays the pipeline.
  */
 function handleRedo() {
   const paragraphs = historyEl.querySelectorAll('p[data-paragraph-id]');
@@ -286,14 +465,31 @@ function handleRedo() {
   // No paragraphs → start a fresh story
   if (!paragraphs.length) {
     const payload = buildBasePayload(); // action will be '' (no input)
-    callAction('/api/new', payload)
+    runAction('/api/new', payload)
       .then(res => { if (res?.ok) localStorage.removeItem('candidateSnapshot'); })
       .catch(err => console.error('redo‑new failed', err));
     return;
   }
 
+  const last = paragraphs[paragraphs.length - 1];
+
+  // Edits pending: the prompts behind the last paragraph are outdated, replay with the edits
+  if (localStorage.getItem('candidateSnapshot')) {
+    replayLast(last);
+    return;
+  }
+
+  callRegenerate(last)
+    .then(res => { if (!res) replayLast(last); })
+    .catch(err => console.error('handleRedo failed', err));
+}
+
+/**
+ * Remove the last paragraph and replay the pipeline that leads to it.
+ */
+function replayLast(last) {
   // Remove the last paragraph
-  paragraphs[paragraphs.length - 1].remove();
+  last.remove();
 
   // Snapshot after removal (unchanged)
   if (window.UserSnapshot?.pushNow) {
@@ -320,7 +516,7 @@ function handleRedo() {
   // Build payload (includes current action text and candidate snapshot)
   const payload = buildBasePayload();
 
-  const runner = endpoint === '/api/player_action' ? callEvalThenAction : callAction;
+  const runner = endpoint === '/api/player_action' ? callEvalThenAction : runAction;
 
   runner(endpoint, payload)
     .then(res => {
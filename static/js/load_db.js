@@ -81,6 +81,9 @@ function loadInitialStateAndHistory() {
       console.warn('Failed to populate difficulty from initial state', e);
     }
 
+    // 1d) Streaming generation (buttons.js uses the /api/*/stream endpoints when true)
+    window.pgmStreaming = Boolean(initial.streaming);
+
     // 2) Render the story paragraphs
     const storyEl = document.getElementById('story-history');
     storyEl.innerHTML = '';
@@ -0,0 +1,66 @@
+# tests.conftest.py
+
+import sys
+
+import pytest
+
+from services import DB_access_pipeline, llm_backends
+from services.llm_config import Config, GlobalVars
+
+"""
+Shared fixtures. Nothing here needs a model: generations run on the fake backend (llm_backends.FakeBackend),
+the story and cache DBs are fresh files in pytest's tmp_path.
+"""
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """
+    Story DB and cache DB in tmp_path, created from schema.sql / schema_cache.sql.
+    """
+    monkeypatch.setattr(DB_access_pipeline, "DB_PATH", str(tmp_path / "pgm_memory.db"))
+    monkeypatch.setattr(DB_access_pipeline, "CACHE_DB_PATH", str(tmp_path / "pgm_cache.db"))
+    monkeypatch.setattr(DB_access_pipeline, "_cache_ready", False)
+    with DB_access_pipeline.write_connection() as conn:
+        conn.executescript(DB_access_pipeline.SCHEMA.read_text(encoding="utf-8"))
+    return tmp_path
+
+@pytest.fixture
+def fake_backend(temp_db, monkeypatch):
+    """
+    Config.BACKEND = "fake" without the simulated latency, no response cache.
+    """
+    monkeypatch.setattr(Config, "BACKEND", "fake")
+    monkeypatch.setattr(Config, "FAKE_LATENCY", 0.0)
+    monkeypatch.setattr(Config, "FAKE_PROMPT_TOKENS_PER_SEC", 1e9)
+    monkeypatch.setattr(Config, "FAKE_TOKENS_PER_SEC", 1e9)
+    monkeypatch.setattr(Config, "FAKE_FAILURE_RATE", 0.0)
+    monkeypatch.setattr(Config, "RESPONSE_CACHE", False)
+    monkeypatch.setattr(llm_backends, "_backend", None)
+    return llm_backends.get_backend()
+
+@pytest.fixture
+def story_db(fake_backend, tmp_path, monkeypatch):
+    """
+    temp_db filled like app.py does on startup: prompts, story parameters, budget, difficulty.
+    Prompt logs go to tmp_path instead of the repo's logs/.
+    """
+    pytest.importorskip("flask")    # prompts_story_parameters imports flask
+    monkeypatch.setattr(GlobalVars, "log_folder", tmp_path / "logs")
+    for name, module in list(sys.modules.items()):
+        if name.startswith("services.") and hasattr(module, "LOG_DIR"):
+            monkeypatch.setattr(module, "LOG_DIR", tmp_path / "logs")
+    from services.prompts_system import write_system_prompts
+    from services.prompts_story_parameters import write_story_prompts
+    from services.prompts_memory_prefix import write_memory_prefix
+    from services.prompts_tag import write_tagging_prompts
+    from services.DB_token_budget import write_initial_budget
+    from services.DB_difficulty import write_difficulty
+    from services.prompts_eval_action import write_action_eval_bucket
+    write_system_prompts()
+    write_story_prompts()
+    write_memory_prefix()
+    write_tagging_prompts()
+    write_initial_budget()
+    write_difficulty()
+    write_action_eval_bucket()
+    return fake_backend
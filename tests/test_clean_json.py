@@ -0,0 +1,30 @@
+# tests.test_clean_json.py
+
+import json
+
+from services.summarize_tag_clean_json import clean_llm_json
+
+def test_valid_json_passes_through():
+    raw = '{"location": "Inn", "importance": "High"}'
+    assert json.loads(clean_llm_json(raw)) == {"location": "Inn", "importance": "High"}
+
+def test_trailing_text_is_cut():
+    assert json.loads(clean_llm_json('{"location": "Inn"} and more')) == {"location": "Inn"}
+
+def test_repaired_state_is_normalized():
+    obj = json.loads(clean_llm_json('{"location": ""Inn", "state": "resting ;eating"}'))
+    assert obj == {"location": "Inn", "state": "resting; eating"}
+
+def test_cut_off_string_is_closed():
+    obj = json.loads(clean_llm_json('{"location": "Inn", "character": "Ann; Bo'))
+    assert obj == {"location": "Inn", "character": "Ann; Bo"}
+
+def test_cut_off_key_is_dropped():
+    obj = json.loads(clean_llm_json('{"location": "Inn", "character": "Ann, Bo", "imp'))
+    assert obj == {"location": "Inn", "character": "Ann, Bo"}
+
+def test_dangling_escape_is_dropped():
+    assert json.loads(clean_llm_json('{"location": "In\\')) == {"location": "In"}
+
+def test_unrecoverable_output_is_wrapped():
+    assert json.loads(clean_llm_json("no json here")) == {"raw": "no json here"}
@@ -0,0 +1,35 @@
+# tests.test_context_planner.py
+
+from services.llm_config import Config
+from services.llm_context_planner import context_slots, generation_budget, pick_slot, plan_context
+
+def _config(monkeypatch, n_ctx=8192, bucket=1024, margin=64, open_generation=1024, slots=()):
+    monkeypatch.setattr(Config, "N_CTX", n_ctx)
+    monkeypatch.setattr(Config, "CONTEXT_BUCKET", bucket)
+    monkeypatch.setattr(Config, "CONTEXT_TEMPLATE_MARGIN", margin)
+    monkeypatch.setattr(Config, "CONTEXT_OPEN_GENERATION", open_generation)
+    monkeypatch.setattr(Config, "CONTEXT_SLOTS", list(slots))
+
+def test_generation_budget(monkeypatch):
+    _config(monkeypatch)
+    assert generation_budget({"max_tokens": 200}) == 200
+    assert generation_budget({"max_tokens": -1}) == 1024
+    assert generation_budget({}) == 1024
+
+def test_rounds_up_to_the_bucket(monkeypatch):
+    _config(monkeypatch)
+    # 1500 + 200 + 64 = 1764 -> 2048
+    assert plan_context("tag_recent", 1500, {"max_tokens": 200}) == 2048
+    # exactly on a bucket boundary stays there
+    assert plan_context("tag_recent", 2048 - 264, {"max_tokens": 200}) == 2048
+
+def test_clamped_to_n_ctx(monkeypatch):
+    _config(monkeypatch, n_ctx=4096)
+    assert plan_context("story_continue", 5000, {"max_tokens": 150}) == 4096
+
+def test_slots(monkeypatch):
+    _config(monkeypatch, n_ctx=8192, slots=[4096, 2048, 8192, 16384])
+    assert context_slots() == [2048, 4096, 8192]
+    assert pick_slot("tag_recent", 1000, {"max_tokens": 200}) == 2048
+    assert pick_slot("story_continue", 3000, {"max_tokens": 150}) == 4096
+    assert pick_slot("story_continue", 9000, {"max_tokens": 150}) == 8192
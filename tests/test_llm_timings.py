@@ -0,0 +1,32 @@
+# tests.test_llm_timings.py
+
+from services.llm_backends import parse_llama_timings
+
+PERF = """
+llama_perf_context_print:        load time =    1234.56 ms
+llama_perf_context_print: prompt eval time =     456.78 ms /   123 tokens (    3.71 ms per token,   269.32 tokens per second)
+llama_perf_context_print:        eval time =     789.01 ms /    45 runs   (   17.53 ms per token,    57.03 tokens per second)
+llama_perf_context_print:       total time =    2500.00 ms /   168 tokens
+"""
+
+def test_parses_the_perf_block():
+    assert parse_llama_timings(PERF) == {
+        "load_ms": 1234.56,
+        "prompt_ms": 456.78,
+        "prompt_tokens": 123,
+        "decode_ms": 789.01,
+        "generated_tokens": 45,
+    }
+
+def test_older_builds_print_timings():
+    output = "llama_print_timings:        eval time =     100.00 ms /    10 runs   (   10.00 ms per token)\n"
+    assert parse_llama_timings(output) == {"decode_ms": 100.0, "generated_tokens": 10}
+
+def test_last_block_wins():
+    second = PERF.replace("456.78", "111.11")
+    assert parse_llama_timings(PERF + second)["prompt_ms"] == 111.11
+
+def test_nothing_to_parse():
+    assert parse_llama_timings("") == {}
+    assert parse_llama_timings(None) == {}
+    assert parse_llama_timings("main: some other line\n") == {}
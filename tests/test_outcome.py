@@ -0,0 +1,54 @@
+# tests.test_outcome.py
+
+import re
+
+from services.prompts_eval_action import (
+    OUTCOME_FIELDS, OUTCOME_JUDGEMENTS, get_outcome_grammar, get_outcome_max_chars, parse_outcome,
+)
+from services.llm_inference import generate
+
+BLOCK = "\n".join([
+    "<Outcome>",
+    "Judgement: Partial Success",
+    "Effect: The lock gives, but the pick snaps.",
+    "Stat Update: Stamina (-1, tired)",
+    "Reasoning: Passed Dexterity check",
+    "</Outcome>",
+])
+
+def test_parse_outcome_fields():
+    assert parse_outcome(BLOCK) == {
+        "outcome_judgement": "Partial Success",
+        "outcome_effect": "The lock gives, but the pick snaps.",
+        "outcome_stat_update": "Stamina (-1, tired)",
+        "outcome_reasoning": "Passed Dexterity check",
+    }
+
+def test_parse_outcome_unconstrained_output():
+    parsed = parse_outcome("Sure!\n  judgement:   Failure  \nEffect: Nothing happens.</Outcome>")
+    assert parsed["outcome_judgement"] == "Failure"
+    assert parsed["outcome_effect"] == "Nothing happens."
+    assert parsed["outcome_reasoning"] is None
+
+def test_grammar_lists_fields_in_template_order():
+    grammar = get_outcome_grammar()
+    root = grammar.splitlines()[0]
+    assert root.startswith('root ::= "<Outcome>\\n"')
+    positions = [root.index(f'"{label}: "') for label in OUTCOME_FIELDS]
+    assert positions == sorted(positions)
+    for judgement in OUTCOME_JUDGEMENTS:
+        assert f'"{judgement}"' in grammar
+
+def test_grammar_bounds_free_text_fields():
+    grammar = get_outcome_grammar()
+    for label, (column, max_len) in OUTCOME_FIELDS.items():
+        if max_len is not None:
+            assert re.search(rf"^{column.replace('_', '-')} ::= .*\{{0,{max_len - 1}\}}$", grammar, re.MULTILINE)
+
+def test_max_chars_covers_the_longest_block():
+    assert get_outcome_max_chars() >= len(BLOCK)
+
+def test_fake_gm_output_parses(fake_backend):
+    parsed = parse_outcome(generate("eval_action", "system", "I pick the lock"))
+    assert parsed["outcome_judgement"] in OUTCOME_JUDGEMENTS
+    assert all(parsed.values())
@@ -0,0 +1,89 @@
+# tests.test_scheduler.py
+
+import threading
+import time
+
+import pytest
+
+from services.llm_cancel import CancelToken, Cancelled
+from services.llm_config import Config
+from services.llm_inference import generate
+from services.llm_scheduler import BACKGROUND, INTERACTIVE, Scheduler
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def _waiting(scheduler, priority):
+    with scheduler._cond:
+        return scheduler._waiting[priority]
+
+def _queue(scheduler, priority, order, name, width=1):
+    def run():
+        with scheduler.slot(priority, width=width):
+            order.append(name)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def test_interactive_goes_first():
+    scheduler = Scheduler()
+    order = []
+    with scheduler.slot(BACKGROUND):
+        background = _queue(scheduler, BACKGROUND, order, "background")
+        _wait_for(lambda: _waiting(scheduler, BACKGROUND) == 1)
+        interactive = _queue(scheduler, INTERACTIVE, order, "interactive")
+        _wait_for(scheduler.interactive_waiting)
+    background.join(5)
+    interactive.join(5)
+    assert order == ["interactive", "background"]
+    assert not scheduler.interactive_waiting()
+
+def test_background_shares_the_slot_up_to_width():
+    scheduler = Scheduler()
+    order = []
+    with scheduler.slot(BACKGROUND, width=2):
+        second = _queue(scheduler, BACKGROUND, order, "second", width=2)
+        second.join(5)
+        assert order == ["second"]
+        # interactive work never runs alongside background work
+        interactive = _queue(scheduler, INTERACTIVE, order, "interactive")
+        _wait_for(scheduler.interactive_waiting)
+        assert order == ["second"]
+    interactive.join(5)
+    assert order == ["second", "interactive"]
+
+def test_cancelled_while_waiting():
+    scheduler = Scheduler()
+    cancel = CancelToken("test")
+    with scheduler.slot(INTERACTIVE):
+        threading.Timer(0.05, cancel.cancel).start()
+        with pytest.raises(Cancelled):
+            with scheduler.slot(INTERACTIVE, cancel):
+                pass
+    assert _waiting(scheduler, INTERACTIVE) == 0
+
+def test_background_generation_yields_to_interactive(fake_backend, monkeypatch, caplog):
+    # slow enough that the interactive call arrives mid-generation
+    monkeypatch.setattr(Config, "FAKE_TOKENS_PER_SEC", 400.0)
+    alone = generate("tag_recent", "system", "tag this")
+
+    finished = []
+    result = {}
+    def background():
+        result["text"] = generate("tag_recent", "system", "tag this")
+        finished.append("background")
+    thread = threading.Thread(target=background)
+    with caplog.at_level("INFO", logger="services.llm_inference"):
+        thread.start()
+        time.sleep(0.05)
+        generate("eval_action", "system", "I open the door")
+        finished.append("interactive")
+        thread.join(10)
+
+    assert finished == ["interactive", "background"]
+    assert "preempted" in caplog.text
+    # started over from scratch: the same text as without the interruption
+    assert result["text"] == alone
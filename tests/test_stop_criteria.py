@@ -0,0 +1,24 @@
+# tests.test_stop_criteria.py
+
+from services.llm_backends import fake_tokenize, sentence_stop_reached
+from services.llm_inference import PERSONAS, generate
+
+def test_no_stop_before_the_target():
+    params = {"stop_after_tokens": 10}
+    assert not sentence_stop_reached(9, "He walks away.", params)
+
+def test_stop_after_the_target_at_a_sentence_end():
+    params = {"stop_after_tokens": 10}
+    assert sentence_stop_reached(10, "He walks away.", params)
+    assert sentence_stop_reached(12, 'She whispers, "Go!" ', params)
+    assert not sentence_stop_reached(12, "He walks away and", params)
+
+def test_personas_without_a_target_never_stop():
+    assert not sentence_stop_reached(10_000, "He walks away.", {})
+    assert not sentence_stop_reached(10_000, "He walks away.", {"stop_after_tokens": None})
+
+def test_writer_ends_on_a_sentence_past_the_target(fake_backend):
+    target = PERSONAS["story_continue"]["stop_after_tokens"]
+    text = generate("story_continue", "system", "user")
+    assert len(fake_tokenize(text)) >= target
+    assert text.rstrip()[-1] in '.!?"\''
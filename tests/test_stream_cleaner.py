@@ -0,0 +1,36 @@
+# tests.test_stream_cleaner.py
+
+from services.llm_config_helper import StreamCleaner
+
+def _feed(pieces):
+    cleaner = StreamCleaner()
+    return cleaner, [cleaner.feed(piece) for piece in pieces]
+
+def test_publishes_complete_sentences_only():
+    cleaner, deltas = _feed(["The door", " creaks open.", " A cold", " wind blows. ", "Some"])
+    assert deltas[0] == ""
+    # the sentence end is held back until we see what follows it
+    assert deltas[1] == ""
+    assert "".join(deltas) == "The door creaks open. A cold wind blows."
+    assert cleaner.published == "The door creaks open. A cold wind blows."
+
+def test_waits_for_a_closing_quote():
+    cleaner, deltas = _feed(['"Run!', '" she shouts. '])
+    assert deltas[0] == ""
+    assert cleaner.published.endswith('"Run!" she shouts.')
+
+def test_holds_back_a_tag_being_decoded():
+    cleaner, deltas = _feed(["He nods. ", "<Play", "erAction>I wave.</PlayerAction> ", "She smiles. "])
+    assert "".join(deltas) == cleaner.published
+    assert "<" not in cleaner.published
+    assert "I wave." not in cleaner.published
+    assert cleaner.published.endswith("She smiles.")
+
+def test_never_takes_text_back():
+    pieces = "It was late. The fire burned low! Was anyone there? Nobody answered.".split(" ")
+    cleaner = StreamCleaner()
+    published = ""
+    for piece in pieces:
+        published += cleaner.feed(piece + " ")
+        assert cleaner.published == published
+    assert published == "It was late. The fire burned low! Was anyone there? Nobody answered."
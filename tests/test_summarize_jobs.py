@@ -0,0 +1,134 @@
+# tests.test_summarize_jobs.py
+
+import json
+import time
+
+import pytest
+
+from services import story_regenerate, summarize_jobs, summarize_pipeline
+from services.DB_access_pipeline import connect, write_connection
+from services.DB_scrub_story import clear_story_tables
+from services.story_continue import generate_story_continue
+from services.story_new import generate_story_new
+from services.summarize_jobs import _claim, enqueue_summarize
+
+@pytest.fixture(autouse=True)
+def no_jobs_in_flight(monkeypatch):
+    monkeypatch.setattr(summarize_jobs, "_running", {})
+
+def _insert(kind, key=None, status="pending", not_before=0.0, updated_at=None):
+    with write_connection(versioned=False) as conn:
+        cur = conn.execute(
+            "INSERT INTO summarize_jobs (kind, args, dedupe_key, status, not_before) VALUES (?, '{}', ?, ?, ?)",
+            (kind, key or f"{kind}:{time.monotonic_ns()}", status, not_before)
+        )
+        if updated_at:
+            conn.execute("UPDATE summarize_jobs SET updated_at = ? WHERE id = ?", (updated_at, cur.lastrowid))
+        return cur.lastrowid
+
+def _status(job_id):
+    conn = connect(readonly=True)
+    try:
+        return conn.execute("SELECT status FROM summarize_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def _claimed(limit=4):
+    return [job["kind"] for job in _claim(time.time(), limit)]
+
+def test_claim_in_queue_order_up_to_limit(temp_db):
+    ids = [_insert("summarize_from_action"), _insert("summarize_mid"), _insert("tag_recent")]
+    assert _claimed(limit=2) == ["summarize_from_action", "summarize_mid"]
+    assert [_status(i) for i in ids] == ["running", "running", "pending"]
+
+def test_a_kind_never_runs_alongside_itself(temp_db):
+    _insert("tag_recent")
+    _insert("tag_recent")
+    assert _claimed() == ["tag_recent"]
+    # the first one still runs: the second waits
+    assert _claimed() == []
+
+def test_tag_long_waits_for_summarize_mid_queued_before_it(temp_db):
+    _insert("summarize_mid")
+    _insert("tag_long")
+    _insert("tag_recent")
+    assert _claimed() == ["summarize_mid", "tag_recent"]
+
+def test_tag_long_queued_first_does_not_wait(temp_db):
+    _insert("tag_long")
+    _insert("summarize_mid")
+    assert _claimed() == ["tag_long", "summarize_mid"]
+
+def test_backoff_is_respected(temp_db):
+    _insert("tag_recent", not_before=time.time() + 60)
+    assert _claimed() == []
+
+def test_enqueue_dedupes(temp_db, monkeypatch):
+    planned = [("tag_long", {"id": 7}, "tag_long:7")]
+    monkeypatch.setattr(summarize_jobs, "plan_summarize_jobs", lambda: planned)
+    monkeypatch.setattr(summarize_jobs, "_wake", type("Wake", (), {"set": lambda self: None})())
+    assert enqueue_summarize() == 1
+    assert enqueue_summarize() == 0
+
+def test_enqueue_skips_a_recent_failure(temp_db, monkeypatch):
+    monkeypatch.setattr(summarize_jobs, "plan_summarize_jobs", lambda: [
+        ("tag_long", {"id": 7}, "tag_long:7"),
+        ("tag_long", {"id": 8}, "tag_long:8"),
+    ])
+    _insert("tag_long", key="tag_long:7", status="failed")
+    _insert("tag_long", key="tag_long:8", status="failed", updated_at="2020-01-01T00:00:00.000")
+    assert enqueue_summarize() == 1
+    conn = connect(readonly=True)
+    try:
+        pending = conn.execute("SELECT dedupe_key FROM summarize_jobs WHERE status = 'pending'").fetchall()
+    finally:
+        conn.close()
+    assert pending == [("tag_long:8",)]
+
+def test_new_story_empties_the_queue(temp_db):
+    _insert("tag_recent", key="tag_recent:1", status="done")
+    clear_story_tables()
+    conn = connect(readonly=True)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM summarize_jobs").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+def _drain():
+    """
+    Run the queue to the end in this thread, the way the worker would.
+    """
+    while True:
+        jobs = _claim(time.time(), 4)
+        if not jobs:
+            return
+        for job in jobs:
+            summarize_jobs._run(job)
+
+def _tags_recent(paragraph_id):
+    conn = connect(readonly=True)
+    try:
+        return conn.execute("SELECT tags_recent FROM story_paragraphs WHERE id = ?", (paragraph_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_regenerated_paragraph_is_tagged_again(story_db, monkeypatch):
+    # long-term memory budget full: tag_recent is due
+    monkeypatch.setattr(summarize_pipeline, "check_long_memories_tc", lambda: True)
+    generate_story_new()
+    paragraph = generate_story_continue()
+    enqueue_summarize()
+    _drain()
+    assert json.loads(_tags_recent(paragraph["id"]))
+
+    # the fake backend is deterministic: make the new text differ from the old one
+    alternatives = story_regenerate.generate_alternatives
+    monkeypatch.setattr(story_regenerate, "generate_alternatives",
+                        lambda *args: [text + " The wind turned." for text in alternatives(*args)])
+    regenerated = story_regenerate.regenerate_last(paragraph["id"])
+    assert regenerated["story"]["content"] != paragraph["content"]
+    assert _tags_recent(paragraph["id"]) is None
+
+    enqueue_summarize()
+    _drain()
+    assert json.loads(_tags_recent(paragraph["id"]))
@@ -0,0 +1,115 @@
+# tests.test_supervisor.py
+
+import time
+
+import pytest
+
+from services import llm_supervisor
+from services.llm_cancel import CancelToken, Cancelled
+from services.llm_config import Config
+from services.llm_supervisor import (
+    BackendUnavailable, CircuitBreaker, InferenceError, InferenceTimeout, supervised, supervised_stream,
+)
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(Config, "BREAKER_FAILURES", 3)
+    monkeypatch.setattr(Config, "BREAKER_COOLDOWN", 0.05)
+    monkeypatch.setattr(Config, "LLM_RETRIES", 2)
+    monkeypatch.setattr(Config, "LLM_RETRY_BACKOFF", 0.0)
+    fresh = CircuitBreaker()
+    monkeypatch.setattr(llm_supervisor, "BREAKER", fresh)
+    return fresh
+
+def _failing(n, result="ok"):
+    """
+    A call that raises n times, then returns result. calls: the attempt tokens it got.
+    """
+    calls = []
+    def call(token):
+        calls.append(token)
+        if len(calls) <= n:
+            raise RuntimeError(f"failure {len(calls)}")
+        return result
+    return call, calls
+
+def test_breaker_opens_after_failures_in_a_row(breaker):
+    for _ in range(Config.BREAKER_FAILURES - 1):
+        breaker.failure()
+    breaker.check("test")
+    breaker.failure()
+    assert breaker.status() == {"open": True, "failures": Config.BREAKER_FAILURES}
+    with pytest.raises(BackendUnavailable) as raised:
+        breaker.check("test")
+    assert raised.value.retry_after >= 1.0
+
+def test_half_open_lets_one_trial_through(breaker):
+    for _ in range(Config.BREAKER_FAILURES):
+        breaker.failure()
+    time.sleep(Config.BREAKER_COOLDOWN)
+    # looking doesn't take the trial
+    breaker.check("look", claim=False)
+    breaker.check("trial")
+    with pytest.raises(BackendUnavailable):
+        breaker.check("second")
+    # a failed trial opens it again, a successful one closes it
+    breaker.failure()
+    with pytest.raises(BackendUnavailable):
+        breaker.check("after failed trial")
+    time.sleep(Config.BREAKER_COOLDOWN)
+    breaker.check("trial")
+    breaker.success()
+    assert breaker.status() == {"open": False, "failures": 0}
+
+def test_retries_until_success(breaker):
+    call, calls = _failing(Config.LLM_RETRIES)
+    assert supervised("test", {}, call) == "ok"
+    assert len(calls) == Config.LLM_RETRIES + 1
+    assert breaker.status()["failures"] == 0
+
+def test_gives_up_after_the_retries(breaker):
+    call, calls = _failing(Config.LLM_RETRIES + 1)
+    with pytest.raises(InferenceError, match="failure 3"):
+        supervised("test", {}, call)
+    assert len(calls) == Config.LLM_RETRIES + 1
+    # one call that failed for good is one breaker failure
+    assert breaker.status()["failures"] == 1
+
+def test_open_breaker_fails_fast(breaker):
+    for _ in range(Config.BREAKER_FAILURES):
+        breaker.failure()
+    call, calls = _failing(0)
+    with pytest.raises(BackendUnavailable):
+        supervised("test", {}, call)
+    assert calls == []
+
+def test_timeout(breaker, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_RETRIES", 0)
+    def slow(token):
+        token.sleep(5)
+    with pytest.raises(InferenceTimeout):
+        supervised("test", {"timeout": 0.05}, slow)
+
+def test_caller_cancel_passes_through(breaker):
+    cancel = CancelToken("test")
+    def call(token):
+        cancel.cancel()
+        token.check()
+    with pytest.raises(Cancelled):
+        supervised("test", {}, call, cancel)
+    assert breaker.status()["failures"] == 0
+
+def test_stream_is_retried_only_before_the_first_piece(breaker):
+    attempts = []
+    def stream(token):
+        attempts.append(token)
+        if len(attempts) == 1:
+            raise RuntimeError("no connection")
+        yield "one"
+        raise RuntimeError("broken pipe")
+    pieces = []
+    with pytest.raises(InferenceError, match="broken pipe"):
+        for piece in supervised_stream("test", {}, stream):
+            pieces.append(piece)
+    assert pieces == ["one"]
+    assert len(attempts) == 2